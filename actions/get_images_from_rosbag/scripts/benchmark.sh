@@ -0,0 +1,12 @@
+#!/usr/bin/env bash
+
+set -euo pipefail
+
+SCRIPTS_ROOT=$( cd -- "$( dirname -- "${BASH_SOURCE[0]}" )" &> /dev/null && pwd)
+PACKAGE_ROOT=$(dirname "${SCRIPTS_ROOT}")
+
+# Usage: ./scripts/benchmark.sh [benchmark options]
+docker run --rm -it \
+    --entrypoint python3 \
+    get_images_from_rosbag:latest \
+    -m get_images_from_rosbag.benchmark "$@"
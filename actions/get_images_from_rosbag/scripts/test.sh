@@ -117,6 +117,47 @@ main() {
     run_docker_test "-e ROBOTO_PARAM_SAVE_VIDEO=True"
     file_exists_or_error $ACTUAL_OUTPUT_DIR/tiny/dvs_image_raw/video.mp4
 
+    # Test 7
+    echo "Running Test 7: Verify time-based sampling"
+    clean_actual_output
+    run_docker_test "-e ROBOTO_PARAM_SAMPLE_HZ=10"
+    file_exists_or_error $ACTUAL_OUTPUT_DIR/tiny/dvs_image_raw/dvs_image_raw_000000.jpg
+    check_file_does_not_exist $ACTUAL_OUTPUT_DIR/tiny/dvs_image_raw/dvs_image_raw_000001.jpg
+    clean_actual_output
+    run_docker_test "-e ROBOTO_PARAM_KEYFRAME_INTERVAL=10"
+    file_exists_or_error $ACTUAL_OUTPUT_DIR/tiny/dvs_image_raw/dvs_image_raw_000000.jpg
+    check_file_does_not_exist $ACTUAL_OUTPUT_DIR/tiny/dvs_image_raw/dvs_image_raw_000002.jpg
+
+    # Test 8
+    echo "Running Test 8: Verify extraction with worker processes"
+    clean_actual_output
+    run_docker_test "-e ROBOTO_PARAM_WORKERS=2"
+    file_exists_or_error $ACTUAL_OUTPUT_DIR/tiny/dvs1_image_raw/dvs1_image_raw_000002.jpg
+
+    # Test 9
+    echo "Running Test 9: Verify tar shard output"
+    clean_actual_output
+    run_docker_test "-e ROBOTO_PARAM_OUTPUT_FORMAT=tar"
+    file_exists_or_error $ACTUAL_OUTPUT_DIR/tiny/dvs_image_raw/dvs_image_raw-000000.tar
+    file_exists_or_error $ACTUAL_OUTPUT_DIR/tiny/dvs_image_raw/img_manifest.json
+    check_file_does_not_exist $ACTUAL_OUTPUT_DIR/tiny/dvs_image_raw/dvs_image_raw_000000.jpg
+
+    # Test 10
+    echo "Running Test 10: Verify resumable extraction"
+    clean_actual_output
+    run_docker_test "-e ROBOTO_PARAM_RESUME=True"
+    file_exists_or_error $ACTUAL_OUTPUT_DIR/tiny/extraction_state.json
+    check_file_does_not_exist $ACTUAL_OUTPUT_DIR/tiny/dvs_image_raw/img_manifest.partial.jsonl
+    rm $ACTUAL_OUTPUT_DIR/tiny/dvs_image_raw/dvs_image_raw_000000.jpg
+    run_docker_test "-e ROBOTO_PARAM_RESUME=True"
+    check_file_does_not_exist $ACTUAL_OUTPUT_DIR/tiny/dvs_image_raw/dvs_image_raw_000000.jpg
+
+    # Test 11
+    echo "Running Test 11: Verify near-duplicate suppression"
+    clean_actual_output
+    run_docker_test "-e ROBOTO_PARAM_DEDUP_THRESHOLD=255"
+    file_exists_or_error $ACTUAL_OUTPUT_DIR/tiny/dvs_image_raw/dvs_image_raw_000000.jpg
+    check_file_does_not_exist $ACTUAL_OUTPUT_DIR/tiny/dvs_image_raw/dvs_image_raw_000001.jpg
 
 }
 
@@ -1,13 +1,19 @@
 import argparse
+import multiprocessing
 import os
 import pathlib
+import traceback
 
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from typing import Optional, List, Tuple
 from roboto.domain import actions
 from roboto.env import RobotoEnvKey
 from robologs_ros_utils.sources.ros1 import argument_parsers, ros_utils
 from robologs_ros_utils.utils import file_utils
 
+from . import image_extraction
+from .cpu_limits import get_cpu_count
+
 
 def main(
     input_file_or_folder: str,
@@ -22,6 +28,14 @@ def main(
     end_time: Optional[float] = None,
     save_video: Optional[bool] = False,
     keep_images: Optional[bool] = False,
+    workers: Optional[int] = None,
+    sample_hz: Optional[float] = None,
+    keyframe_interval: Optional[float] = None,
+    encode_threads: Optional[int] = None,
+    output_format: str = "files",
+    shard_size: float = 0,
+    resume: bool = False,
+    dedup_threshold: Optional[float] = None,
 ) -> None:
     """
     Extract images from a Rosbag1 format.
@@ -39,7 +53,20 @@ def main(
         end_time (float, optional): End time for extraction or None for the end.
         save_video (bool, optional): Set true to save videos.
         keep_images (bool, optional): Set true to keep images when using --save_video.
+        workers (int, optional): Number of rosbags processed in parallel. If None, one per allotted CPU.
+        sample_hz (float, optional): Maximum number of images per second and topic or None for no limit.
+        keyframe_interval (float, optional): Extract the image closest to every multiple of this many seconds.
+        encode_threads (int, optional): Number of image encoding threads per rosbag. If None, the allotted
+            CPUs are split between the rosbags processed in parallel.
+        output_format (str, optional): 'files' for one file per image or 'tar' for tar shards. Default is 'files'.
+        shard_size (float, optional): Maximum tar shard size in MB, 0 for one shard per topic.
+        resume (bool, optional): Set true to continue interrupted extractions and skip rosbags that
+            were already extracted with the same settings.
+        dedup_threshold (float, optional): Minimum average difference in gray levels to the last kept
+            image of a topic, to drop near-duplicate images, or None to keep all images.
     """
+    if save_video and output_format != "files":
+        raise ValueError("Videos can only be created with output format 'files'.")
 
     topics_list = topics.split(",") if topics else None
     resize_dims = (
@@ -51,43 +78,94 @@ def main(
         rosbag_files = file_utils.get_all_files_of_type_in_directory(
             input_folder=input_file_or_folder, file_format="bag"
         )
-        for rosbag_path in rosbag_files:
-            process_and_maybe_save_video(
-                rosbag_path,
-                output_folder,
-                file_format,
-                manifest,
-                topics_list,
-                naming,
-                resize_dims,
-                sample_rate,
-                start_time,
-                end_time,
-                save_video,
-                keep_images,
-            )
 
     elif os.path.isfile(input_file_or_folder):
-        process_and_maybe_save_video(
-            input_file_or_folder,
-            output_folder,
-            file_format,
-            manifest,
-            topics_list,
-            naming,
-            resize_dims,
-            sample_rate,
-            start_time,
-            end_time,
-            save_video,
-            keep_images,
-        )
+        rosbag_files = [input_file_or_folder]
 
     else:
         raise ValueError(
             f"'{input_file_or_folder}' is neither a valid file nor a directory."
         )
 
+    cpu_count = get_cpu_count()
+    workers = min(workers or cpu_count, max(1, len(rosbag_files)))
+    if not encode_threads:
+        encode_threads = max(1, cpu_count // workers)
+
+    process_rosbags(
+        rosbag_files,
+        workers,
+        output_folder,
+        file_format,
+        manifest,
+        topics_list,
+        naming,
+        resize_dims,
+        sample_rate,
+        start_time,
+        end_time,
+        save_video,
+        keep_images,
+        sample_hz,
+        keyframe_interval,
+        encode_threads,
+        output_format,
+        int(shard_size * 1e6),
+        resume,
+        dedup_threshold,
+    )
+
+
+def process_rosbags(rosbag_files: List[str], workers: int, *args) -> None:
+    """
+    Run process_and_maybe_save_video for every rosbag, with up to workers rosbags in parallel.
+
+    A failing rosbag does not stop the others. Failures are reported together
+    once all rosbags have been processed.
+
+    Args:
+        rosbag_files (List[str]): Paths of the rosbags.
+        workers (int): Maximum number of worker processes.
+        *args: Remaining arguments of process_and_maybe_save_video.
+
+    Raises:
+        RuntimeError: If any rosbag could not be processed.
+    """
+    failures = {}
+    workers = min(workers, len(rosbag_files))
+
+    if workers <= 1:
+        for rosbag_path in rosbag_files:
+            try:
+                process_and_maybe_save_video(rosbag_path, *args)
+            except Exception:
+                failures[rosbag_path] = traceback.format_exc()
+                print(f"Failed to process {rosbag_path}:\n{failures[rosbag_path]}")
+
+    else:
+        print(f"Processing {len(rosbag_files)} rosbags with {workers} workers")
+        # fork, so that workers do not re-run the argument parsing of this module
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("fork")
+        ) as executor:
+            futures = {
+                executor.submit(process_and_maybe_save_video, rosbag_path, *args): rosbag_path
+                for rosbag_path in rosbag_files
+            }
+            for future in as_completed(futures):
+                rosbag_path = futures[future]
+                try:
+                    future.result()
+                except Exception:
+                    failures[rosbag_path] = traceback.format_exc()
+                    print(f"Failed to process {rosbag_path}:\n{failures[rosbag_path]}")
+
+    if failures:
+        raise RuntimeError(
+            f"Failed to process {len(failures)} of {len(rosbag_files)} rosbags: "
+            + ", ".join(sorted(failures))
+        )
+
 
 def process_and_maybe_save_video(
     rosbag_path: str,
@@ -102,6 +180,13 @@ def process_and_maybe_save_video(
     end_time: Optional[float],
     save_video: Optional[bool],
     keep_images: Optional[bool],
+    sample_hz: Optional[float] = None,
+    keyframe_interval: Optional[float] = None,
+    encode_threads: int = 1,
+    output_format: str = "files",
+    shard_size: int = 0,
+    resume: bool = False,
+    dedup_threshold: Optional[float] = None,
 ) -> None:
     folder_list = process_rosbag(
         rosbag_path,
@@ -114,6 +199,13 @@ def process_and_maybe_save_video(
         sample,
         start_time,
         end_time,
+        sample_hz,
+        keyframe_interval,
+        encode_threads,
+        output_format,
+        shard_size,
+        resume,
+        dedup_threshold,
     )
 
     if save_video:
@@ -132,6 +224,13 @@ def process_rosbag(
     sample: Optional[int],
     start_time: Optional[float],
     end_time: Optional[float],
+    sample_hz: Optional[float] = None,
+    keyframe_interval: Optional[float] = None,
+    encode_threads: int = 1,
+    output_format: str = "files",
+    shard_size: int = 0,
+    resume: bool = False,
+    dedup_threshold: Optional[float] = None,
 ) -> List[str]:
     """
     Process a single rosbag and extract images.
@@ -147,6 +246,13 @@ def process_rosbag(
         sample (int, optional): Sampling rate for images.
         start_time (float, optional): Start time for extraction.
         end_time (float, optional): End time for extraction.
+        sample_hz (float, optional): Maximum number of images per second and topic.
+        keyframe_interval (float, optional): Interval in seconds between extracted keyframes.
+        encode_threads (int): Number of image encoding threads.
+        output_format (str): 'files' or 'tar'.
+        shard_size (int): Maximum tar shard size in bytes, 0 for one shard per topic.
+        resume (bool): Whether to continue an interrupted extraction of the rosbag.
+        dedup_threshold (float, optional): Minimum difference to the last kept image, to drop near-duplicates.
 
     Returns:
         List[str]: List of folders with extracted images.
@@ -156,7 +262,7 @@ def process_rosbag(
     os.makedirs(bag_output_folder, exist_ok=True)
     os.chmod(bag_output_folder, 0o777)
 
-    return ros_utils.get_images_from_bag(
+    return image_extraction.get_images_from_bag(
         rosbag_path=rosbag_path,
         output_folder=bag_output_folder,
         file_format=file_format,
@@ -167,6 +273,13 @@ def process_rosbag(
         sample=sample,
         start_time=start_time,
         end_time=end_time,
+        sample_hz=sample_hz,
+        keyframe_interval=keyframe_interval,
+        encode_threads=encode_threads,
+        output_format=output_format,
+        shard_size=shard_size,
+        resume=resume,
+        dedup_threshold=dedup_threshold,
     )
 
 
@@ -199,6 +312,23 @@ parser.add_argument(
     default=os.environ.get("ROBOTO_PARAM_FORMAT", "jpg"),
 )
 
+parser.add_argument(
+    "--output_format",
+    type=str,
+    required=False,
+    help="Write one file per image or tar shards of images per topic",
+    choices=["files", "tar"],
+    default=os.environ.get("ROBOTO_PARAM_OUTPUT_FORMAT", "files"),
+)
+
+parser.add_argument(
+    "--shard_size",
+    type=float,
+    required=False,
+    help="Maximum tar shard size in MB or 0 for one shard per topic",
+    default=os.environ.get("ROBOTO_PARAM_SHARD_SIZE", 1000),
+)
+
 parser.add_argument(
     "--manifest",
     action="store_true",
@@ -240,6 +370,39 @@ parser.add_argument(
     default=os.environ.get("ROBOTO_PARAM_SAMPLE"),
 )
 
+parser.add_argument(
+    "--encode_threads",
+    type=int,
+    required=False,
+    help="Number of image encoding threads per rosbag or None to split the allotted CPUs between rosbags",
+    default=os.environ.get("ROBOTO_PARAM_ENCODE_THREADS"),
+)
+
+parser.add_argument(
+    "--sample_hz",
+    type=float,
+    required=False,
+    help="Maximum number of images per second and topic or None for no limit",
+    default=os.environ.get("ROBOTO_PARAM_SAMPLE_HZ"),
+)
+
+parser.add_argument(
+    "--keyframe_interval",
+    type=float,
+    required=False,
+    help="Extract the image closest to every multiple of this many seconds or None for all images",
+    default=os.environ.get("ROBOTO_PARAM_KEYFRAME_INTERVAL"),
+)
+
+parser.add_argument(
+    "--dedup_threshold",
+    type=float,
+    required=False,
+    help="Drop images that differ from the last kept image of their topic by less than this many "
+    "gray levels on average, or None to keep all images",
+    default=os.environ.get("ROBOTO_PARAM_DEDUP_THRESHOLD"),
+)
+
 parser.add_argument(
     "--start_time",
     type=float,
@@ -272,6 +435,22 @@ parser.add_argument(
     default=(os.environ.get("ROBOTO_PARAM_KEEP_IMAGES") == "True"),
 )
 
+parser.add_argument(
+    "--resume",
+    action="store_true",
+    required=False,
+    help="Continue interrupted extractions and skip rosbags already extracted with the same settings",
+    default=(os.environ.get("ROBOTO_PARAM_RESUME") == "True"),
+)
+
+parser.add_argument(
+    "--workers",
+    type=int,
+    required=False,
+    help="Number of rosbags processed in parallel or None for one per allotted CPU",
+    default=os.environ.get("ROBOTO_PARAM_WORKERS"),
+)
+
 args = parser.parse_args()
 
 if args.save_video:
@@ -290,4 +469,12 @@ main(
     end_time=args.end_time,
     save_video=args.save_video,
     keep_images=args.keep_images,
+    workers=args.workers,
+    sample_hz=args.sample_hz,
+    keyframe_interval=args.keyframe_interval,
+    encode_threads=args.encode_threads,
+    output_format=args.output_format,
+    shard_size=args.shard_size,
+    resume=args.resume,
+    dedup_threshold=args.dedup_threshold,
 )
@@ -0,0 +1,116 @@
+"""
+Benchmarks decoding of sensor_msgs/Image messages on synthetic frames.
+
+Compares the deserialize and PIL path of ros_utils.get_images_from_bag with
+the zero-copy decoding of image_extraction, per encoding and resolution:
+
+    ./scripts/benchmark.sh --encodings mono8,bgr8 --resolutions 1920x1080 --padding 64
+"""
+
+import argparse
+import struct
+import time
+import tracemalloc
+
+import numpy as np
+from rosbags.serde import deserialize_cdr, ros1_to_cdr
+
+from . import image_extraction
+
+
+def serialize_image(width, height, encoding, padding=0, seed=0):
+    """ROS1 serialized sensor_msgs/Image with random pixels and padding bytes at the end of each row."""
+    dtype, channels = image_extraction.RAW_ENCODINGS[encoding]
+    step = width * channels * np.dtype(dtype).itemsize + padding
+    data = np.random.default_rng(seed).integers(0, 256, height * step, dtype=np.uint8).tobytes()
+    frame_id = b"camera"
+    encoding_bytes = encoding.encode()
+    return b"".join(
+        [
+            struct.pack("<IIII", 0, 1, 2, len(frame_id)),
+            frame_id,
+            struct.pack("<III", height, width, len(encoding_bytes)),
+            encoding_bytes,
+            struct.pack("<BII", 0, step, len(data)),
+            data,
+        ]
+    )
+
+
+def decode_deserialized(rawdata):
+    msg = deserialize_cdr(ros1_to_cdr(rawdata, image_extraction.IMAGE_TYPE), image_extraction.IMAGE_TYPE)
+    return image_extraction.decode_image(msg)
+
+
+def decode_zero_copy(rawdata):
+    return image_extraction.image_to_array(image_extraction.parse_image(rawdata))
+
+
+def time_decode(decode, rawdata, repeat):
+    """
+    Returns:
+        Tuple of the mean time in milliseconds and the peak of allocated memory in MB per decoded frame.
+    """
+    decode(rawdata)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        decode(rawdata)
+    elapsed = (time.perf_counter() - start) * 1000 / repeat
+
+    tracemalloc.start()
+    decode(rawdata)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 1e6
+
+
+def benchmark_decode(encodings, resolutions, padding, repeat):
+    print(
+        f"{'encoding':<14}{'resolution':>12}{'current ms':>12}{'current MB':>12}"
+        f"{'zero-copy ms':>14}{'zero-copy MB':>14}{'speedup':>9}"
+    )
+    for encoding in encodings:
+        for width, height in resolutions:
+            rawdata = serialize_image(width, height, encoding, padding)
+            new_ms, new_mb = time_decode(decode_zero_copy, rawdata, repeat)
+            # the current path only reads the encodings PIL can, and only without row padding
+            if encoding in image_extraction.IMAGE_ENCODINGS and not padding:
+                old_ms, old_mb = time_decode(decode_deserialized, rawdata, repeat)
+                old = f"{old_ms:>12.3f}{old_mb:>12.2f}"
+                speedup = f"{old_ms / new_ms:>8.1f}x"
+            else:
+                old = f"{'n/a':>12}{'n/a':>12}"
+                speedup = f"{'n/a':>9}"
+            print(f"{encoding:<14}{f'{width}x{height}':>12}{old}{new_ms:>14.3f}{new_mb:>14.2f}{speedup}")
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--encodings",
+    type=str,
+    default="mono8,rgb8,bgr8,bgra8,mono16,bayer_rggb8",
+    help="Comma-separated image encodings to benchmark",
+)
+parser.add_argument(
+    "--resolutions",
+    type=str,
+    default="640x480,1280x720,1920x1080",
+    help="Comma-separated resolutions as WIDTHxHEIGHT",
+)
+parser.add_argument(
+    "--padding",
+    type=int,
+    default=0,
+    help="Bytes of padding at the end of each row",
+)
+parser.add_argument("--repeat", type=int, default=50, help="Decodes per encoding and resolution")
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    benchmark_decode(
+        args.encodings.split(","),
+        [tuple(int(y) for y in x.split("x")) for x in args.resolutions.split(",")],
+        args.padding,
+        args.repeat,
+    )
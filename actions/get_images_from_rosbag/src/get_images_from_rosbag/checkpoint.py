@@ -0,0 +1,226 @@
+"""
+Checkpoints to resume an interrupted image extraction.
+
+Every written image, and every image dropped as a near-duplicate, is
+appended to img_manifest.partial.jsonl next to the manifest of its topic.
+When the extraction of a rosbag is restarted with the same settings, images
+that are still on disk as recorded are kept and only the remaining messages
+are read. Once all topics are done, extraction_state.json in the output
+folder of the rosbag marks it complete, together with the size,
+modification time and hash of the rosbag, and later runs skip the rosbag
+while these are unchanged.
+"""
+
+import hashlib
+import json
+import os
+
+from collections import defaultdict
+from typing import Dict, List, Optional, TextIO, Tuple
+
+from .image_shards import TAR_BLOCK_SIZE, finish_truncated_shard, get_shard_name
+
+STATE_NAME = "extraction_state.json"
+CHECKPOINT_NAME = "img_manifest.partial.jsonl"
+
+# bytes hashed at the start and the end of a rosbag
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def get_rosbag_fingerprint(rosbag_path: str) -> dict:
+    """
+    Get the size, modification time and hash of a rosbag.
+
+    The hash covers the first and last MB of the file, which hold the bag
+    header and the connection and chunk info records locating every chunk,
+    instead of reading the whole rosbag.
+
+    Args:
+        rosbag_path (str): Path to the rosbag.
+
+    Returns:
+        dict: Fingerprint of the rosbag.
+    """
+    stat = os.stat(rosbag_path)
+    sha256 = hashlib.sha256()
+    with open(rosbag_path, "rb") as f:
+        sha256.update(f.read(HASH_BLOCK_SIZE))
+        f.seek(max(0, stat.st_size - HASH_BLOCK_SIZE))
+        sha256.update(f.read(HASH_BLOCK_SIZE))
+    return {"size": stat.st_size, "mtime": stat.st_mtime_ns, "sha256": sha256.hexdigest()}
+
+
+def read_checkpoint(topic_folder: str) -> List[dict]:
+    """Read the checkpointed images of a topic, ignoring a last line cut off by an interruption."""
+    lines = []
+    try:
+        with open(os.path.join(topic_folder, CHECKPOINT_NAME)) as f:
+            for line in f:
+                try:
+                    lines.append(json.loads(line))
+                except ValueError:
+                    break
+    except FileNotFoundError:
+        pass
+    return lines
+
+
+def verify_files(lines: List[dict]) -> List[dict]:
+    """Keep the checkpointed images whose file still has the recorded size."""
+    return [
+        x for x in lines if os.path.isfile(x["entry"]["path"]) and os.path.getsize(x["entry"]["path"]) == x["size"]
+    ]
+
+
+def verify_shards(topic_folder: str, prefix: str, lines: List[dict]) -> Tuple[List[dict], int]:
+    """
+    Keep the checkpointed images that were written to their tar shard completely.
+
+    Each shard is cut after its last complete image and closed, and shards
+    without a complete image are removed, so that all shards stay valid tar
+    files and new images go to new shards.
+
+    Returns:
+        Tuple[List[dict], int]: Kept images and the index of the next shard.
+    """
+    kept = []
+    shard_ends: Dict[str, int] = defaultdict(int)
+    for line in lines:
+        entry = line["entry"]
+        shard_path = os.path.join(topic_folder, entry["shard"])
+        end = entry["offset"] + -(-entry["size"] // TAR_BLOCK_SIZE) * TAR_BLOCK_SIZE
+        if os.path.isfile(shard_path) and os.path.getsize(shard_path) >= entry["offset"] + entry["size"]:
+            kept.append(line)
+            shard_ends[entry["shard"]] = max(shard_ends[entry["shard"]], end)
+
+    shard_index = 0
+    while os.path.isfile(os.path.join(topic_folder, get_shard_name(prefix, shard_index))):
+        shard_name = get_shard_name(prefix, shard_index)
+        if shard_name in shard_ends:
+            finish_truncated_shard(os.path.join(topic_folder, shard_name), shard_ends[shard_name])
+        else:
+            os.remove(os.path.join(topic_folder, shard_name))
+        shard_index += 1
+
+    next_index = 0
+    while get_shard_name(prefix, next_index) in shard_ends:
+        next_index += 1
+    return kept, next_index
+
+
+class ExtractionCheckpoint:
+    """
+    Checkpoint of the extraction of one rosbag into output_folder.
+
+    Usage:
+        checkpoint = ExtractionCheckpoint(output_folder, rosbag_path, settings)
+        if checkpoint.complete:
+            return checkpoint.get_folders()
+        lines, next_shard_index = checkpoint.load(topic_folder, output_format, prefix)
+        checkpoint.record(topic_folder, image_name, entry, size)
+        checkpoint.record_duplicate(topic_folder, duplicate)
+        checkpoint.finish(folders)
+    """
+
+    def __init__(self, output_folder: str, rosbag_path: str, settings: dict):
+        self.output_folder = output_folder
+        self.state_path = os.path.join(output_folder, STATE_NAME)
+        self.state = {
+            "rosbag": get_rosbag_fingerprint(rosbag_path),
+            "settings": settings,
+            "complete": False,
+            "folders": [],
+        }
+        self.files: Dict[str, TextIO] = dict()
+
+        previous: Optional[dict] = None
+        try:
+            with open(self.state_path) as f:
+                previous = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+        # checkpoints of another rosbag or other settings are started over
+        self.matches = (
+            previous is not None
+            and previous.get("rosbag") == self.state["rosbag"]
+            and previous.get("settings") == settings
+        )
+        self.complete = self.matches and previous.get("complete", False)
+        if self.complete:
+            self.state = previous
+
+    def get_folders(self) -> List[str]:
+        return [os.path.join(self.output_folder, x) for x in self.state["folders"]]
+
+    def start(self) -> None:
+        """Mark the extraction as running, before any image is written."""
+        self.save()
+
+    def load(self, topic_folder: str, output_format: str, prefix: str) -> Tuple[List[dict], int]:
+        """
+        Get the images of a topic written by an earlier run that are still intact.
+
+        Args:
+            topic_folder (str): Folder of the topic.
+            output_format (str): 'files' or 'tar'.
+            prefix (str): Name prefix of the tar shards.
+
+        Returns:
+            Tuple[List[dict], int]: Checkpointed images, with their "image_name" and manifest "entry",
+                followed by the dropped near-duplicates, with their "duplicate" entry, and the index
+                of the next tar shard.
+        """
+        if not self.matches:
+            return [], 0
+
+        lines = read_checkpoint(topic_folder)
+        duplicates = [x for x in lines if "duplicate" in x]
+        lines = [x for x in lines if "duplicate" not in x]
+        if output_format == "tar":
+            lines, next_shard_index = verify_shards(topic_folder, prefix, lines)
+        else:
+            lines, next_shard_index = verify_files(lines), 0
+        lines += duplicates
+
+        # rewrite the checkpoint without images that are gone
+        if os.path.isdir(topic_folder):
+            with open(os.path.join(topic_folder, CHECKPOINT_NAME), "w") as f:
+                f.writelines(json.dumps(x) + "\n" for x in lines)
+        return lines, next_shard_index
+
+    def record(self, topic_folder: str, image_name: str, entry: dict, size: int) -> None:
+        """Checkpoint a written image."""
+        self.write(topic_folder, {"image_name": image_name, "entry": entry, "size": size})
+
+    def record_duplicate(self, topic_folder: str, duplicate: dict) -> None:
+        """Checkpoint an image dropped as a near-duplicate, with its "duplicates" manifest entry."""
+        self.write(topic_folder, {"duplicate": duplicate})
+
+    def write(self, topic_folder: str, line: dict) -> None:
+        if topic_folder not in self.files:
+            mode = "a" if self.matches else "w"
+            self.files[topic_folder] = open(os.path.join(topic_folder, CHECKPOINT_NAME), mode)
+        f = self.files[topic_folder]
+        f.write(json.dumps(line) + "\n")
+        f.flush()
+
+    def close(self) -> None:
+        for f in self.files.values():
+            f.close()
+        self.files = dict()
+
+    def finish(self, folders: List[str]) -> None:
+        """Mark the rosbag as complete and remove the checkpoints of its topics."""
+        self.close()
+        for folder in os.listdir(self.output_folder):
+            checkpoint_path = os.path.join(self.output_folder, folder, CHECKPOINT_NAME)
+            if os.path.isfile(checkpoint_path):
+                os.remove(checkpoint_path)
+        self.state["complete"] = True
+        self.state["folders"] = [os.path.relpath(x, self.output_folder) for x in folders]
+        self.save()
+
+    def save(self) -> None:
+        with open(self.state_path, "w") as f:
+            json.dump(self.state, f, indent=4)
@@ -0,0 +1,39 @@
+"""
+CPUs allotted to the Action, also used by run_yolov8_rosbag to size its workers.
+"""
+
+import os
+
+
+def get_cpu_count() -> int:
+    """
+    Get the number of CPUs allotted to this container.
+
+    Reads the cgroup CPU quota that backs the action's vCPU setting and falls
+    back to the CPUs this process may run on.
+
+    Returns:
+        int: Number of CPUs, at least 1.
+    """
+    quota_files = [
+        # cgroup v2: "<quota> <period>" or "max <period>"
+        ("/sys/fs/cgroup/cpu.max", None),
+        # cgroup v1: quota is -1 without a limit
+        ("/sys/fs/cgroup/cpu/cpu.cfs_quota_us", "/sys/fs/cgroup/cpu/cpu.cfs_period_us"),
+    ]
+    for quota_file, period_file in quota_files:
+        try:
+            with open(quota_file) as f:
+                values = f.read().split()
+            if period_file:
+                with open(period_file) as f:
+                    values.append(f.read().strip())
+            quota, period = values[0], values[1]
+            if quota not in ("max", "-1"):
+                return max(1, int(quota) // int(period))
+        except (OSError, ValueError, IndexError):
+            continue
+
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
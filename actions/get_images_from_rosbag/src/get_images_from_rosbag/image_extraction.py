@@ -0,0 +1,845 @@
+"""
+Image extraction from Rosbag1 files.
+
+Follows ros_utils.get_images_from_bag, including its naming schemes and
+manifest layout, but writes sensor_msgs/CompressedImage payloads that are
+already in the requested file format straight to disk instead of decoding
+and re-encoding them.
+
+The messages to extract are chosen from the timestamps in the bag index, and
+only their records are read, so sampled-out messages cost no I/O. Frames are
+decoded while reading and resized, encoded and written by a pool of threads,
+as cv2 releases the GIL while doing so.
+"""
+
+import bisect
+import collections
+import heapq
+import io
+import logging
+import os
+import struct
+
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+from rosbags.rosbag1 import Reader
+from rosbags.serde import deserialize_cdr, ros1_to_cdr
+from tqdm import tqdm
+
+from robologs_ros_utils.sources.ros1 import ros_img_tools, ros_utils
+from robologs_ros_utils.utils import file_utils, img_utils
+
+from .checkpoint import ExtractionCheckpoint
+from .image_shards import TarShardWriter
+
+COMPRESSED_IMAGE_TYPE = "sensor_msgs/msg/CompressedImage"
+IMAGE_TYPE = "sensor_msgs/msg/Image"
+
+# leading bytes of the payloads that can be written without decoding them
+FILE_SIGNATURES = {
+    "jpg": b"\xff\xd8\xff",
+    "png": b"\x89PNG\r\n\x1a\n",
+}
+
+IMAGE_ENCODINGS = {
+    "rgb8": "RGB",
+    "rgba8": "RGBA",
+    "mono8": "L",
+    "8UC3": "RGB",
+    "bgra8": "RGBA",
+    "bgr8": "RGB",
+}
+
+# dtype and number of channels of the raw encodings that are decoded without deserializing the message
+RAW_ENCODINGS = {
+    "rgb8": (np.uint8, 3),
+    "bgr8": (np.uint8, 3),
+    "8UC3": (np.uint8, 3),
+    "rgba8": (np.uint8, 4),
+    "bgra8": (np.uint8, 4),
+    "mono8": (np.uint8, 1),
+    "8UC1": (np.uint8, 1),
+    "mono16": (np.uint16, 1),
+    "16UC1": (np.uint16, 1),
+    "bayer_rggb8": (np.uint8, 1),
+    "bayer_bggr8": (np.uint8, 1),
+    "bayer_gbrg8": (np.uint8, 1),
+    "bayer_grbg8": (np.uint8, 1),
+    "bayer_rggb16": (np.uint16, 1),
+    "bayer_bggr16": (np.uint16, 1),
+    "bayer_gbrg16": (np.uint16, 1),
+    "bayer_grbg16": (np.uint16, 1),
+}
+
+# OpenCV names Bayer patterns after the second row, same conversions as cv_bridge
+BAYER_CONVERSIONS = {
+    "bayer_rggb": cv2.COLOR_BayerBG2BGR,
+    "bayer_bggr": cv2.COLOR_BayerRG2BGR,
+    "bayer_gbrg": cv2.COLOR_BayerGR2BGR,
+    "bayer_grbg": cv2.COLOR_BayerGB2BGR,
+}
+
+# side length of the grayscale thumbnails compared to find near-duplicate frames
+THUMBNAIL_SIZE = 32
+
+UINT32 = struct.Struct("<I")
+
+OP_MSG_DATA = 2
+OP_CONNECTION = 7
+
+
+class RawImage(NamedTuple):
+    """Fields of a sensor_msgs/Image message, with data still pointing into the serialized message."""
+
+    sec: int
+    nanosec: int
+    height: int
+    width: int
+    encoding: str
+    is_bigendian: int
+    step: int
+    data: memoryview
+
+
+def read_string(view: memoryview, pos: int) -> Tuple[str, int]:
+    """Read a ROS1 serialized string, returning it and the position after it."""
+    (length,) = UINT32.unpack_from(view, pos)
+    pos += 4
+    return bytes(view[pos : pos + length]).decode(), pos + length
+
+
+def parse_image(rawdata: bytes) -> RawImage:
+    """
+    Read a ROS1 serialized sensor_msgs/Image without copying its pixel data.
+
+    Args:
+        rawdata (bytes): Serialized message as stored in the rosbag.
+
+    Returns:
+        RawImage: Message fields.
+    """
+    view = memoryview(rawdata)
+    _, sec, nanosec = struct.unpack_from("<III", view, 0)
+    _, pos = read_string(view, 12)
+    height, width = struct.unpack_from("<II", view, pos)
+    encoding, pos = read_string(view, pos + 8)
+    is_bigendian, step, data_len = struct.unpack_from("<BII", view, pos)
+    pos += 9
+    return RawImage(sec, nanosec, height, width, encoding, is_bigendian, step, view[pos : pos + data_len])
+
+
+def image_to_array(image: RawImage) -> np.ndarray:
+    """
+    Get the pixels of a raw image as an array viewing the serialized message.
+
+    Row padding is skipped by striding over it. Only big-endian 16 bit data and
+    encodings that need a color conversion (Bayer patterns, bgra8) are copied.
+    Arrays match those of decode_image for the encodings both support.
+
+    Args:
+        image (RawImage): Image with an encoding from RAW_ENCODINGS.
+
+    Returns:
+        np.ndarray: Image array.
+    """
+    dtype, channels = RAW_ENCODINGS[image.encoding]
+    dtype = np.dtype(dtype).newbyteorder(">" if image.is_bigendian else "<")
+    rows = np.frombuffer(image.data, np.uint8, count=image.height * image.step).reshape(image.height, image.step)
+    cv_image = rows[:, : image.width * channels * dtype.itemsize].view(dtype)
+    cv_image = cv_image.reshape(image.height, image.width, channels)
+    if channels == 1:
+        cv_image = cv_image[:, :, 0]
+    if not dtype.isnative:
+        cv_image = cv_image.astype(dtype.newbyteorder("="))
+
+    if image.encoding.startswith("bayer_"):
+        return cv2.cvtColor(cv_image, BAYER_CONVERSIONS[image.encoding.rstrip("0123456789")])
+    if image.encoding == "bgra8":
+        # as decode_image, which reads the channels as RGBA
+        return cv2.cvtColor(cv_image, cv2.COLOR_BGRA2RGBA)
+    return cv_image
+
+
+def parse_compressed_image(rawdata: bytes) -> Tuple[int, int, str, memoryview]:
+    """
+    Read a ROS1 serialized sensor_msgs/CompressedImage without copying its payload.
+
+    Args:
+        rawdata (bytes): Serialized message as stored in the rosbag.
+
+    Returns:
+        Tuple[int, int, str, memoryview]: Header stamp seconds and nanoseconds, format and payload.
+    """
+    view = memoryview(rawdata)
+    _, sec, nanosec = struct.unpack_from("<III", view, 0)
+    pos = 12
+    (frame_id_len,) = UINT32.unpack_from(view, pos)
+    pos += 4 + frame_id_len
+    (format_len,) = UINT32.unpack_from(view, pos)
+    pos += 4
+    image_format = bytes(view[pos : pos + format_len]).decode()
+    pos += format_len
+    (data_len,) = UINT32.unpack_from(view, pos)
+    pos += 4
+    return sec, nanosec, image_format, view[pos : pos + data_len]
+
+
+def can_pass_through(image_format: str, data: memoryview, file_format: str, resize) -> bool:
+    """
+    Check whether a compressed payload can be written as it is.
+
+    Args:
+        image_format (str): Format field of the CompressedImage message.
+        data (memoryview): Compressed payload.
+        file_format (str): Requested image format.
+        resize (Tuple[int, int], optional): Requested resolution.
+
+    Returns:
+        bool: True if the payload already is a file of the requested format and no resize is requested.
+    """
+    if resize or "compressedDepth" in image_format:
+        return False
+    signature = FILE_SIGNATURES.get(file_format)
+    return signature is not None and bytes(data[: len(signature)]) == signature
+
+
+def select_index_entries(
+    entries: list,
+    rosbag_start_time: float,
+    start_time: Optional[float] = None,
+    end_time: Optional[float] = None,
+    sample: Optional[int] = None,
+    sample_hz: Optional[float] = None,
+    keyframe_interval: Optional[float] = None,
+) -> List[Tuple[int, object]]:
+    """
+    Choose the messages of one topic to extract, from their index timestamps alone.
+
+    Args:
+        entries (list): Chronologically sorted index entries of the topic.
+        rosbag_start_time (float): Start of the rosbag in seconds.
+        start_time (float, optional): Start time in seconds since the beginning of the rosbag.
+        end_time (float, optional): End time in seconds since the beginning of the rosbag.
+        sample (int, optional): Keep every Nth message, counted from the first message of the topic.
+        sample_hz (float, optional): Keep at most this many messages per second, at most one per 1 / sample_hz slot.
+        keyframe_interval (float, optional): Keep the message closest to every multiple of this
+            many seconds since the start of the extraction.
+
+    Returns:
+        List[Tuple[int, object]]: Index of each chosen message within its topic, and its index entry.
+    """
+    selected = [
+        (index, entry)
+        for index, entry in enumerate(entries)
+        if ros_utils.check_if_in_time_range(entry.time * 1e-9 - rosbag_start_time, start_time, end_time)
+        and not (sample and index % sample != 0)
+    ]
+
+    if sample_hz and selected:
+        # first message of every 1 / sample_hz long slot, which unlike a minimum gap
+        # between messages keeps the rate when timestamps jitter
+        first_time = selected[0][1].time
+        kept = dict()
+        for index, entry in selected:
+            kept.setdefault(int((entry.time - first_time) * sample_hz // 1e9), (index, entry))
+        selected = list(kept.values())
+
+    if keyframe_interval and selected:
+        times = [entry.time for _, entry in selected]
+        interval = int(keyframe_interval * 1e9)
+        anchor = int((rosbag_start_time + (start_time or 0)) * 1e9)
+        kept = []
+        keyframe_time = anchor + max(0, (times[0] - anchor) // interval) * interval
+        while keyframe_time <= times[-1] + interval // 2:
+            pos = bisect.bisect_left(times, keyframe_time)
+            # closest of the messages around the keyframe time
+            if pos == len(times) or (pos > 0 and keyframe_time - times[pos - 1] <= times[pos] - keyframe_time):
+                pos -= 1
+            if not kept or kept[-1] != pos:
+                kept.append(pos)
+            keyframe_time += interval
+        selected = [selected[pos] for pos in kept]
+
+    return selected
+
+
+def select_topic_messages(
+    reader: Reader,
+    topics: List[str],
+    rosbag_start_time: float,
+    start_time: Optional[float] = None,
+    end_time: Optional[float] = None,
+    sample: Optional[int] = None,
+    sample_hz: Optional[float] = None,
+    keyframe_interval: Optional[float] = None,
+) -> Tuple[Dict[str, str], Dict[str, list]]:
+    """
+    Choose the messages of each topic to extract with select_index_entries, merging the connections of a topic.
+
+    Returns:
+        Tuple[Dict[str, str], Dict[str, list]]: Message type and chosen (index, entry) pairs per topic.
+    """
+    msgtypes = dict()
+    selection = dict()
+    for topic in topics:
+        topic_connections = [x for x in reader.connections if x.topic == topic]
+        msgtypes.update({x.topic: x.msgtype for x in topic_connections})
+        selection[topic] = select_index_entries(
+            list(heapq.merge(*(reader.indexes[x.id] for x in topic_connections), key=lambda x: x.time)),
+            rosbag_start_time,
+            start_time,
+            end_time,
+            sample,
+            sample_hz,
+            keyframe_interval,
+        )
+    return msgtypes, selection
+
+
+def parse_record_header(header: bytes) -> Dict[str, bytes]:
+    """Split the name=value fields of a rosbag record header."""
+    fields = {}
+    pos = 0
+    while pos < len(header):
+        (size,) = UINT32.unpack_from(header, pos)
+        pos += 4
+        name, _, value = header[pos : pos + size].partition(b"=")
+        fields[name.decode()] = value
+        pos += size
+    return fields
+
+
+def read_message_data(stream) -> bytes:
+    """
+    Read the serialized message of the message data record at the current position.
+
+    Connection records that precede it, as written by rosbag in front of the
+    first message of a connection, are skipped.
+    """
+    while True:
+        (header_len,) = UINT32.unpack(stream.read(4))
+        op = parse_record_header(stream.read(header_len))["op"][0]
+        (data_len,) = UINT32.unpack(stream.read(4))
+        if op == OP_MSG_DATA:
+            return stream.read(data_len)
+        if op != OP_CONNECTION:
+            raise ValueError(f"Expected a message data record, found op {op}.")
+        stream.seek(data_len, os.SEEK_CUR)
+
+
+def read_selected_messages(reader: Reader, selection: Dict[str, list]) -> Iterator[Tuple[str, int, int, bytes]]:
+    """
+    Read the chosen messages of all topics in timestamp order.
+
+    Records in uncompressed chunks are read on their own, compressed chunks
+    are decompressed once when the first chosen record in them is reached.
+
+    Args:
+        reader (Reader): Open rosbag reader.
+        selection (Dict[str, list]): Chosen (index, entry) pairs per topic.
+
+    Yields:
+        Tuple[str, int, int, bytes]: Topic, index within the topic, rosbag timestamp and serialized message.
+    """
+    uncompressed = dict()
+    current_chunk = (None, None)
+
+    entries = [[(entry.time, index, entry, topic) for index, entry in chosen] for topic, chosen in selection.items()]
+    for t, index, entry, topic in heapq.merge(*entries, key=lambda x: (x[0], x[1])):
+        chunk = reader.chunks[entry.chunk_pos]
+        if entry.chunk_pos not in uncompressed:
+            reader.bio.seek(entry.chunk_pos)
+            (header_len,) = UINT32.unpack(reader.bio.read(4))
+            header = parse_record_header(reader.bio.read(header_len))
+            uncompressed[entry.chunk_pos] = header["compression"] == b"none"
+
+        if uncompressed[entry.chunk_pos]:
+            reader.bio.seek(chunk.datapos + entry.offset)
+            yield topic, index, t, read_message_data(reader.bio)
+            continue
+
+        if current_chunk[0] != entry.chunk_pos:
+            reader.bio.seek(chunk.datapos)
+            current_chunk = (entry.chunk_pos, io.BytesIO(chunk.decompressor(reader.bio.read(chunk.datasize))))
+        current_chunk[1].seek(entry.offset)
+        yield topic, index, t, read_message_data(current_chunk[1])
+
+
+def get_thumbnail(cv_image: np.ndarray) -> np.ndarray:
+    """
+    Get a small grayscale version of an image to compare frames.
+
+    Args:
+        cv_image (np.ndarray): Image array, as passed to write_image.
+
+    Returns:
+        np.ndarray: THUMBNAIL_SIZE x THUMBNAIL_SIZE float32 array, in gray levels of an 8 bit image.
+    """
+    height, width = cv_image.shape[:2]
+    sampled_size = 4 * THUMBNAIL_SIZE
+    if height > sampled_size or width > sampled_size:
+        # averaging over a 4x4 sample of each thumbnail pixel is 20x faster than over all pixels
+        cv_image = cv2.resize(
+            cv_image, (min(width, sampled_size), min(height, sampled_size)), interpolation=cv2.INTER_NEAREST
+        )
+    thumbnail = cv2.resize(cv_image, (THUMBNAIL_SIZE, THUMBNAIL_SIZE), interpolation=cv2.INTER_AREA)
+    if thumbnail.ndim == 3 and thumbnail.shape[2] > 1:
+        thumbnail = cv2.cvtColor(thumbnail, cv2.COLOR_BGR2GRAY if thumbnail.shape[2] == 3 else cv2.COLOR_BGRA2GRAY)
+    thumbnail = thumbnail.reshape(THUMBNAIL_SIZE, THUMBNAIL_SIZE).astype(np.float32)
+    if cv_image.dtype == np.uint16:
+        thumbnail /= 257
+    return thumbnail
+
+
+def get_payload_thumbnail(payload: memoryview) -> np.ndarray:
+    """Get the thumbnail of an encoded image, decoding JPEG images at 1/8 of their resolution."""
+    return get_thumbnail(cv2.imdecode(np.frombuffer(payload, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8))
+
+
+def decode_image(msg) -> np.ndarray:
+    """
+    Convert a deserialized image message into an array that cv2 can write.
+
+    Args:
+        msg: sensor_msgs/Image or sensor_msgs/CompressedImage message.
+
+    Returns:
+        np.ndarray: Image array.
+    """
+    if msg.__msgtype__ == "sensor_msgs/msg/Image":
+        cv_image = np.array(
+            Image.frombytes(IMAGE_ENCODINGS[msg.encoding], (msg.width, msg.height), msg.data)
+        )
+        if msg.encoding == "bgra8":
+            cv_image = cv2.cvtColor(cv_image, cv2.COLOR_BGRA2RGBA)
+        return cv_image
+
+    if "compressedDepth" in msg.format:
+        return ros_img_tools.convert_compressed_depth_to_cv2(msg)
+    return ros_img_tools.convert_image_to_cv2(msg)
+
+
+def decode_message(rawdata: bytes, msgtype: str) -> Tuple[int, int, np.ndarray]:
+    """
+    Decode a serialized image message, viewing the pixels of raw images in place when their encoding allows.
+
+    Args:
+        rawdata (bytes): Serialized message as stored in the rosbag.
+        msgtype (str): sensor_msgs/msg/Image or sensor_msgs/msg/CompressedImage.
+
+    Returns:
+        Tuple[int, int, np.ndarray]: Header stamp seconds and nanoseconds, and the image array,
+            which is read-only if it views rawdata.
+    """
+    if msgtype == IMAGE_TYPE:
+        image = parse_image(rawdata)
+        if image.encoding in RAW_ENCODINGS:
+            return image.sec, image.nanosec, image_to_array(image)
+
+    msg = deserialize_cdr(ros1_to_cdr(rawdata, msgtype), msgtype)
+    return msg.header.stamp.sec, msg.header.stamp.nanosec, decode_image(msg)
+
+
+def prepare_image(cv_image: np.ndarray, file_format: str, resize: Optional[Tuple[int, int]] = None) -> np.ndarray:
+    if resize:
+        cv_image = img_utils.resize_image(img=cv_image, new_width=resize[0], new_height=resize[1])
+    if cv_image.dtype == np.uint16 and file_format != "png":
+        # jpg only holds 8 bit
+        cv_image = (cv_image >> 8).astype(np.uint8)
+    return cv_image
+
+
+def write_image(image_path: str, cv_image: np.ndarray, resize: Optional[Tuple[int, int]] = None) -> None:
+    """
+    Resize, encode and write a decoded image.
+
+    Args:
+        image_path (str): Output path, its extension selects the image format.
+        cv_image (np.ndarray): Image array.
+        resize (Tuple[int, int], optional): Resolution to resize the image to.
+    """
+    cv2.imwrite(image_path, prepare_image(cv_image, os.path.splitext(image_path)[1][1:], resize))
+
+
+def encode_image(
+    cv_image: np.ndarray, file_format: str, resize: Optional[Tuple[int, int]] = None
+) -> Optional[memoryview]:
+    """
+    Resize and encode a decoded image in memory.
+
+    Args:
+        cv_image (np.ndarray): Image array.
+        file_format (str): Image format.
+        resize (Tuple[int, int], optional): Resolution to resize the image to.
+
+    Returns:
+        memoryview: Encoded image, or None if OpenCV cannot encode it.
+    """
+    success, buffer = cv2.imencode(f".{file_format}", prepare_image(cv_image, file_format, resize))
+    return buffer.data if success else None
+
+
+def write_payload(image_path: str, payload: memoryview) -> None:
+    """Write an already encoded image."""
+    with open(image_path, "wb") as f:
+        f.write(payload)
+
+
+def finish_pending(
+    pending: Tuple[Future, str, str],
+    shard_writers: Dict[str, TarShardWriter],
+    manifest_dict: Dict[str, dict],
+    checkpoint: Optional[ExtractionCheckpoint] = None,
+) -> None:
+    """
+    Wait for a submitted image and, for tar output, append it to the shard of its topic.
+
+    Args:
+        pending (Tuple[Future, str, str]): Future of the writer thread, topic and image name.
+        shard_writers (Dict[str, TarShardWriter]): Shard writer per topic with tar output.
+        manifest_dict (Dict[str, dict]): Manifest entries per topic, updated with the shard location.
+        checkpoint (ExtractionCheckpoint, optional): Checkpoint to record the written image in.
+    """
+    future, topic, image_name = pending
+    data = future.result()
+    entry = manifest_dict[topic][image_name]
+
+    if topic in shard_writers:
+        if data is None:
+            logging.warning(f"Could not encode {image_name}, skipping.")
+            del manifest_dict[topic][image_name]
+            return
+
+        shard_path, offset, size = shard_writers[topic].add(image_name, data)
+        entry.update({"path": shard_path, "shard": os.path.basename(shard_path), "offset": offset, "size": size})
+
+    elif checkpoint:
+        # cv2.imwrite does not report failures
+        if not os.path.isfile(entry["path"]):
+            return
+        size = os.path.getsize(entry["path"])
+
+    if checkpoint:
+        checkpoint.record(os.path.dirname(entry["path"]), image_name, entry, size)
+
+
+def get_image_name(
+    topic_name_underscore: str,
+    naming: str,
+    file_format: str,
+    index: int,
+    rosbag_timestamp: int,
+    msg_timestamp: int,
+) -> str:
+    """
+    Get the file name of an extracted image for the given naming schema.
+
+    Args:
+        topic_name_underscore (str): Topic name with slashes replaced by underscores.
+        naming (str): 'sequential', 'rosbag_timestamp' or 'msg_timestamp'.
+        file_format (str): Image format.
+        index (int): Index of the message in its topic.
+        rosbag_timestamp (int): Rosbag timestamp of the message in nanoseconds.
+        msg_timestamp (int): Header timestamp of the message.
+
+    Returns:
+        str: Image file name.
+    """
+    if naming == "rosbag_timestamp":
+        image_name = ros_utils.get_image_name_from_timestamp(timestamp=rosbag_timestamp, file_format=file_format)
+
+    elif naming == "msg_timestamp":
+        image_name = ros_utils.get_image_name_from_timestamp(timestamp=msg_timestamp, file_format=file_format)
+
+    else:
+        image_name = ros_utils.get_image_name_from_index(index=index, file_format=file_format)
+
+    return f"{topic_name_underscore}_{image_name}"
+
+
+def get_images_from_bag(
+    rosbag_path: str,
+    output_folder: str,
+    file_format: str = "jpg",
+    topics: Optional[List[str]] = None,
+    create_manifest: bool = True,
+    naming: str = "sequential",
+    resize: Optional[Tuple[int, int]] = None,
+    sample: Optional[int] = None,
+    start_time: Optional[float] = None,
+    end_time: Optional[float] = None,
+    sample_hz: Optional[float] = None,
+    keyframe_interval: Optional[float] = None,
+    encode_threads: int = 1,
+    output_format: str = "files",
+    shard_size: int = 0,
+    resume: bool = False,
+    dedup_threshold: Optional[float] = None,
+) -> Optional[List[str]]:
+    """
+    Extract images from a rosbag, with the same arguments and output as ros_utils.get_images_from_bag.
+
+    Args:
+        rosbag_path (str): Path to the rosbag.
+        output_folder (str): Folder in which one image folder per topic is created.
+        file_format (str, optional): Image format to save as. Default is 'jpg'.
+        topics (List[str], optional): Topics to extract. If None, all image topics are extracted.
+        create_manifest (bool, optional): Whether to create a manifest file per topic. Default is True.
+        naming (str, optional): 'sequential', 'rosbag_timestamp' or 'msg_timestamp'. Default is 'sequential'.
+        resize (Tuple[int, int], optional): Resolution to resize images to.
+        sample (int, optional): Only extract every Nth image of each topic.
+        start_time (float, optional): Start time in seconds since the beginning of the rosbag.
+        end_time (float, optional): End time in seconds since the beginning of the rosbag.
+        sample_hz (float, optional): Extract at most this many images per second of each topic.
+        keyframe_interval (float, optional): Extract the image of each topic closest to every
+            multiple of this many seconds since the start of the extraction.
+        encode_threads (int, optional): Number of threads that resize, encode and write images. Default is 1.
+        output_format (str, optional): 'files' for one file per image or 'tar' for tar shards per topic,
+            which always come with a manifest. Default is 'files'.
+        shard_size (int, optional): Maximum size of a tar shard in bytes, 0 for one shard per topic.
+        resume (bool, optional): Set true to checkpoint written images, continue an interrupted
+            extraction with the same settings, and skip a rosbag that was already extracted.
+        dedup_threshold (float, optional): Drop images whose thumbnail differs from the one of the
+            last kept image of the topic by less than this many gray levels on average, and list
+            them under "duplicates" in the manifest.
+
+    Returns:
+        List[str]: Image folders with a manifest, or None if there is nothing to extract.
+    """
+    checkpoint = None
+    if resume:
+        settings = {
+            "file_format": file_format,
+            "topics": topics,
+            "create_manifest": create_manifest,
+            "naming": naming,
+            "resize": list(resize) if resize else None,
+            "sample": sample,
+            "start_time": start_time,
+            "end_time": end_time,
+            "sample_hz": sample_hz,
+            "keyframe_interval": keyframe_interval,
+            "output_format": output_format,
+            "shard_size": shard_size,
+            "dedup_threshold": dedup_threshold,
+        }
+        checkpoint = ExtractionCheckpoint(output_folder, rosbag_path, settings)
+        if checkpoint.complete:
+            print(f"Skipping {rosbag_path}, it is unchanged since its extraction was completed.")
+            return checkpoint.get_folders()
+        checkpoint.start()
+
+    rosbag_metadata_dict = ros_utils.get_bag_info_from_file(rosbag_path=rosbag_path)
+    topic_dict = ros_utils.get_topic_dict(rosbag_metadata_dict=rosbag_metadata_dict)
+    if not rosbag_metadata_dict:
+        return None
+
+    if not topics:
+        topics = ros_utils.get_topic_names_of_type(
+            all_topics=rosbag_metadata_dict["topics"],
+            filter_topic_types=ros_utils.get_image_topic_types(),
+        )
+
+    manifest_dict = dict()
+
+    for topic in topics:
+        if topic not in topic_dict.keys():
+            logging.warning(f"{topic} not in rosbag, skipping.")
+            continue
+
+        manifest_dict[topic] = dict()
+
+    if not manifest_dict:
+        logging.warning(f"No image topics to extract in {rosbag_path}.")
+        return None
+
+    if output_format == "tar":
+        # the manifest is the index of the shards
+        create_manifest = True
+    shard_writers: Dict[str, TarShardWriter] = dict()
+
+    # thumbnail and name of the last kept image per topic, and the dropped images
+    last_kept: Dict[str, Tuple[np.ndarray, str]] = dict()
+    duplicates = defaultdict(list)
+
+    # images of an interrupted run, by topic and index within the topic
+    written = defaultdict(set)
+    if checkpoint:
+        for topic in manifest_dict:
+            topic_name_underscore = ros_utils.replace_ros_topic_name(topic)
+            topic_folder = os.path.join(output_folder, topic_name_underscore)
+            lines, next_shard_index = checkpoint.load(topic_folder, output_format, topic_name_underscore)
+            for line in lines:
+                if "duplicate" in line:
+                    duplicates[topic].append(line["duplicate"])
+                    continue
+                manifest_dict[topic][line["image_name"]] = line["entry"]
+                written[topic].add(line["entry"]["msg_index"])
+            if output_format == "tar":
+                shard_writers[topic] = TarShardWriter(
+                    topic_folder, topic_name_underscore, shard_size, next_shard_index
+                )
+        if any(written.values()):
+            print(f"Resuming extraction of {rosbag_path}, {sum(len(x) for x in written.values())} images are done.")
+
+    passthrough_counter = 0
+    # bounds the decoded frames waiting for an encoder
+    max_pending = 2 * max(1, encode_threads)
+    pending = collections.deque()
+
+    with Reader(rosbag_path) as reader, ThreadPoolExecutor(max_workers=max(1, encode_threads)) as executor:
+        msgtypes, selection = select_topic_messages(
+            reader,
+            list(manifest_dict),
+            rosbag_metadata_dict["start_time"],
+            start_time,
+            end_time,
+            sample,
+            sample_hz,
+            keyframe_interval,
+        )
+        for topic in manifest_dict:
+            done = written[topic] | {x["msg_index"] for x in duplicates.get(topic, ())}
+            if done:
+                # with dedup, the last written image is read again to compare the next images to it
+                reference = max(written[topic]) if dedup_threshold is not None and written[topic] else None
+                selection[topic] = [x for x in selection[topic] if x[0] not in done or x[0] == reference]
+
+        for topic, msg_index, t, rawdata in tqdm(
+            read_selected_messages(reader, selection),
+            total=sum(len(x) for x in selection.values()),
+        ):
+            msgtype = msgtypes[topic]
+
+            payload = cv_image = None
+            if msgtype == COMPRESSED_IMAGE_TYPE:
+                sec, nanosec, image_format, data = parse_compressed_image(rawdata)
+                if can_pass_through(image_format, data, file_format, resize):
+                    payload = data
+
+            if payload is None:
+                sec, nanosec, cv_image = decode_message(rawdata, msgtype)
+
+            # same (unpadded) concatenation as ros_utils, so that image names stay the same
+            msg_timestamp = int(str(sec) + str(nanosec))
+
+            topic_name_underscore = ros_utils.replace_ros_topic_name(topic)
+            topic_folder = os.path.join(output_folder, topic_name_underscore)
+            os.makedirs(topic_folder, exist_ok=True)
+
+            image_name = get_image_name(
+                topic_name_underscore,
+                naming,
+                file_format,
+                msg_index,
+                t,
+                msg_timestamp,
+            )
+            image_path = os.path.join(topic_folder, image_name)
+
+            if dedup_threshold is not None:
+                thumbnail = get_thumbnail(cv_image) if cv_image is not None else get_payload_thumbnail(payload)
+                if msg_index in written[topic]:
+                    # last image written by an interrupted run
+                    last_kept[topic] = (thumbnail, image_name)
+                    continue
+                if topic in last_kept:
+                    difference = float(np.abs(thumbnail - last_kept[topic][0]).mean())
+                    if difference < dedup_threshold:
+                        duplicate = {
+                            "msg_timestamp": msg_timestamp,
+                            "rosbag_timestamp": t,
+                            "msg_index": msg_index,
+                            "img_name": image_name,
+                            "duplicate_of": last_kept[topic][1],
+                            "difference": round(difference, 3),
+                        }
+                        duplicates[topic].append(duplicate)
+                        if checkpoint:
+                            checkpoint.record_duplicate(topic_folder, duplicate)
+                        continue
+                last_kept[topic] = (thumbnail, image_name)
+
+            if len(pending) >= max_pending:
+                # also raises errors of the writer threads
+                finish_pending(pending.popleft(), shard_writers, manifest_dict, checkpoint)
+
+            if output_format == "tar":
+                if topic not in shard_writers:
+                    shard_writers[topic] = TarShardWriter(topic_folder, topic_name_underscore, shard_size)
+                if payload is not None:
+                    future = executor.submit(bytes, payload)
+                else:
+                    future = executor.submit(encode_image, cv_image, file_format, resize)
+
+            elif payload is not None:
+                future = executor.submit(write_payload, image_path, payload)
+
+            else:
+                future = executor.submit(write_image, image_path, cv_image, resize)
+            pending.append((future, topic, image_name))
+
+            if payload is not None:
+                passthrough_counter += 1
+
+            manifest_dict[topic][image_name] = ros_utils.create_manifest_entry_dict(
+                msg_timestamp=msg_timestamp,
+                rosbag_timestamp=t,
+                file_path=image_path,
+                index=msg_index,
+            )
+
+        while pending:
+            finish_pending(pending.popleft(), shard_writers, manifest_dict, checkpoint)
+
+        for writer in shard_writers.values():
+            writer.close()
+
+    if checkpoint:
+        checkpoint.close()
+
+    if passthrough_counter:
+        print(f"Wrote {passthrough_counter} compressed images without re-encoding them.")
+
+    for topic, writer in shard_writers.items():
+        print(f"Wrote {writer.image_count} images of {topic} to {writer.shard_index + 1} tar shards.")
+
+    if dedup_threshold is not None:
+        for topic, dropped in duplicates.items():
+            if dropped:
+                print(f"Dropped {len(dropped)} near-duplicate images of {topic}.")
+
+    output_imgs_folder_list = list()
+
+    if create_manifest:
+        for topic in manifest_dict.keys():
+            topic_folder = os.path.join(output_folder, ros_utils.replace_ros_topic_name(topic))
+            output_imgs_folder_list.append(topic_folder)
+            os.makedirs(topic_folder, exist_ok=True)
+
+            manifest_path = os.path.join(topic_folder, ros_utils.get_name_img_manifest())
+            manifest = {"images": manifest_dict[topic], "topic": topic_dict[topic]}
+            if dedup_threshold is not None:
+                # near-duplicates of a resumed run are found out of order
+                manifest["duplicates"] = sorted(duplicates.get(topic, ()), key=lambda x: x["msg_index"])
+
+            if checkpoint:
+                # images of a resumed run are done out of order, and a previous
+                # manifest may be of another rosbag or other settings
+                manifest["images"] = dict(sorted(manifest_dict[topic].items(), key=lambda x: x[1]["msg_index"]))
+                file_utils.save_json(manifest, manifest_path)
+
+            # only create manifest file if it doesn't already exist.
+            elif not os.path.exists(manifest_path):
+                file_utils.save_json(manifest, manifest_path)
+
+    if checkpoint:
+        checkpoint.finish(output_imgs_folder_list)
+
+    return output_imgs_folder_list
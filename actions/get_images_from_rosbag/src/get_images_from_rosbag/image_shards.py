@@ -0,0 +1,120 @@
+"""
+Tar shard output of extracted images.
+
+Encoded images of a topic are appended to numbered tar files
+(<topic>-000000.tar, <topic>-000001.tar, ...) in WebDataset layout, instead
+of one file per image. The image manifest records the shard, byte offset and
+size of every image, so single images can be read without unpacking a shard,
+also after the topic folder was moved.
+"""
+
+import io
+import os
+import tarfile
+
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+TAR_BLOCK_SIZE = tarfile.BLOCKSIZE
+
+
+def get_shard_name(prefix: str, shard_index: int) -> str:
+    return f"{prefix}-{shard_index:06d}.tar"
+
+
+class TarShardWriter:
+    """
+    Appends images to the tar shards of one topic folder.
+
+    A new shard is started when the next image would grow the current one past
+    max_shard_size bytes. With max_shard_size 0, all images go into one shard.
+    Shards are numbered from first_shard_index, to continue after the shards
+    of an earlier run.
+    """
+
+    def __init__(self, folder: str, prefix: str, max_shard_size: int = 0, first_shard_index: int = 0):
+        self.folder = folder
+        self.prefix = prefix
+        self.max_shard_size = max_shard_size
+        self.shard_index = first_shard_index - 1
+        self.shard_path: Optional[str] = None
+        self.tar: Optional[tarfile.TarFile] = None
+        self.image_count = 0
+
+    def open_next_shard(self) -> None:
+        self.close()
+        self.shard_index += 1
+        self.shard_path = os.path.join(self.folder, get_shard_name(self.prefix, self.shard_index))
+        self.tar = tarfile.open(self.shard_path, "w", format=tarfile.PAX_FORMAT)
+
+    def add(self, name: str, data) -> Tuple[str, int, int]:
+        """
+        Append an encoded image.
+
+        Args:
+            name (str): Member name, the image name.
+            data: Bytes-like encoded image.
+
+        Returns:
+            Tuple[str, int, int]: Shard path, byte offset of the image data in the shard and its size.
+        """
+        size = len(data)
+        padded_size = -(-size // TAR_BLOCK_SIZE) * TAR_BLOCK_SIZE
+        if (
+            self.tar is None
+            or self.max_shard_size
+            and self.tar.offset
+            and self.tar.offset + TAR_BLOCK_SIZE + padded_size > self.max_shard_size
+        ):
+            self.open_next_shard()
+
+        info = tarfile.TarInfo(name)
+        info.size = size
+        self.tar.addfile(info, io.BytesIO(data))
+        # the data ends the member, headers are longer than one block for long member names
+        offset = self.tar.offset - padded_size
+        self.image_count += 1
+        return self.shard_path, offset, size
+
+    def close(self) -> None:
+        if self.tar is not None:
+            self.tar.close()
+            self.tar = None
+
+
+def finish_truncated_shard(shard_path: str, end: int) -> None:
+    """
+    Cut a shard after the member ending at byte end and close the archive.
+
+    Args:
+        shard_path (str): Path of the shard.
+        end (int): End of the last member to keep, a multiple of the tar block size.
+    """
+    with open(shard_path, "r+b") as f:
+        f.truncate(end)
+        f.seek(end)
+        # end-of-archive marker
+        f.write(tarfile.NUL * 2 * TAR_BLOCK_SIZE)
+
+
+def read_image_bytes(topic_folder: str, entry: dict) -> bytes:
+    """
+    Read the encoded image of a manifest entry written by TarShardWriter.
+
+    Args:
+        topic_folder (str): Folder containing the manifest and shards.
+        entry (dict): Image manifest entry with "shard", "offset" and "size".
+
+    Returns:
+        bytes: Encoded image.
+    """
+    with open(os.path.join(topic_folder, entry["shard"]), "rb") as f:
+        f.seek(entry["offset"])
+        return f.read(entry["size"])
+
+
+def read_image(topic_folder: str, entry: dict) -> np.ndarray:
+    """Decode the image of a manifest entry written by TarShardWriter, as cv2.imread(path, -1) would."""
+    return cv2.imdecode(np.frombuffer(read_image_bytes(topic_folder, entry), np.uint8), cv2.IMREAD_UNCHANGED)
@@ -116,7 +116,15 @@ main() {
     #run_docker_test "-e ROBOTO_PARAM_TOPICS=/dvs/image_raw"
     run_docker_test "-e ROBOTO_PARAM_SAVE_VIDEO=True"
     file_exists_or_error $ACTUAL_OUTPUT_DIR/tiny/dvs_image_raw/video.mp4
+    file_exists_or_error $ACTUAL_OUTPUT_DIR/tiny/dvs_image_raw/img_manifest.json
+    check_file_does_not_exist $ACTUAL_OUTPUT_DIR/tiny/dvs_image_raw/dvs_image_raw_000000.jpg
 
+    # Test 7
+    echo "Running Test 7: Verify output video from staged images"
+    clean_actual_output
+    run_docker_test "-e ROBOTO_PARAM_SAVE_VIDEO=True -e ROBOTO_PARAM_STREAM=False -e ROBOTO_PARAM_KEEP_IMAGES=True"
+    file_exists_or_error $ACTUAL_OUTPUT_DIR/tiny/dvs_image_raw/video.mp4
+    file_exists_or_error $ACTUAL_OUTPUT_DIR/tiny/dvs_image_raw/dvs_image_raw_000000.jpg
 
 }
 
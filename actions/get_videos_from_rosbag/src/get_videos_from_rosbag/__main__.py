@@ -8,6 +8,8 @@ from roboto.env import RobotoEnvKey
 from robologs_ros_utils.sources.ros1 import argument_parsers, ros_utils
 from robologs_ros_utils.utils import file_utils
 
+from . import video_streaming
+
 
 def main(
     input_file_or_folder: str,
@@ -22,6 +24,7 @@ def main(
     end_time: Optional[float] = None,
     save_video: Optional[bool] = False,
     keep_images: Optional[bool] = False,
+    stream: Optional[bool] = True,
 ) -> None:
     """
     Extract images from a Rosbag1 format.
@@ -39,6 +42,7 @@ def main(
         end_time (float, optional): End time for extraction or None for the end.
         save_video (bool, optional): Set true to save videos.
         keep_images (bool, optional): Set true to keep images when using --save_video.
+        stream (bool, optional): Set false to stage images on disk instead of piping frames to the video encoder.
     """
 
     topics_list = topics.split(",") if topics else None
@@ -65,6 +69,7 @@ def main(
                 end_time,
                 save_video,
                 keep_images,
+                stream,
             )
 
     elif os.path.isfile(input_file_or_folder):
@@ -81,6 +86,7 @@ def main(
             end_time,
             save_video,
             keep_images,
+            stream,
         )
 
     else:
@@ -102,7 +108,28 @@ def process_and_maybe_save_video(
     end_time: Optional[float],
     save_video: Optional[bool],
     keep_images: Optional[bool],
+    stream: Optional[bool] = True,
 ) -> None:
+    if save_video and stream:
+        bag_name = os.path.splitext(os.path.basename(rosbag_path))[0]
+        bag_output_folder = os.path.join(output_folder, bag_name)
+        os.makedirs(bag_output_folder, exist_ok=True)
+        os.chmod(bag_output_folder, 0o777)
+
+        video_streaming.get_videos_from_bag(
+            rosbag_path=rosbag_path,
+            output_folder=bag_output_folder,
+            file_format=file_format,
+            topics=topics,
+            naming=naming,
+            resize=resize,
+            sample=sample,
+            start_time=start_time,
+            end_time=end_time,
+            keep_images=keep_images,
+        )
+        return
+
     folder_list = process_rosbag(
         rosbag_path,
         output_folder,
@@ -272,6 +299,24 @@ parser.add_argument(
     default=(os.environ.get("ROBOTO_PARAM_KEEP_IMAGES") == "True"),
 )
 
+parser.add_argument(
+    "--stream",
+    dest="stream",
+    action="store_true",
+    required=False,
+    help="Pipe decoded frames straight to the video encoder instead of staging images on disk (default)",
+    default=(os.environ.get("ROBOTO_PARAM_STREAM", "True") == "True"),
+)
+
+parser.add_argument(
+    "--no_stream",
+    dest="stream",
+    action="store_false",
+    required=False,
+    help="Stage images on disk and build the videos from them",
+    default=(os.environ.get("ROBOTO_PARAM_STREAM", "True") == "True"),
+)
+
 args = parser.parse_args()
 
 if args.save_video:
@@ -290,4 +335,5 @@ main(
     end_time=args.end_time,
     save_video=args.save_video,
     keep_images=args.keep_images,
+    stream=args.stream,
 )
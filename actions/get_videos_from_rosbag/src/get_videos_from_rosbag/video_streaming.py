@@ -0,0 +1,331 @@
+"""
+Video creation from Rosbag1 files without staging images on disk.
+
+Decoded frames are piped from the rosbag reader into one ffmpeg/libx264
+process per topic. The image manifest is created as by
+ros_utils.get_images_from_bag, and images are only written when they are kept.
+"""
+
+import logging
+import os
+import subprocess
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+from rosbags.rosbag1 import Reader
+from rosbags.serde import deserialize_cdr, ros1_to_cdr
+from tqdm import tqdm
+
+from robologs_ros_utils.sources.ros1 import ros_img_tools, ros_utils
+from robologs_ros_utils.utils import file_utils, img_utils
+
+VIDEO_NAME = "video.mp4"
+
+IMAGE_ENCODINGS = {
+    "rgb8": "RGB",
+    "rgba8": "RGBA",
+    "mono8": "L",
+    "8UC3": "RGB",
+    "bgra8": "RGBA",
+    "bgr8": "RGB",
+}
+
+
+class FfmpegVideoWriter:
+    """
+    Encodes raw frames to an H.264 video with an ffmpeg process reading from a pipe.
+
+    The frame size and pixel format are fixed by the first frame. Later frames
+    of a different size are resized to it.
+    """
+
+    def __init__(self, path: str, frame_rate: float):
+        self.path = path
+        self.frame_rate = frame_rate
+        self.size: Optional[Tuple[int, int]] = None
+        self.process: Optional[subprocess.Popen] = None
+        self.frame_count = 0
+
+    def start(self, width: int, height: int, pix_fmt: str) -> None:
+        self.size = (width, height)
+        self.process = subprocess.Popen(
+            [
+                "ffmpeg",
+                "-hide_banner",
+                "-loglevel",
+                "error",
+                "-f",
+                "rawvideo",
+                "-pix_fmt",
+                pix_fmt,
+                "-s",
+                f"{width}x{height}",
+                "-r",
+                str(self.frame_rate),
+                "-i",
+                "-",
+                "-vcodec",
+                "libx264",
+                # yuv420p needs even dimensions
+                "-vf",
+                "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+                "-pix_fmt",
+                "yuv420p",
+                "-y",
+                self.path,
+            ],
+            stdin=subprocess.PIPE,
+        )
+
+    def write(self, frame: np.ndarray) -> None:
+        """
+        Send one frame to the encoder.
+
+        Args:
+            frame (np.ndarray): 8-bit grayscale or BGR frame.
+        """
+        if self.process is None:
+            height, width = frame.shape[:2]
+            self.start(width, height, "gray" if frame.ndim == 2 else "bgr24")
+        elif (frame.shape[1], frame.shape[0]) != self.size:
+            frame = cv2.resize(frame, self.size)
+
+        try:
+            self.process.stdin.write(np.ascontiguousarray(frame).data)
+        except BrokenPipeError:
+            self.close()
+            raise RuntimeError(f"ffmpeg stopped reading frames for {self.path}")
+        self.frame_count += 1
+
+    def close(self) -> None:
+        """
+        Wait for the encoder to finish the video.
+
+        Raises:
+            RuntimeError: If ffmpeg failed.
+        """
+        if self.process is None:
+            return
+        process, self.process = self.process, None
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+        if process.wait() != 0:
+            raise RuntimeError(f"ffmpeg failed with exit code {process.returncode} while writing {self.path}")
+
+
+def close_writers(writers: Iterable[FfmpegVideoWriter], suppress_errors: bool = False) -> None:
+    """
+    Close every writer, also when closing an earlier one fails.
+
+    Args:
+        writers (Iterable[FfmpegVideoWriter]): Writers to close.
+        suppress_errors (bool, optional): True to ignore ffmpeg failures, while another error is raised.
+
+    Raises:
+        RuntimeError: The first ffmpeg failure, unless suppress_errors is set.
+    """
+    error = None
+    for writer in writers:
+        try:
+            writer.close()
+        except RuntimeError as e:
+            error = error or e
+    if error and not suppress_errors:
+        raise error
+
+
+def decode_image(msg) -> np.ndarray:
+    """
+    Convert a deserialized image message into an array like ros_utils.get_images_from_bag does.
+
+    Args:
+        msg: sensor_msgs/Image or sensor_msgs/CompressedImage message.
+
+    Returns:
+        np.ndarray: Image array.
+    """
+    if msg.__msgtype__ == "sensor_msgs/msg/Image":
+        cv_image = np.array(
+            Image.frombytes(IMAGE_ENCODINGS[msg.encoding], (msg.width, msg.height), msg.data)
+        )
+        if msg.encoding == "bgra8":
+            cv_image = cv2.cvtColor(cv_image, cv2.COLOR_BGRA2RGBA)
+        return cv_image
+
+    if "compressedDepth" in msg.format:
+        return ros_img_tools.convert_compressed_depth_to_cv2(msg)
+    return ros_img_tools.convert_image_to_cv2(msg)
+
+
+def to_video_frame(cv_image: np.ndarray) -> np.ndarray:
+    """
+    Convert an image array to the 8-bit grayscale or BGR frame that cv2.imwrite would have stored.
+
+    Args:
+        cv_image (np.ndarray): Image array.
+
+    Returns:
+        np.ndarray: Video frame.
+    """
+    if cv_image.dtype != np.uint8:
+        cv_image = cv2.normalize(cv_image, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
+    if cv_image.ndim == 3 and cv_image.shape[2] == 1:
+        cv_image = cv_image[:, :, 0]
+    elif cv_image.ndim == 3 and cv_image.shape[2] == 4:
+        cv_image = cv2.cvtColor(cv_image, cv2.COLOR_BGRA2BGR)
+    return cv_image
+
+
+def get_videos_from_bag(
+    rosbag_path: str,
+    output_folder: str,
+    file_format: str = "jpg",
+    topics: Optional[List[str]] = None,
+    naming: str = "sequential",
+    resize: Optional[Tuple[int, int]] = None,
+    sample: Optional[int] = None,
+    start_time: Optional[float] = None,
+    end_time: Optional[float] = None,
+    keep_images: bool = False,
+) -> Optional[List[str]]:
+    """
+    Create one video per image topic of a rosbag, next to the image manifest of that topic.
+
+    The frame rate of each video is the topic frequency stored in the
+    manifest, as for ros_utils.get_video_from_image_folder.
+
+    Args:
+        rosbag_path (str): Path to the rosbag.
+        output_folder (str): Folder in which one folder per topic is created.
+        file_format (str, optional): Image format of kept images. Default is 'jpg'.
+        topics (List[str], optional): Topics to use. If None, all image topics are used.
+        naming (str, optional): Naming scheme of the images in the manifest. Default is 'sequential'.
+        resize (Tuple[int, int], optional): Resolution to resize frames to.
+        sample (int, optional): Only use every Nth image of each topic.
+        start_time (float, optional): Start time in seconds since the beginning of the rosbag.
+        end_time (float, optional): End time in seconds since the beginning of the rosbag.
+        keep_images (bool, optional): Set true to also write every frame as an image.
+
+    Returns:
+        List[str]: Topic folders with a video and manifest, or None if there is nothing to extract.
+    """
+    rosbag_metadata_dict = ros_utils.get_bag_info_from_file(rosbag_path=rosbag_path)
+    topic_dict = ros_utils.get_topic_dict(rosbag_metadata_dict=rosbag_metadata_dict)
+    if not rosbag_metadata_dict:
+        return None
+
+    if not topics:
+        topics = ros_utils.get_topic_names_of_type(
+            all_topics=rosbag_metadata_dict["topics"],
+            filter_topic_types=ros_utils.get_image_topic_types(),
+        )
+
+    topic_msg_counter_dict = dict()
+    manifest_dict = dict()
+    total_number_of_images = 0
+
+    for topic in topics:
+        if topic not in topic_dict.keys():
+            logging.warning(f"{topic} not in rosbag, skipping.")
+            continue
+
+        topic_msg_counter_dict[topic] = 0
+        manifest_dict[topic] = dict()
+        total_number_of_images += topic_dict[topic]["Message Count"]
+
+    if not manifest_dict:
+        logging.warning(f"No image topics to extract in {rosbag_path}.")
+        return None
+
+    writers: Dict[str, FfmpegVideoWriter] = dict()
+
+    try:
+        with Reader(rosbag_path) as reader:
+            connections = [x for x in reader.connections if x.topic in manifest_dict]
+
+            with tqdm(total=total_number_of_images) as pbar:
+                for connection, t, rawdata in reader.messages(connections=connections):
+                    topic = connection.topic
+                    time_from_start_s = t * 1e-9 - rosbag_metadata_dict["start_time"]
+                    if not ros_utils.check_if_in_time_range(time_from_start_s, start_time, end_time) or (
+                        sample and topic_msg_counter_dict[topic] % sample != 0
+                    ):
+                        topic_msg_counter_dict[topic] += 1
+                        pbar.update(1)
+                        continue
+
+                    msg = deserialize_cdr(ros1_to_cdr(rawdata, connection.msgtype), connection.msgtype)
+                    # same (unpadded) concatenation as ros_utils, so that image names stay the same
+                    msg_timestamp = int(str(msg.header.stamp.sec) + str(msg.header.stamp.nanosec))
+
+                    topic_name_underscore = ros_utils.replace_ros_topic_name(topic)
+                    topic_folder = os.path.join(output_folder, topic_name_underscore)
+                    os.makedirs(topic_folder, exist_ok=True)
+
+                    if naming == "rosbag_timestamp":
+                        image_name = ros_utils.get_image_name_from_timestamp(timestamp=t, file_format=file_format)
+                    elif naming == "msg_timestamp":
+                        image_name = ros_utils.get_image_name_from_timestamp(
+                            timestamp=msg_timestamp, file_format=file_format
+                        )
+                    else:
+                        image_name = ros_utils.get_image_name_from_index(
+                            index=topic_msg_counter_dict[topic], file_format=file_format
+                        )
+                    image_name = f"{topic_name_underscore}_{image_name}"
+                    image_path = os.path.join(topic_folder, image_name)
+
+                    cv_image = decode_image(msg)
+                    if resize:
+                        cv_image = img_utils.resize_image(img=cv_image, new_width=resize[0], new_height=resize[1])
+                    if keep_images:
+                        cv2.imwrite(image_path, cv_image)
+
+                    if topic not in writers:
+                        writers[topic] = FfmpegVideoWriter(
+                            os.path.join(topic_folder, VIDEO_NAME),
+                            round(topic_dict[topic]["Frequency"], 2),
+                        )
+                    writers[topic].write(to_video_frame(cv_image))
+
+                    manifest_dict[topic][image_name] = ros_utils.create_manifest_entry_dict(
+                        msg_timestamp=msg_timestamp,
+                        rosbag_timestamp=t,
+                        file_path=image_path,
+                        index=topic_msg_counter_dict[topic],
+                    )
+
+                    topic_msg_counter_dict[topic] += 1
+                    pbar.update(1)
+
+    except BaseException:
+        # a video left unfinished by the error may fail to encode, which must not hide the error
+        close_writers(writers.values(), suppress_errors=True)
+        raise
+    else:
+        close_writers(writers.values())
+
+    output_folder_list = list()
+
+    for topic in manifest_dict.keys():
+        topic_folder = os.path.join(output_folder, ros_utils.replace_ros_topic_name(topic))
+        output_folder_list.append(topic_folder)
+        os.makedirs(topic_folder, exist_ok=True)
+
+        manifest_path = os.path.join(topic_folder, ros_utils.get_name_img_manifest())
+        # only create manifest file if it doesn't already exist.
+        if not os.path.exists(manifest_path):
+            file_utils.save_json(
+                {"images": manifest_dict[topic], "topic": topic_dict[topic]},
+                manifest_path,
+            )
+
+    for topic, writer in writers.items():
+        print(f"Encoded {writer.frame_count} frames of {topic} to {writer.path}")
+
+    return output_folder_list
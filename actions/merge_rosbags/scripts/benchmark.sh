@@ -0,0 +1,28 @@
+#!/usr/bin/env bash
+
+set -euo pipefail
+
+SCRIPTS_ROOT=$( cd -- "$( dirname -- "${BASH_SOURCE[0]}" )" &> /dev/null && pwd)
+PACKAGE_ROOT=$(dirname "${SCRIPTS_ROOT}")
+
+# Usage: ./scripts/benchmark.sh <path-to-input-data-directory> <suite> [benchmark options]
+if [ $# -lt 2 ]; then
+    echo "Usage: $0 <path-to-input-data-directory> <suite> [benchmark options]"
+    exit 1
+fi
+
+input_dir=$1
+shift
+
+# Fail if input_dir is not an existing absolute directory path
+if [ ! -d "$input_dir" ] || [[ ! "$input_dir" = /* ]]; then
+    echo "Input directory '$input_dir' must be an existing directory specified as an absolute path"
+    exit 1
+fi
+
+docker run --rm -it \
+    -v $input_dir:/input \
+    -e ROBOTO_INPUT_DIR=/input \
+    --entrypoint python3 \
+    merge_rosbags:latest \
+    -m merge_rosbags.benchmark "$@"
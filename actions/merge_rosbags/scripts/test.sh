@@ -33,9 +33,10 @@ file_exists_or_error() {
 # Run the docker command with the given parameters
 run_docker_test() {
     local additional_args="$1"
+    local input_dir="${2:-$INPUT_DIR}"
     
     docker run \
-        -v $INPUT_DIR:/input \
+        -v $input_dir:/input \
         -v $ACTUAL_OUTPUT_DIR:/output \
         -e ROBOTO_INPUT_DIR=/input \
         -e ROBOTO_OUTPUT_DIR=/output \
@@ -53,6 +54,30 @@ function check_file_does_not_exist() {
     fi
 }
 
+# Check the total message count of a merge plan
+check_message_count() {
+    local plan_file="$1"
+    local expected_count="$2"
+    local count=$(python3 -c "import json, sys; print(json.load(open(sys.argv[1]))['message_count'])" $plan_file)
+
+    if [ "$count" != "$expected_count" ]; then
+        echo "Test failed: expected $expected_count messages, found $count."
+        exit 1
+    fi
+    echo "Test passed!"
+}
+
+# Count the messages of a bag in the output folder, with the rosbags package of the image
+count_bag_messages() {
+    local bag_name="$1"
+
+    docker run --rm \
+        -v $ACTUAL_OUTPUT_DIR:/output \
+        --entrypoint python3 \
+        merge_rosbags:latest \
+        -c "from rosbags.rosbag1 import Reader; reader = Reader('/output/$bag_name'); reader.open(); print(reader.message_count)"
+}
+
 # Compare the actual output to the expected output
 compare_outputs() {
     local actual_file="$1"
@@ -76,6 +101,49 @@ main() {
     clean_actual_output
     run_docker_test "-e ROBOTO_PARAM_OUTPUT_FOLDER_NAME=abc -e ROBOTO_PARAM_OUTPUT_FILE_NAME=output.bag"
     file_exists_or_error $ACTUAL_OUTPUT_DIR/abc/output.bag
+
+    # Test 2
+    echo "Running Test 2: Validate time window and rate limited merge..."
+    clean_actual_output
+    run_docker_test "-e ROBOTO_PARAM_START_TIME=0.05 -e ROBOTO_PARAM_END_TIME=0.1 -e ROBOTO_PARAM_MAX_RATE=20"
+    file_exists_or_error $ACTUAL_OUTPUT_DIR/merged.bag
+
+    # Test 3
+    echo "Running Test 3: Validate that plan mode writes a plan and no bag..."
+    clean_actual_output
+    run_docker_test "-e ROBOTO_PARAM_PLAN=True"
+    file_exists_or_error $ACTUAL_OUTPUT_DIR/merged.plan.json
+    check_file_does_not_exist $ACTUAL_OUTPUT_DIR/merged.bag
+
+    # Test 4
+    echo "Running Test 4: Validate merge to MCAP..."
+    clean_actual_output
+    run_docker_test "-e ROBOTO_PARAM_OUTPUT_FORMAT=mcap -e ROBOTO_PARAM_COMPRESSION=zstd"
+    file_exists_or_error $ACTUAL_OUTPUT_DIR/merged.mcap
+
+    # Test 5
+    echo "Running Test 5: Validate that MAX_RATE limits the merged messages of overlapping bags..."
+    clean_actual_output
+    OVERLAPPING_INPUT_DIR=$(mktemp -d)
+    for i in 1 2 3 4 5; do
+        cp $INPUT_DIR/tiny.bag $OVERLAPPING_INPUT_DIR/tiny_$i.bag
+    done
+    run_docker_test "-e ROBOTO_PARAM_MAX_RATE=10" $OVERLAPPING_INPUT_DIR
+    file_exists_or_error $ACTUAL_OUTPUT_DIR/merged.bag
+    # 2 messages of /dvs/image_raw and 1 of /dvs1/image_raw
+    local merged_count=$(count_bag_messages merged.bag)
+    if [ "$merged_count" != "3" ]; then
+        echo "Test failed: expected 3 merged messages, found $merged_count."
+        exit 1
+    fi
+    # the plan of the merged bag counts its messages
+    run_docker_test "-e ROBOTO_PARAM_PLAN=True" $ACTUAL_OUTPUT_DIR
+    check_message_count $ACTUAL_OUTPUT_DIR/merged.plan.json $merged_count
+    # the plan of the merge itself counts the messages the merge wrote
+    clean_actual_output
+    run_docker_test "-e ROBOTO_PARAM_MAX_RATE=10 -e ROBOTO_PARAM_PLAN=True" $OVERLAPPING_INPUT_DIR
+    check_message_count $ACTUAL_OUTPUT_DIR/merged.plan.json $merged_count
+    rm -rf $OVERLAPPING_INPUT_DIR
 }
 
 # Run the main test execution
@@ -1,8 +1,9 @@
 import argparse
 import os
 import pathlib
+import sys
 import glob
-from . import bag_stream
+from . import bag_stream, plan
 
 from roboto.domain import actions
 
@@ -23,6 +24,29 @@ def find_bag_files(directory):
     return bag_files
 
 
+def parse_topic_values(arg, value_type):
+    """
+    Parses a comma-separated list of topic=value pairs into a dictionary.
+
+    A value without a topic applies to all topics and is stored under '*'.
+
+    :param arg: String such as "/camera/image_raw=2,/imu=10" or "5".
+    :param value_type: Type to convert the values to.
+    :return: Dictionary of topic to value. Returns an empty dictionary for an empty argument.
+    """
+    values = {}
+    if not arg:
+        return values
+
+    for entry in arg.replace(" ", "").split(","):
+        if not entry:
+            continue
+        topic, sep, value = entry.rpartition("=")
+        values[topic if sep else "*"] = value_type(value)
+
+    return values
+
+
 parser = argparse.ArgumentParser()
 parser.add_argument(
     "-i",
@@ -67,6 +91,88 @@ parser.add_argument(
     default=os.environ.get("ROBOTO_PARAM_OUTPUT_FOLDER_NAME"),
 )
 
+parser.add_argument(
+    "--prefetch_depth",
+    type=int,
+    required=False,
+    help="Number of ~1 MiB message batches each input bag reads ahead of the merge. Set 0 to disable read-ahead",
+    default=int(os.environ.get("ROBOTO_PARAM_PREFETCH_DEPTH", 4)),
+)
+
+parser.add_argument(
+    "--max_fan_in",
+    type=int,
+    required=False,
+    help="Maximum number of bags opened at once. More inputs are merged in levels through temporary bags",
+    default=int(os.environ.get("ROBOTO_PARAM_MAX_FAN_IN", 64)),
+)
+
+parser.add_argument(
+    "--start_time",
+    type=float,
+    required=False,
+    help="Start time for the merge, in seconds since the earliest message of all input bags",
+    default=os.environ.get("ROBOTO_PARAM_START_TIME"),
+)
+
+parser.add_argument(
+    "--end_time",
+    type=float,
+    required=False,
+    help="End time for the merge, in seconds since the earliest message of all input bags",
+    default=os.environ.get("ROBOTO_PARAM_END_TIME"),
+)
+
+parser.add_argument(
+    "--max_rate",
+    type=str,
+    required=False,
+    help="Comma-separated topic=Hz pairs limiting the message rate per topic. A bare value applies to all topics",
+    default=os.environ.get("ROBOTO_PARAM_MAX_RATE"),
+)
+
+parser.add_argument(
+    "--keep_every",
+    type=str,
+    required=False,
+    help="Comma-separated topic=N pairs keeping only every Nth message per topic. A bare value applies to all topics",
+    default=os.environ.get("ROBOTO_PARAM_KEEP_EVERY"),
+)
+
+parser.add_argument(
+    "--compression",
+    type=str,
+    required=False,
+    help="Chunk compression of the merged file. 'bz2' is only valid for bags and 'zstd' only for MCAP. If empty, chunks are written uncompressed",
+    choices=["none", "bz2", "lz4", "zstd"],
+    default=os.environ.get("ROBOTO_PARAM_COMPRESSION") or None,
+)
+
+parser.add_argument(
+    "--chunk_size",
+    type=int,
+    required=False,
+    help="Uncompressed size in bytes at which the merged bag starts a new chunk",
+    default=os.environ.get("ROBOTO_PARAM_CHUNK_SIZE"),
+)
+
+parser.add_argument(
+    "--output_format",
+    type=str,
+    required=False,
+    help="Format of the merged file",
+    choices=["bag", "mcap"],
+    default=os.environ.get("ROBOTO_PARAM_OUTPUT_FORMAT", "bag"),
+)
+
+parser.add_argument(
+    "--plan",
+    action="store_true",
+    required=False,
+    help="Set True to only write a JSON plan of the merge, read from the bag indexes, instead of merging",
+    default=(os.environ.get("ROBOTO_PARAM_PLAN") == "True"),
+)
+
 args = parser.parse_args()
 
 input_bags = find_bag_files(args.input_dir)
@@ -83,4 +189,36 @@ else:
 if not os.path.exists(output_path):
     os.makedirs(output_path)
 
-bag_stream.main(input_bags, topics_list, output_path, args.output_file_name, True)
+if args.plan:
+    plan.main(
+        input_bags,
+        topics_list,
+        output_path,
+        os.path.splitext(args.output_file_name)[0] + ".plan.json",
+        start_time=args.start_time,
+        end_time=args.end_time,
+        max_rates=parse_topic_values(args.max_rate, float),
+        keep_every=parse_topic_values(args.keep_every, int),
+        max_fan_in=args.max_fan_in,
+        compression=args.compression,
+        chunk_size=args.chunk_size,
+        output_format=args.output_format,
+    )
+    sys.exit(0)
+
+bag_stream.main(
+    input_bags,
+    topics_list,
+    output_path,
+    args.output_file_name,
+    True,
+    prefetch_depth=args.prefetch_depth,
+    max_fan_in=args.max_fan_in,
+    start_time=args.start_time,
+    end_time=args.end_time,
+    max_rates=parse_topic_values(args.max_rate, float),
+    keep_every=parse_topic_values(args.keep_every, int),
+    compression=args.compression,
+    chunk_size=args.chunk_size,
+    output_format=args.output_format,
+)
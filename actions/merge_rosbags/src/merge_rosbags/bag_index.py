@@ -0,0 +1,200 @@
+"""
+
+Reads the index section of a rosbag without touching any chunk or message data.
+
+The index section at the end of a ROS1 v2.0 bag holds one connection record per
+connection and one chunk info record per chunk, which is enough to learn the
+topics, message counts and time range of a bag in a handful of reads.
+
+"""
+
+import os
+import struct
+from typing import Dict, List, NamedTuple, Set
+
+from rosbags.rosbag1 import ReaderError
+
+BAG_MAGIC = b"#ROSBAG V2.0\n"
+
+# the bag header record is padded so that the first chunk starts at this offset
+BAG_HEADER_SIZE = 4096
+
+OP_BAG_HEADER = 3
+OP_CHUNK_INFO = 6
+OP_CONNECTION = 7
+
+UINT32 = struct.Struct("<L")
+UINT64 = struct.Struct("<Q")
+TIME = struct.Struct("<LL")
+
+
+class ConnectionRecord(NamedTuple):
+    """Connection record of a bag, kept as raw bytes so it can be copied verbatim."""
+
+    conn: int
+    topic: str
+    msgtype: str
+    raw: bytes
+
+
+class ChunkInfoRecord(NamedTuple):
+    """Chunk info record of a bag. Times are in nanoseconds, end_time is inclusive."""
+
+    chunk_pos: int
+    start_time: int
+    end_time: int
+    connection_counts: Dict[int, int]
+
+
+class BagIndex(NamedTuple):
+    """Index section of a bag."""
+
+    path: str
+    file_size: int
+    index_pos: int
+    connections: Dict[int, ConnectionRecord]
+    chunk_infos: List[ChunkInfoRecord]
+
+    @property
+    def start_time(self) -> int:
+        return min(x.start_time for x in self.chunk_infos)
+
+    @property
+    def end_time(self) -> int:
+        return max(x.end_time for x in self.chunk_infos)
+
+    @property
+    def data_pos(self) -> int:
+        """Offset of the first chunk."""
+        return min(x.chunk_pos for x in self.chunk_infos)
+
+    def message_counts(self) -> Dict[int, int]:
+        """Number of messages per connection id."""
+        counts: Dict[int, int] = {}
+        for chunk_info in self.chunk_infos:
+            for conn, count in chunk_info.connection_counts.items():
+                counts[conn] = counts.get(conn, 0) + count
+        return counts
+
+
+def parse_header(header: bytes) -> Dict[str, bytes]:
+    """Split the name=value fields of a record header."""
+    fields = {}
+    pos = 0
+    while pos < len(header):
+        (size,) = UINT32.unpack_from(header, pos)
+        pos += 4
+        name, _, value = header[pos : pos + size].partition(b"=")
+        fields[name.decode()] = value
+        pos += size
+    return fields
+
+
+def serialize_header(fields: Dict[str, bytes]) -> bytes:
+    """Serialize name=value fields into a length-prefixed record header."""
+    data = b""
+    for name, value in fields.items():
+        field = name.encode() + b"=" + value
+        data += UINT32.pack(len(field)) + field
+    return UINT32.pack(len(data)) + data
+
+
+def read_record(bio):
+    """
+    Read one record from the current position.
+
+    Returns:
+        Tuple of the raw header and the record data.
+    """
+    (header_len,) = UINT32.unpack(bio.read(4))
+    header = bio.read(header_len)
+    (data_len,) = UINT32.unpack(bio.read(4))
+    data = bio.read(data_len)
+    if len(header) != header_len or len(data) != data_len:
+        raise ReaderError("Record is truncated.")
+    return header, data
+
+
+def serialize_record(header: bytes, data: bytes) -> bytes:
+    return UINT32.pack(len(header)) + header + UINT32.pack(len(data)) + data
+
+
+def unpack_time(value: bytes) -> int:
+    sec, nsec = TIME.unpack(value)
+    return sec * 10**9 + nsec
+
+
+def pack_time(value: int) -> bytes:
+    return TIME.pack(value // 10**9, value % 10**9)
+
+
+def read_chunk_compressions(index: BagIndex) -> Set[str]:
+    """Read the compression of every chunk from the chunk record headers of a bag."""
+    compressions = set()
+    with open(index.path, "rb") as bio:
+        for chunk_info in index.chunk_infos:
+            bio.seek(chunk_info.chunk_pos)
+            (header_len,) = UINT32.unpack(bio.read(4))
+            fields = parse_header(bio.read(header_len))
+            compressions.add(fields["compression"].decode())
+    return compressions
+
+
+def read_bag_index(path: str) -> BagIndex:
+    """Read the bag header and index section of the bag at path."""
+    with open(path, "rb") as bio:
+        if bio.read(len(BAG_MAGIC)) != BAG_MAGIC:
+            raise ReaderError(f"{path} is not a ROS1 v2.0 bag file.")
+
+        header, _ = read_record(bio)
+        fields = parse_header(header)
+        if fields["op"][0] != OP_BAG_HEADER:
+            raise ReaderError(f"{path} does not start with a bag header record.")
+        (index_pos,) = UINT64.unpack(fields["index_pos"])
+        (conn_count,) = UINT32.unpack(fields["conn_count"])
+        (chunk_count,) = UINT32.unpack(fields["chunk_count"])
+        if index_pos == 0:
+            raise ReaderError(
+                (
+                    f"Unindexed bag file: {path}\n"
+                    "  File was not copied in full or recording did not finish properly\n"
+                    "  Use `rosbag reindex` to index what is there."
+                ),
+            )
+
+        bio.seek(index_pos)
+        connections = {}
+        for _ in range(conn_count):
+            header, data = read_record(bio)
+            fields = parse_header(header)
+            if fields["op"][0] != OP_CONNECTION:
+                raise ReaderError(f"Bag index of {path} looks damaged.")
+            (conn,) = UINT32.unpack(fields["conn"])
+            connection_fields = parse_header(data)
+            connections[conn] = ConnectionRecord(
+                conn,
+                fields["topic"].decode(),
+                connection_fields.get("type", b"").decode(),
+                serialize_record(header, data),
+            )
+
+        chunk_infos = []
+        for _ in range(chunk_count):
+            header, data = read_record(bio)
+            fields = parse_header(header)
+            if fields["op"][0] != OP_CHUNK_INFO:
+                raise ReaderError(f"Bag index of {path} looks damaged.")
+            connection_counts = {}
+            for pos in range(0, len(data), 8):
+                conn, count = struct.unpack_from("<LL", data, pos)
+                connection_counts[conn] = count
+            chunk_infos.append(
+                ChunkInfoRecord(
+                    UINT64.unpack(fields["chunk_pos"])[0],
+                    unpack_time(fields["start_time"]),
+                    unpack_time(fields["end_time"]),
+                    connection_counts,
+                )
+            )
+
+    return BagIndex(path, os.path.getsize(path), index_pos, connections, chunk_infos)
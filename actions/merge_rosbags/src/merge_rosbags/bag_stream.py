@@ -4,14 +4,25 @@ Helps stream bag data and apply bag writing capabilities.
 
 """
 
+import bisect
 import hashlib
 import heapq
+import io
+import itertools
 import os
+import queue
+import tempfile
+import threading
+import time
+from collections import defaultdict
 from contextlib import ExitStack, contextmanager
+from typing import NamedTuple
 
 from rosbags.rosbag1 import Reader, ReaderError, Writer, WriterError
 from tqdm import tqdm
 
+from . import bag_index, chunk_copy, mcap_output
+
 """
 This file was copied from https://github.com/1hada/rosbag-merge/blob/main/src/rosbag_merge/bag_stream.py
 Copyright open_rosbag1 and read_messages comes from marv_robotics
@@ -36,41 +47,502 @@ def open_rosbag1(path):
         ) from None
 
 
-def read_messages(paths, topics=None, start_time=None, end_time=None):
-    """Iterate chronologically raw BagMessage for topic from paths."""
-    # pylint: disable=too-many-locals
+# messages are handed from a prefetch worker to the merge in batches of about this many bytes
+PREFETCH_BATCH_BYTES = 1 << 20
+
+_END_OF_BAG = object()
+
+
+@contextmanager
+def prefetch_messages(messages, queue_depth):
+    """
+    Drain a message generator in a worker thread, buffering up to queue_depth batches.
+
+    Reading and decompressing the chunks of a bag then overlaps with merging and
+    writing in the consuming thread. The worker is stopped and joined on exit,
+    so the underlying bag can be closed safely afterwards.
+    """
+    batches = queue.Queue(maxsize=queue_depth)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def worker():
+        batch = []
+        batch_bytes = 0
+        try:
+            for message in messages:
+                batch.append(message)
+                batch_bytes += len(message[2])
+                if batch_bytes >= PREFETCH_BATCH_BYTES:
+                    if not put(batch):
+                        return
+                    batch = []
+                    batch_bytes = 0
+            if batch and not put(batch):
+                return
+            put(_END_OF_BAG)
+        except Exception as err:
+            put(err)
+
+    def consume():
+        while True:
+            item = batches.get()
+            if item is _END_OF_BAG:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield from item
+
+    thread = threading.Thread(target=worker, daemon=True)
+    thread.start()
+    try:
+        yield consume()
+    finally:
+        stop.set()
+        thread.join()
+
+
+def filter_connections(bag, topics=None):
+    """Return the connections of an open bag that belong to the requested topics."""
+    if not topics:
+        # connect to all topics
+        return [x for x in bag.connections]
+    return [x for x in bag.connections if x.topic in topics]
+
+
+def get_topic_value(values, topic):
+    """Look up a per-topic setting, falling back to the '*' entry that applies to all topics."""
+    if not values:
+        return None
+    return values.get(topic, values.get("*"))
+
+
+def select_index_entries(entries, start_time=None, end_time=None, max_rate=None, keep_every=None):
+    """
+    Pick the index entries of one topic that should be read, from their timestamps alone.
+
+    Args:
+        entries: Chronologically sorted index entries, tuples starting with the timestamp.
+        start_time: Drop entries before this timestamp (ns).
+        end_time: Drop entries at or after this timestamp (ns).
+        max_rate: Keep at most this many entries per second.
+        keep_every: Keep only every Nth entry.
+    """
+    # entries compare by their timestamp, so the window is found by bisection
+    low = bisect.bisect_left(entries, (start_time,)) if start_time is not None else 0
+    high = bisect.bisect_left(entries, (end_time,)) if end_time is not None else len(entries)
+    entries = entries[low:high]
+
+    if keep_every and keep_every > 1:
+        entries = entries[::keep_every]
+
+    if max_rate:
+        min_gap = 1e9 / max_rate
+        selected = []
+        for entry in entries:
+            if not selected or entry.time - selected[-1].time >= min_gap:
+                selected.append(entry)
+        entries = selected
+
+    return entries
+
+
+class TopicEntry(NamedTuple):
+    """Index entry of a message, with the bag and connection it comes from."""
+
+    time: int
+    bag: int
+    connection: object
+    entry: object
+
+
+def select_messages(bags, topics=None, start_time=None, end_time=None, max_rates=None, keep_every=None):
+    """
+    Select the messages of open bags to read, using their message indexes only.
+
+    max_rates and keep_every apply to the merged messages of a topic, so the
+    index entries of a topic are merged across all bags by time before they
+    are thinned.
+
+    Returns:
+        One list per bag of (connection, index entries) pairs for connections with selected messages.
+    """
+    selections = [[] for _ in bags]
+    thinned = defaultdict(list)
+    for bag_number, bag in enumerate(bags):
+        for connection in filter_connections(bag, topics):
+            entries = select_index_entries(bag.indexes[connection.id], start_time, end_time)
+            if not entries:
+                continue
+            if get_topic_value(max_rates, connection.topic) or get_topic_value(keep_every, connection.topic):
+                thinned[connection.topic].append([TopicEntry(x.time, bag_number, connection, x) for x in entries])
+            else:
+                selections[bag_number].append((connection, entries))
+
+    for topic, entry_lists in thinned.items():
+        selected = defaultdict(list)
+        # merged stably, so messages with equal timestamps keep the order of the bags
+        for x in select_index_entries(
+            list(heapq.merge(*entry_lists, key=lambda x: x.time)),
+            max_rate=get_topic_value(max_rates, topic),
+            keep_every=get_topic_value(keep_every, topic),
+        ):
+            selected[(x.bag, x.connection.id)].append(x.entry)
+        for entries in entry_lists:
+            bag_number, connection = entries[0].bag, entries[0].connection
+            if (bag_number, connection.id) in selected:
+                selections[bag_number].append((connection, selected[(bag_number, connection.id)]))
+
+    return selections
+
+
+def read_selected_messages(bag, selection):
+    """
+    Iterate chronologically the messages behind selected index entries of an open bag.
+
+    Only chunks holding a selected message are read and decompressed.
+    """
+    gens = [zip(entries, itertools.repeat(connection)) for connection, entries in selection]
+    chunk_pos = -1
+    chunk = None
+    for entry, connection in heapq.merge(*gens, key=lambda x: x[0].time):
+        if entry.chunk_pos != chunk_pos:
+            chunk_header = bag.chunks[entry.chunk_pos]
+            bag.bio.seek(chunk_header.datapos)
+            chunk = io.BytesIO(chunk_header.decompressor(bag.bio.read(chunk_header.datasize)))
+            chunk_pos = entry.chunk_pos
+
+        chunk.seek(entry.offset)
+        # connection records may precede the message data record
+        while True:
+            header, data = bag_index.read_record(chunk)
+            if bag_index.parse_header(header)["op"][0] != bag_index.OP_CONNECTION:
+                break
+        yield connection, entry.time, data
+
+
+def merge_selected_messages(stack, bags, selections, queue_depth=0):
+    """
+    Iterate chronologically the selected messages of open bags.
+
+    With a queue_depth above zero, every bag is read ahead by its own prefetch
+    worker, entered into stack, and the merge consumes the buffered batches.
+    """
+    gens = []
+    for bag, selection in zip(bags, selections):
+        if selection:
+            gen = read_selected_messages(bag, selection)
+            if queue_depth > 0:
+                gen = stack.enter_context(prefetch_messages(gen, queue_depth))
+            gens.append(gen)
+
+    prev_time = 0
+
+    for connection, timestamp, data in heapq.merge(*gens, key=lambda x: x[1]):
+        assert timestamp >= prev_time, (repr(timestamp), repr(prev_time))
+        yield connection, timestamp, data
+        prev_time = timestamp
+
+
+def read_messages(
+    paths,
+    topics=None,
+    start_time=None,
+    end_time=None,
+    queue_depth=0,
+    max_rates=None,
+    keep_every=None,
+):
+    """
+    Iterate chronologically raw BagMessage for topic from paths.
+
+    With a queue_depth above zero, every input bag is read ahead by its own
+    prefetch worker and the merge consumes the buffered batches. max_rates and
+    keep_every map topics (or '*' for all topics) to a maximum rate in Hz and
+    to keeping every Nth message of the merged messages of the topic.
+    """
     if not topics:
         topics = None
 
     with ExitStack() as stack:
         bags = [stack.enter_context(open_rosbag1(path)) for path in paths]
-        gens = []
-        for bag in bags:
-            valid_connections = []
-            if topics is None:
-                # connect to all topics
-                valid_connections = [x for x in bag.connections]
-            else:
-                valid_connections = [x for x in bag.connections if x.topic in topics]
-
-            if valid_connections:
-                gens.append(
-                    bag.messages(
-                        connections=valid_connections,
-                        start=start_time,
-                        stop=end_time,
-                    )
+        selections = select_messages(bags, topics, start_time, end_time, max_rates, keep_every)
+        yield from merge_selected_messages(stack, bags, selections, queue_depth)
+
+
+MD5_DEFAULT = str(hashlib.md5())
+
+# chunk compressions each output format can write
+OUTPUT_COMPRESSIONS = {
+    "bag": ("none", "bz2", "lz4"),
+    "mcap": tuple(mcap_output.McapWriter.COMPRESSIONS),
+}
+
+
+def write_merged_bag(
+    input_bags: "list[str]",
+    topics: "list[str]",
+    full_bag_path: str,
+    prefetch_depth: int = 0,
+    desc: str = "Writing New Bag",
+    start_time: "int | None" = None,
+    end_time: "int | None" = None,
+    max_rates: "dict[str, float] | None" = None,
+    keep_every: "dict[str, int] | None" = None,
+    compression: "str | None" = None,
+    chunk_size: "int | None" = None,
+    output_format: str = "bag",
+) -> int:
+    """
+    Merge the messages of input_bags in timestamp order into a new bag.
+
+    start_time and end_time are absolute timestamps in nanoseconds. See
+    read_messages for max_rates and keep_every. The new bag compresses its
+    chunks with compression ('none', 'bz2' or 'lz4', uncompressed if unset),
+    starting a new chunk once chunk_size bytes of messages have been collected.
+    With output_format 'mcap', an MCAP file is written instead, with 'none',
+    'lz4' or 'zstd' chunk compression.
+
+    Returns:
+        Number of messages written.
+    """
+    if output_format == "mcap":
+        output_bag = mcap_output.McapWriter(full_bag_path)
+        if compression:
+            output_bag.set_compression(compression)
+    else:
+        output_bag = Writer(full_bag_path)
+        if compression and compression != "none":
+            output_bag.set_compression(Writer.CompressionFormat[compression.upper()])
+    if chunk_size:
+        output_bag.chunk_threshold = chunk_size
+
+    # open the output bag in an automatically closing context
+    with output_bag, ExitStack() as stack:
+        conn_map = {}
+        total = 0
+
+        # register output connections and size the progress bar from the
+        # connection records and message index of the input bags, so that
+        # message payloads are only read once, while writing
+        bags = [stack.enter_context(open_rosbag1(bag_name)) for bag_name in input_bags]
+        selections = select_messages(bags, topics or None, start_time, end_time, max_rates, keep_every)
+        for selection in selections:
+            for connection, entries in selection:
+                total += len(entries)
+                if connection.topic in conn_map:
+                    continue
+                conn_map[connection.topic] = output_bag.add_connection(
+                    topic=connection.topic,
+                    msgtype=connection.msgtype,
+                    # newer rosbags releases wrap the definition text in a MessageDefinition
+                    msgdef=getattr(connection.msgdef, "data", connection.msgdef),
+                    # connection.digest found to be used in writer.py - > write_connection(..)
+                    md5sum=connection.digest,
+                    callerid=connection.ext.callerid,
+                    latching=connection.ext.latching,
                 )
 
-        prev_time = 0
+        message_counter = 0
+        byte_counter = 0
+        start = time.monotonic()
+        for connection, timestamp, rawdata in tqdm(
+            merge_selected_messages(stack, bags, selections, prefetch_depth),
+            desc=desc,
+            bar_format="{l_bar}{bar}{r_bar}",
+            total=total,
+        ):
+            # write this message to the output bag
+            message_counter += 1
+            byte_counter += len(rawdata)
+            output_bag.write(conn_map[connection.topic], timestamp, rawdata)
+        elapsed = max(time.monotonic() - start, 1e-9)
+        print(
+            f"Merged {message_counter} messages ({byte_counter / 1e6:.1f} MB) in {elapsed:.2f} s "
+            f"with prefetch depth {prefetch_depth}: {message_counter / elapsed:.0f} msg/s, "
+            f"{byte_counter / 1e6 / elapsed:.1f} MB/s"
+        )
+    return message_counter
 
-        for connection, time, data in heapq.merge(*gens, key=lambda x: x[1]):
-            assert time >= prev_time, (repr(time), repr(prev_time))
-            yield connection, time, data
-            prev_time = time
 
+def can_copy_chunks(
+    start_time=None, end_time=None, max_rates=None, keep_every=None, chunk_size=None, output_format="bag"
+):
+    """
+    Check whether the merge settings allow copying the chunks of the inputs verbatim.
 
-MD5_DEFAULT = str(hashlib.md5())
+    Copied chunks keep all their messages and their size, so this needs bag
+    output without a time window, thinning or a chunk size.
+    """
+    return (
+        output_format == "bag"
+        and start_time is None
+        and end_time is None
+        and not max_rates
+        and not keep_every
+        and not chunk_size
+    )
+
+
+def merge_bags(
+    input_bags: "list[str]",
+    topics: "list[str]",
+    full_bag_path: str,
+    prefetch_depth: int = 0,
+    desc: str = "Writing New Bag",
+    start_time: "int | None" = None,
+    end_time: "int | None" = None,
+    max_rates: "dict[str, float] | None" = None,
+    keep_every: "dict[str, int] | None" = None,
+    compression: "str | None" = None,
+    chunk_size: "int | None" = None,
+    output_format: str = "bag",
+) -> int:
+    """
+    Merge input_bags into a new bag, copying chunks verbatim when the bags do not overlap in time.
+
+    Copied chunks keep their size and compression, so when a compression is
+    requested, chunks are only copied if they are already compressed that way,
+    and a chunk_size always rewrites them.
+
+    Returns:
+        Number of messages in the new bag.
+    """
+    # bags that follow each other in time are concatenated chunk by chunk,
+    # unless messages have to be picked individually
+    copy_order = None
+    if can_copy_chunks(start_time, end_time, max_rates, keep_every, chunk_size, output_format):
+        copy_order = chunk_copy.get_copy_order(
+            [bag_index.read_bag_index(x) for x in input_bags], topics, compression
+        )
+    if copy_order:
+        print("Input bags do not overlap in time, copying their chunks without decoding messages.")
+        start = time.monotonic()
+        message_counter = chunk_copy.copy_chunks(copy_order, full_bag_path)
+        elapsed = max(time.monotonic() - start, 1e-9)
+        byte_counter = os.path.getsize(full_bag_path)
+        print(
+            f"Copied {message_counter} messages ({byte_counter / 1e6:.1f} MB) in {elapsed:.2f} s: "
+            f"{byte_counter / 1e6 / elapsed:.1f} MB/s"
+        )
+        return message_counter
+
+    return write_merged_bag(
+        input_bags,
+        topics,
+        full_bag_path,
+        prefetch_depth,
+        desc,
+        start_time,
+        end_time,
+        max_rates,
+        keep_every,
+        compression,
+        chunk_size,
+        output_format,
+    )
+
+
+def merge_in_levels(
+    input_bags: "list[str]",
+    topics: "list[str]",
+    full_bag_path: str,
+    max_fan_in: int,
+    prefetch_depth: int = 0,
+    start_time: "int | None" = None,
+    end_time: "int | None" = None,
+    max_rates: "dict[str, float] | None" = None,
+    keep_every: "dict[str, int] | None" = None,
+    compression: "str | None" = None,
+    chunk_size: "int | None" = None,
+    output_format: str = "bag",
+) -> int:
+    """
+    Merge any number of bags while opening at most max_fan_in of them at a time.
+
+    Inputs are sorted by start time and merged in groups of max_fan_in into
+    intermediate bags, level by level, until one final merge remains. The
+    intermediate bags live in a temporary directory next to the output bag.
+    Only the final merge writes output_format, intermediate levels are rosbags.
+    The first level applies the time window, and the final merge thins the
+    merged messages with max_rates and keep_every.
+
+    Returns:
+        Number of messages in the new bag.
+    """
+    if max_fan_in < 2:
+        raise ValueError(f"max_fan_in must be at least 2, got {max_fan_in}")
+
+    def first_timestamp(path):
+        index = bag_index.read_bag_index(path)
+        return index.start_time if index.chunk_infos else 0
+
+    filters = dict(start_time=start_time, end_time=end_time)
+    # thinning a run of bags would limit each run instead of the merged messages
+    thinning = dict(max_rates=max_rates, keep_every=keep_every)
+    # intermediate bags use the output compression, so the last level can still copy their chunks
+    output = dict(compression=compression, chunk_size=chunk_size)
+    if output_format != "bag":
+        output = dict(chunk_size=chunk_size)
+    final_output = dict(compression=compression, chunk_size=chunk_size, output_format=output_format)
+
+    if len(input_bags) <= max_fan_in:
+        return merge_bags(input_bags, topics, full_bag_path, prefetch_depth, **filters, **thinning, **final_output)
+
+    with tempfile.TemporaryDirectory(
+        prefix=".merge_", dir=os.path.dirname(full_bag_path)
+    ) as tmp_dir:
+        level = 0
+        while len(input_bags) > max_fan_in:
+            level += 1
+            # neighbouring bags in time end up in the same run, which keeps
+            # runs apart in time and lets the next level copy their chunks
+            input_bags = sorted(input_bags, key=first_timestamp)
+            runs = []
+            for i in range(0, len(input_bags), max_fan_in):
+                run_path = os.path.join(tmp_dir, f"level{level}_{len(runs)}.bag")
+                merge_bags(
+                    input_bags[i : i + max_fan_in],
+                    topics,
+                    run_path,
+                    prefetch_depth,
+                    desc=f"Merging Level {level} Run {len(runs) + 1}",
+                    **filters,
+                    **output,
+                )
+                runs.append(run_path)
+
+            # runs of the previous level are no longer needed
+            for bag_name in input_bags:
+                if os.path.dirname(bag_name) == tmp_dir:
+                    os.remove(bag_name)
+            input_bags = runs
+            # messages were already filtered by the first level
+            topics = []
+            filters = {}
+
+        return merge_bags(input_bags, topics, full_bag_path, prefetch_depth, **filters, **thinning, **final_output)
+
+
+def get_window(indexes, start_time=None, end_time=None):
+    """
+    Convert a window in seconds since the earliest message of all bags to absolute bag timestamps.
+
+    Returns:
+        Tuple of start and end timestamp (ns), None where no bound was given.
+    """
+    first_ns = min((x.start_time for x in indexes if x.chunk_infos), default=0)
+    start_ns = first_ns + int(start_time * 1e9) if start_time is not None else None
+    end_ns = first_ns + int(end_time * 1e9) if end_time is not None else None
+    return start_ns, end_ns
 
 
 def main(
@@ -79,60 +551,71 @@ def main(
     output_path: str,
     outbag_name: str,
     exists_ok: bool,
+    prefetch_depth: int = 0,
+    max_fan_in: int = 64,
+    start_time: "float | None" = None,
+    end_time: "float | None" = None,
+    max_rates: "dict[str, float] | None" = None,
+    keep_every: "dict[str, int] | None" = None,
+    compression: "str | None" = None,
+    chunk_size: "int | None" = None,
+    output_format: str = "bag",
 ):
+    """
+    Merge input_bags into output_path/outbag_name.
+
+    start_time and end_time are in seconds since the earliest message of all
+    input bags. max_rates and keep_every map topics, or '*' for all topics, to
+    a maximum rate in Hz and to keeping only every Nth message. compression
+    ('none', 'bz2' or 'lz4') and chunk_size (bytes) configure the chunks of
+    the merged bag; chunks copied verbatim keep their compression when no
+    compression is given. output_format 'mcap' writes outbag_name as an MCAP
+    file in the same pass, with 'none', 'lz4' or 'zstd' compression.
+    """
+    if output_format not in OUTPUT_COMPRESSIONS:
+        raise ValueError(f"Unsupported output format {output_format!r}")
+    if compression and compression not in OUTPUT_COMPRESSIONS[output_format]:
+        raise ValueError(
+            f"Compression {compression!r} is not supported for {output_format} output, "
+            f"use one of {', '.join(OUTPUT_COMPRESSIONS[output_format])}"
+        )
+
     try:
-        if outbag_name.endswith(".bag"):
-            outbag_name = outbag_name[:-4]
-        full_bag_path = os.path.join(output_path, outbag_name + ".bag")
+        extension = "." + output_format
+        outbag_name, ext = os.path.splitext(outbag_name)
+        if ext not in (".bag", ".mcap"):
+            outbag_name += ext
+        full_bag_path = os.path.join(output_path, outbag_name + extension)
         # clean up the preexisting bag when the exists_okay flag is present
         if exists_ok and os.path.exists(full_bag_path):
             os.remove(full_bag_path)
             for bag_name in input_bags:
-                if os.path.basename(bag_name) == outbag_name + ".bag":
+                if os.path.basename(bag_name) == outbag_name + extension:
                     input_bags.remove(bag_name)
 
-        # open the output bag in an automatically closing context
-        with Writer(full_bag_path) as output_bag:
-            conn_map = {}
-
-            def read_messages_generator():
-                return read_messages(input_bags, topics=topics)
-
-            total = len(list(read_messages_generator()))
-            # process messages across input bag(s)
-            for connection, timestamp, rawdata in tqdm(
-                read_messages_generator(),
-                desc="Reading Bags",
-                bar_format="{l_bar}{bar}{r_bar}",
-                total=total,
-            ):
-                # make dict for safe gets of connection attributes
-                try:
-                    conn_map[connection.topic] = output_bag.add_connection(
-                        topic=connection.topic,
-                        msgtype=connection.msgtype,
-                        msgdef=connection.msgdef,
-                        # connection.digest found to be used in writer.py - > write_connection(..)
-                        md5sum=connection.digest,
-                        callerid=connection.ext.callerid,
-                        latching=connection.ext.latching,
-                    )
-                except WriterError:
-                    pass
-            message_counter = 0
-            for connection, timestamp, rawdata in tqdm(
-                read_messages_generator(),
-                desc="Writing New Bag",
-                bar_format="{l_bar}{bar}{r_bar}",
-                total=total,
-            ):
-                # write this message to the output bag
-                message_counter += 1
-                output_bag.write(conn_map[connection.topic], timestamp, rawdata)
-            if message_counter == 0:
-                raise WriterError(
-                    "No messages were written to the output bag. Verify that requested topics exist in the input bag(s)."
-                )
+        start_ns = end_ns = None
+        if start_time is not None or end_time is not None:
+            indexes = [bag_index.read_bag_index(x) for x in input_bags]
+            start_ns, end_ns = get_window(indexes, start_time, end_time)
+
+        message_counter = merge_in_levels(
+            input_bags,
+            topics,
+            full_bag_path,
+            max_fan_in,
+            prefetch_depth,
+            start_time=start_ns,
+            end_time=end_ns,
+            max_rates=max_rates,
+            keep_every=keep_every,
+            compression=compression,
+            chunk_size=chunk_size,
+            output_format=output_format,
+        )
+        if message_counter == 0:
+            raise WriterError(
+                "No messages were written to the output bag. Verify that requested topics exist in the input bag(s)."
+            )
     except KeyboardInterrupt:
         pass
     finally:
@@ -0,0 +1,187 @@
+"""
+Benchmarks the throughput of bag_stream.main for different merge settings.
+
+The prefetch suite compares read-ahead depths, the compression suite chunk
+compressions and sizes, including the cost of random reads in the output:
+
+    ./scripts/benchmark.sh /path/to/bags compression --compressions none,lz4 --chunk_sizes 1048576
+"""
+
+import argparse
+import glob
+import os
+import random
+import tempfile
+import time
+
+from rosbags.rosbag1 import Reader
+
+from . import bag_stream
+
+
+def time_merge(input_bags, topics, scratch_dir=None, **kwargs):
+    """
+    Merge input_bags into a temporary bag.
+
+    Returns:
+        Tuple of the wall-clock time in seconds and the size of the merged bag in bytes.
+    """
+    with tempfile.TemporaryDirectory(dir=scratch_dir) as tmp_dir:
+        start = time.monotonic()
+        bag_stream.main(list(input_bags), topics, tmp_dir, "benchmark.bag", True, **kwargs)
+        elapsed = time.monotonic() - start
+        size = os.path.getsize(os.path.join(tmp_dir, "benchmark.bag"))
+    return elapsed, size
+
+
+def time_random_reads(bag_path, reads, seed=0):
+    """Mean wall-clock time in milliseconds to read the first message at or after a random timestamp."""
+    rng = random.Random(seed)
+    with Reader(bag_path) as bag:
+        start, end = bag.start_time, bag.end_time
+        begin = time.monotonic()
+        for _ in range(reads):
+            next(bag.messages(start=rng.randrange(start, end)), None)
+        return (time.monotonic() - begin) * 1000 / reads
+
+
+def benchmark_compression(input_bags, topics, compressions, chunk_sizes, repeat, reads, scratch_dir=None):
+    """Compare write throughput, output size and random-seek read cost of chunk settings."""
+    input_mb = sum(os.path.getsize(x) for x in input_bags) / 1e6
+    rows = []
+    for compression in compressions:
+        for chunk_size in chunk_sizes:
+            elapsed = None
+            for _ in range(repeat):
+                with tempfile.TemporaryDirectory(dir=scratch_dir) as tmp_dir:
+                    start = time.monotonic()
+                    bag_stream.main(
+                        list(input_bags),
+                        topics,
+                        tmp_dir,
+                        "benchmark.bag",
+                        True,
+                        compression=compression,
+                        chunk_size=chunk_size,
+                    )
+                    run = time.monotonic() - start
+                    elapsed = run if elapsed is None else min(elapsed, run)
+                    bag_path = os.path.join(tmp_dir, "benchmark.bag")
+                    size = os.path.getsize(bag_path)
+                    seek_ms = time_random_reads(bag_path, reads)
+            rows.append((compression, chunk_size, elapsed, size, seek_ms))
+
+    print(f"\nMerged {len(input_bags)} bags ({input_mb:.1f} MB), best of {repeat} runs, {reads} random reads")
+    print(f"{'compression':>11} {'chunk_size':>10} {'seconds':>9} {'MB/s':>9} {'size MB':>9} {'ratio':>6} {'ms/read':>8}")
+    for compression, chunk_size, elapsed, size, seek_ms in rows:
+        print(
+            f"{compression:>11} {chunk_size:>10} {elapsed:>9.2f} {input_mb / elapsed:>9.1f} "
+            f"{size / 1e6:>9.1f} {size / 1e6 / input_mb:>6.2f} {seek_ms:>8.2f}"
+        )
+    return rows
+
+
+def benchmark_prefetch(input_bags, topics, prefetch_depths, repeat, scratch_dir=None):
+    """Compare the serial merge (depth 0) with pipelined read-ahead of increasing depth."""
+    input_mb = sum(os.path.getsize(x) for x in input_bags) / 1e6
+    rows = []
+    for depth in prefetch_depths:
+        elapsed = min(
+            time_merge(input_bags, topics, scratch_dir, prefetch_depth=depth)[0]
+            for _ in range(repeat)
+        )
+        rows.append((depth, elapsed))
+
+    baseline = rows[0][1]
+    print(f"\nMerged {len(input_bags)} bags ({input_mb:.1f} MB), best of {repeat} runs")
+    print(f"{'prefetch_depth':>14} {'seconds':>9} {'MB/s':>9} {'speedup':>8}")
+    for depth, elapsed in rows:
+        print(f"{depth:>14} {elapsed:>9.2f} {input_mb / elapsed:>9.1f} {baseline / elapsed:>7.2f}x")
+    return rows
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "suite",
+    choices=["prefetch", "compression"],
+    help="Which merge setting to benchmark",
+)
+parser.add_argument(
+    "-i",
+    "--input-dir",
+    dest="input_dir",
+    required=False,
+    help="Directory containing the rosbags to merge",
+    default=os.environ.get("ROBOTO_INPUT_DIR"),
+)
+parser.add_argument(
+    "--topics",
+    type=str,
+    required=False,
+    help="Comma-separated list of topics to be merged. If empty, all topics are merged",
+)
+parser.add_argument(
+    "--prefetch_depths",
+    type=str,
+    required=False,
+    help="Comma-separated prefetch depths to compare. The first one is the baseline",
+    default="0,1,4,16",
+)
+parser.add_argument(
+    "--compressions",
+    type=str,
+    required=False,
+    help="Comma-separated chunk compressions to compare",
+    default="none,lz4,bz2",
+)
+parser.add_argument(
+    "--chunk_sizes",
+    type=str,
+    required=False,
+    help="Comma-separated chunk sizes in bytes to compare",
+    default="262144,1048576,4194304",
+)
+parser.add_argument(
+    "--reads",
+    type=int,
+    required=False,
+    help="Number of random-seek reads per merged bag",
+    default=100,
+)
+parser.add_argument(
+    "--repeat",
+    type=int,
+    required=False,
+    help="Number of runs per setting, the fastest one is reported",
+    default=3,
+)
+parser.add_argument(
+    "--scratch_dir",
+    type=str,
+    required=False,
+    help="Directory for the temporary merged bags. Defaults to the system temp directory",
+)
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    bags = sorted(glob.glob(os.path.join(args.input_dir, "*.bag")))
+    topics_list = args.topics.replace(" ", "").split(",") if args.topics else []
+
+    if args.suite == "prefetch":
+        benchmark_prefetch(
+            bags,
+            topics_list,
+            [int(x) for x in args.prefetch_depths.split(",")],
+            args.repeat,
+            args.scratch_dir,
+        )
+    elif args.suite == "compression":
+        benchmark_compression(
+            bags,
+            topics_list,
+            args.compressions.split(","),
+            [int(x) for x in args.chunk_sizes.split(",")],
+            args.repeat,
+            args.reads,
+            args.scratch_dir,
+        )
@@ -0,0 +1,142 @@
+"""
+
+Merges rosbags whose time ranges do not overlap by copying their chunks verbatim.
+
+Consecutive split recordings (_0.bag, _1.bag, ...) can be concatenated at the
+chunk level: the chunk and index data records of every input are copied as they
+are, and only the connection and chunk info records of the index section are
+rebuilt. No message is decompressed, decoded or re-encoded.
+
+"""
+
+from typing import List, Optional
+
+from rosbags.rosbag1 import WriterError
+
+from . import bag_index
+from .bag_index import BagIndex
+
+COPY_BLOCK_SIZE = 64 * (1 << 20)
+
+
+def get_copy_order(
+    indexes: List[BagIndex],
+    topics: Optional[List[str]] = None,
+    compression: Optional[str] = None,
+) -> Optional[List[BagIndex]]:
+    """
+    Check whether the given bags can be merged by copying their chunks.
+
+    This requires that all connections are merged (no topic filtering), that
+    connection ids mean the same connection in every bag, and that the time
+    ranges of the bags do not overlap. If compression is given, every chunk
+    must already be compressed that way.
+
+    Returns:
+        The bags with messages in chronological order, or None if the chunks cannot be copied.
+    """
+    indexes = [x for x in indexes if x.chunk_infos]
+    if not indexes:
+        return None
+
+    connections = {}
+    for index in indexes:
+        for conn, record in index.connections.items():
+            if topics and record.topic not in topics:
+                return None
+            if connections.setdefault(conn, record.raw) != record.raw:
+                return None
+
+    indexes = sorted(indexes, key=lambda x: x.start_time)
+    for previous, following in zip(indexes, indexes[1:]):
+        if previous.end_time >= following.start_time:
+            return None
+
+    if compression:
+        for index in indexes:
+            if bag_index.read_chunk_compressions(index) != {compression}:
+                return None
+    return indexes
+
+
+def copy_range(src, dst, length: int) -> None:
+    """Copy length bytes from the current position of src to dst."""
+    while length > 0:
+        block = src.read(min(COPY_BLOCK_SIZE, length))
+        if not block:
+            raise WriterError(f"Unexpected end of file in {src.name}.")
+        dst.write(block)
+        length -= len(block)
+
+
+def write_bag_header(dst, index_pos: int, conn_count: int, chunk_count: int) -> None:
+    """Write the bag header record padded to the standard size."""
+    header = bag_index.serialize_header(
+        {
+            "op": bytes([bag_index.OP_BAG_HEADER]),
+            "index_pos": bag_index.UINT64.pack(index_pos),
+            "conn_count": bag_index.UINT32.pack(conn_count),
+            "chunk_count": bag_index.UINT32.pack(chunk_count),
+        }
+    )
+    padsize = bag_index.BAG_HEADER_SIZE - len(header) - 4
+    dst.write(header + bag_index.UINT32.pack(padsize) + b" " * padsize)
+
+
+def write_chunk_info(dst, chunk_info: bag_index.ChunkInfoRecord, chunk_pos: int) -> None:
+    """Write a chunk info record pointing at chunk_pos in the output bag."""
+    header = bag_index.serialize_header(
+        {
+            "op": bytes([bag_index.OP_CHUNK_INFO]),
+            "ver": bag_index.UINT32.pack(1),
+            "chunk_pos": bag_index.UINT64.pack(chunk_pos),
+            "start_time": bag_index.pack_time(chunk_info.start_time),
+            "end_time": bag_index.pack_time(chunk_info.end_time),
+            "count": bag_index.UINT32.pack(len(chunk_info.connection_counts)),
+        }
+    )
+    data = b"".join(
+        bag_index.UINT32.pack(conn) + bag_index.UINT32.pack(count)
+        for conn, count in chunk_info.connection_counts.items()
+    )
+    dst.write(header + bag_index.UINT32.pack(len(data)) + data)
+
+
+def copy_chunks(indexes: List[BagIndex], full_bag_path: str) -> int:
+    """
+    Concatenate the chunks of chronologically ordered, non-overlapping bags.
+
+    Returns:
+        Number of messages in the output bag.
+    """
+    connections = {}
+    chunk_infos = []
+    message_counter = 0
+
+    with open(full_bag_path, "xb") as dst:
+        dst.write(bag_index.BAG_MAGIC)
+        write_bag_header(dst, 0, 0, 0)
+
+        for index in indexes:
+            # chunks and their index data records sit between the first chunk and the index section
+            offset = dst.tell() - index.data_pos
+            with open(index.path, "rb") as src:
+                src.seek(index.data_pos)
+                copy_range(src, dst, index.index_pos - index.data_pos)
+
+            for conn, record in index.connections.items():
+                connections.setdefault(conn, record)
+            for chunk_info in index.chunk_infos:
+                chunk_infos.append((chunk_info, chunk_info.chunk_pos + offset))
+                message_counter += sum(chunk_info.connection_counts.values())
+
+        index_pos = dst.tell()
+        for record in connections.values():
+            dst.write(record.raw)
+        for chunk_info, chunk_pos in chunk_infos:
+            write_chunk_info(dst, chunk_info, chunk_pos)
+
+        dst.seek(len(bag_index.BAG_MAGIC))
+        write_bag_header(dst, index_pos, len(connections), len(chunk_infos))
+
+    return message_counter
@@ -0,0 +1,127 @@
+"""
+
+Writes merged messages to an MCAP file instead of a rosbag.
+
+Messages keep their ROS1 serialization, so the time-ordered output of
+bag_stream.read_messages is written as it is, into compressed chunks with a
+message index and summary section, following the MCAP ros1 profile.
+
+"""
+
+from typing import Dict, Optional, Tuple
+
+from mcap.writer import CompressionType
+from mcap.writer import Writer as _McapWriter
+from rosbags.rosbag1 import WriterError
+
+
+class McapWriter:
+    """
+    MCAP counterpart of rosbags.rosbag1.Writer for the calls made by the merge.
+
+    Usage:
+        writer = McapWriter("merged.mcap")
+        writer.set_compression("zstd")
+        with writer:
+            channel = writer.add_connection("/imu", "sensor_msgs/msg/Imu", msgdef, md5sum)
+            writer.write(channel, timestamp, rawdata)
+    """
+
+    COMPRESSIONS = {
+        "none": CompressionType.NONE,
+        "lz4": CompressionType.LZ4,
+        "zstd": CompressionType.ZSTD,
+    }
+
+    def __init__(self, path: str):
+        self.path = path
+        self.compression = CompressionType.NONE
+        self.chunk_threshold = 1 << 20
+        self.file = None
+        self.writer: Optional[_McapWriter] = None
+        self.schemas: Dict[Tuple[str, str], int] = {}
+        self.sequences: Dict[int, int] = {}
+
+    def set_compression(self, compression: str) -> None:
+        if self.writer:
+            raise WriterError(f"Cannot set compression, {self.path} is already open.")
+        if compression not in self.COMPRESSIONS:
+            raise WriterError(
+                f"Unsupported MCAP compression {compression!r}, use one of {', '.join(self.COMPRESSIONS)}."
+            )
+        self.compression = self.COMPRESSIONS[compression]
+
+    def open(self) -> None:
+        self.file = open(self.path, "xb")
+        self.writer = _McapWriter(
+            self.file,
+            chunk_size=self.chunk_threshold,
+            compression=self.compression,
+        )
+        self.writer.start(profile="ros1", library="merge_rosbags")
+
+    def close(self) -> None:
+        if self.writer:
+            self.writer.finish()
+            self.writer = None
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add_connection(
+        self,
+        topic: str,
+        msgtype: str,
+        msgdef: str,
+        md5sum: str,
+        callerid: Optional[str] = None,
+        latching: Optional[int] = None,
+    ) -> int:
+        """
+        Register a channel and, if needed, the schema of its message type.
+
+        Returns:
+            Channel id to pass to write.
+        """
+        if not self.writer:
+            raise WriterError(f"{self.path} is not open.")
+
+        # the ros1 profile names schemas like rosbag connections, e.g. sensor_msgs/Image
+        msgtype = msgtype.replace("/msg/", "/")
+        key = (msgtype, msgdef)
+        if key not in self.schemas:
+            self.schemas[key] = self.writer.register_schema(
+                name=msgtype, encoding="ros1msg", data=msgdef.encode()
+            )
+
+        metadata = {"md5sum": md5sum}
+        if callerid is not None:
+            metadata["callerid"] = callerid
+        if latching is not None:
+            metadata["latching"] = str(int(latching))
+        channel_id = self.writer.register_channel(
+            topic=topic,
+            message_encoding="ros1",
+            schema_id=self.schemas[key],
+            metadata=metadata,
+        )
+        self.sequences[channel_id] = 0
+        return channel_id
+
+    def write(self, channel_id: int, timestamp: int, data: bytes) -> None:
+        """Write one ROS1 serialized message, using its bag timestamp as log and publish time."""
+        self.writer.add_message(
+            channel_id=channel_id,
+            log_time=timestamp,
+            data=data,
+            publish_time=timestamp,
+            sequence=self.sequences[channel_id],
+        )
+        self.sequences[channel_id] += 1
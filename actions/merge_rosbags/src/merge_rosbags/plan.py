@@ -0,0 +1,203 @@
+"""
+
+Plans a merge from the index sections of the input bags alone.
+
+Reports the topics, message counts, time span and estimated size of the bag a
+merge would write, and where the inputs overlap in time, without reading any
+message data. Messages are selected from the message index of the inputs as
+the merge selects them.
+
+"""
+
+import json
+import math
+import os
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+from typing import Dict, List
+
+from . import bag_index, chunk_copy
+from .bag_index import BagIndex
+from .bag_stream import can_copy_chunks, get_window, open_rosbag1, select_messages
+
+
+def to_seconds(timestamp: int) -> float:
+    return timestamp / 1e9
+
+
+def get_chunk_sizes(index: BagIndex) -> List[int]:
+    """Bytes taken by every chunk and its index data records, in chunk info order."""
+    positions = sorted(x.chunk_pos for x in index.chunk_infos) + [index.index_pos]
+    sizes = {pos: end - pos for pos, end in zip(positions, positions[1:])}
+    return [sizes[x.chunk_pos] for x in index.chunk_infos]
+
+
+def overlap_pairs(indexes: List[BagIndex]) -> List[dict]:
+    """Time ranges shared by each pair of bags."""
+    overlaps = []
+    for i, first in enumerate(indexes):
+        for second in indexes[i + 1 :]:
+            start = max(first.start_time, second.start_time)
+            end = min(first.end_time, second.end_time)
+            if start <= end:
+                overlaps.append(
+                    {
+                        "bags": [os.path.basename(first.path), os.path.basename(second.path)],
+                        "start_time": to_seconds(start),
+                        "end_time": to_seconds(end),
+                        "duration": to_seconds(end - start),
+                    }
+                )
+    return overlaps
+
+
+def count_merge_levels(bag_count: int, max_fan_in: int) -> int:
+    levels = 1
+    while bag_count > max_fan_in:
+        bag_count = math.ceil(bag_count / max_fan_in)
+        levels += 1
+    return levels
+
+
+def build_plan(
+    input_bags: "list[str]",
+    topics: "list[str] | None" = None,
+    start_time: "float | None" = None,
+    end_time: "float | None" = None,
+    max_rates: "dict[str, float] | None" = None,
+    keep_every: "dict[str, int] | None" = None,
+    max_fan_in: int = 64,
+    compression: "str | None" = None,
+    chunk_size: "int | None" = None,
+    output_format: str = "bag",
+) -> dict:
+    """
+    Describe the bag that merging input_bags with the given settings would write.
+
+    Arguments match bag_stream.main. Message counts and time spans are those
+    of the merged bag, as messages are selected by bag_stream.select_messages.
+    The estimated size is prorated from the on-disk size of the input chunks,
+    so recompressing with a different compression will change it.
+
+    Returns:
+        JSON-serializable plan.
+    """
+    indexes = [bag_index.read_bag_index(x) for x in input_bags]
+    indexes = [x for x in indexes if x.chunk_infos]
+    start_ns, end_ns = get_window(indexes, start_time, end_time)
+
+    # on-disk bytes and number of all messages of every topic
+    topic_sizes: Dict[str, float] = defaultdict(float)
+    topic_counts: Dict[str, int] = defaultdict(int)
+    bags = []
+    for index in indexes:
+        bags.append(
+            {
+                "path": os.path.basename(index.path),
+                "start_time": to_seconds(index.start_time),
+                "end_time": to_seconds(index.end_time),
+                "message_count": sum(index.message_counts().values()),
+                "chunk_count": len(index.chunk_infos),
+                "size": index.file_size,
+            }
+        )
+        for chunk_info, chunk_bytes in zip(index.chunk_infos, get_chunk_sizes(index)):
+            chunk_count = sum(chunk_info.connection_counts.values())
+            for conn, count in chunk_info.connection_counts.items():
+                topic = index.connections[conn].topic
+                topic_sizes[topic] += chunk_bytes * count / chunk_count
+                topic_counts[topic] += count
+
+    # readers only hold their connections and message index while open
+    with ExitStack() as stack:
+        readers = [stack.enter_context(open_rosbag1(x.path)) for x in indexes]
+        selections = select_messages(readers, topics or None, start_ns, end_ns, max_rates, keep_every)
+
+    planned: Dict[str, dict] = {}
+    for selection in selections:
+        for connection, entries in selection:
+            topic = planned.setdefault(
+                connection.topic,
+                {
+                    "type": connection.msgtype,
+                    "message_count": 0,
+                    "start_time": entries[0].time,
+                    "end_time": entries[-1].time,
+                },
+            )
+            topic["message_count"] += len(entries)
+            topic["start_time"] = min(topic["start_time"], entries[0].time)
+            topic["end_time"] = max(topic["end_time"], entries[-1].time)
+
+    for name, topic in planned.items():
+        topic["estimated_size"] = round(topic_sizes[name] * topic["message_count"] / topic_counts[name])
+        topic["start_time"] = to_seconds(topic["start_time"])
+        topic["end_time"] = to_seconds(topic["end_time"])
+
+    plan = {
+        "bags": bags,
+        "topics": dict(sorted(planned.items())),
+        "overlaps": overlap_pairs(indexes),
+        "message_count": sum(x["message_count"] for x in planned.values()),
+        "start_time": min((x["start_time"] for x in planned.values()), default=None),
+        "end_time": max((x["end_time"] for x in planned.values()), default=None),
+        # bag header plus index section of the inputs
+        "estimated_size": bag_index.BAG_HEADER_SIZE
+        + sum(x["estimated_size"] for x in planned.values())
+        + sum(x.file_size - x.index_pos for x in indexes),
+        "merge_levels": count_merge_levels(len(input_bags), max_fan_in),
+        "chunk_copy": can_copy_chunks(start_time, end_time, max_rates, keep_every, chunk_size, output_format)
+        and chunk_copy.get_copy_order(indexes, topics, compression) is not None,
+    }
+    if plan["start_time"] is not None:
+        plan["duration"] = plan["end_time"] - plan["start_time"]
+    return plan
+
+
+def main(
+    input_bags: "list[str]",
+    topics: "list[str]",
+    output_path: str,
+    plan_name: str,
+    start_time: "float | None" = None,
+    end_time: "float | None" = None,
+    max_rates: "dict[str, float] | None" = None,
+    keep_every: "dict[str, int] | None" = None,
+    max_fan_in: int = 64,
+    compression: "str | None" = None,
+    chunk_size: "int | None" = None,
+    output_format: str = "bag",
+) -> str:
+    """
+    Write the plan for merging input_bags to output_path/plan_name as JSON.
+
+    Returns:
+        Path of the plan file.
+    """
+    start = time.perf_counter()
+    plan = build_plan(
+        input_bags,
+        topics,
+        start_time,
+        end_time,
+        max_rates,
+        keep_every,
+        max_fan_in,
+        compression,
+        chunk_size,
+        output_format,
+    )
+    elapsed = time.perf_counter() - start
+
+    plan_path = os.path.join(output_path, plan_name)
+    with open(plan_path, "w") as f:
+        json.dump(plan, f, indent=4)
+
+    print(
+        f"Planned merge of {len(input_bags)} bags in {elapsed * 1e3:.1f} ms: "
+        f"{plan['message_count']} messages on {len(plan['topics'])} topics, "
+        f"~{plan['estimated_size'] / 1e6:.1f} MB, {len(plan['overlaps'])} overlapping bag pairs."
+    )
+    print(f"Plan written to {plan_path}")
+    return plan_path
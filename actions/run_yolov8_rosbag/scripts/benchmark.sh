@@ -0,0 +1,12 @@
+#!/usr/bin/env bash
+
+set -euo pipefail
+
+SCRIPTS_ROOT=$( cd -- "$( dirname -- "${BASH_SOURCE[0]}" )" &> /dev/null && pwd)
+PACKAGE_ROOT=$(dirname "${SCRIPTS_ROOT}")
+
+# Usage: ./scripts/benchmark.sh [benchmark options]
+docker run --rm -it \
+    --entrypoint python3 \
+    run_yolov8_rosbag:latest \
+    -m run_yolov8_rosbag.benchmark "$@"
@@ -124,6 +124,49 @@ main() {
     clean_actual_output
     run_docker_test "-e ROBOTO_PARAM_TOPICS=/dvs/image_raw -e ROBOTO_PARAM_SAVE_VIDEO=True"
     file_exists_or_error $ACTUAL_OUTPUT_DIR/tiny/dvs_image_raw/video.mp4
+    check_file_does_not_exist $ACTUAL_OUTPUT_DIR/temp_imgs
+
+    # Test 8
+    echo "Running Test 8: Verify streaming detection"
+    clean_actual_output
+    run_docker_test "-e ROBOTO_PARAM_TOPICS=/dvs/image_raw -e ROBOTO_PARAM_STREAM=True"
+    file_exists_or_error $ACTUAL_OUTPUT_DIR/tiny/dvs_image_raw/imgs/detections.json
+    file_exists_or_error $ACTUAL_OUTPUT_DIR/tiny/dvs_image_raw/video.mp4
+    check_file_does_not_exist $ACTUAL_OUTPUT_DIR/tiny/dvs_image_raw/imgs/dvs_image_raw_000000.jpg
+    clean_actual_output
+    run_docker_test "-e ROBOTO_PARAM_TOPICS=/dvs/image_raw -e ROBOTO_PARAM_STREAM=True -e ROBOTO_PARAM_KEEP_IMAGES=True"
+    file_exists_or_error $ACTUAL_OUTPUT_DIR/tiny/dvs_image_raw/imgs/dvs_image_raw_000000.jpg
+
+    # Test 9
+    echo "Running Test 9: Verify motion-gated detection"
+    clean_actual_output
+    run_docker_test "-e ROBOTO_PARAM_TOPICS=/dvs/image_raw -e ROBOTO_PARAM_MOTION_THRESHOLD=255"
+    grep -q '"propagated_images": [1-9]' $ACTUAL_OUTPUT_DIR/tiny/dvs_image_raw/imgs/detections.json
+    if [ $? -eq 0 ]; then
+        echo "Test passed!"
+    else
+        echo "Test failed: no propagated images!"
+        exit 1
+    fi
+    file_exists_or_error $ACTUAL_OUTPUT_DIR/tiny/dvs_image_raw/video.mp4
+
+    # Test 10
+    echo "Running Test 10: Verify detection with parallel workers"
+    clean_actual_output
+    run_docker_test "--cpus 2 -e ROBOTO_PARAM_WORKERS=2"
+    file_exists_or_error $ACTUAL_OUTPUT_DIR/tiny/dvs_image_raw/imgs/detections.json
+    file_exists_or_error $ACTUAL_OUTPUT_DIR/tiny/dvs1_image_raw/imgs/detections.json
+    check_file_does_not_exist $ACTUAL_OUTPUT_DIR/temp_imgs
+
+    # Test 11
+    echo "Running Test 11: Verify columnar detections"
+    clean_actual_output
+    run_docker_test "-e ROBOTO_PARAM_TOPICS=/dvs/image_raw -e ROBOTO_PARAM_COLUMNAR_FORMAT=parquet"
+    file_exists_or_error $ACTUAL_OUTPUT_DIR/tiny/dvs_image_raw/imgs/detections.json
+    file_exists_or_error $ACTUAL_OUTPUT_DIR/tiny/dvs_image_raw/imgs/detections.parquet
+    clean_actual_output
+    run_docker_test "-e ROBOTO_PARAM_TOPICS=/dvs/image_raw -e ROBOTO_PARAM_STREAM=True -e ROBOTO_PARAM_COLUMNAR_FORMAT=npz"
+    file_exists_or_error $ACTUAL_OUTPUT_DIR/tiny/dvs_image_raw/imgs/detections.npz
 
 }
 
@@ -1,32 +1,27 @@
 import argparse
+import glob
 import os
 import pathlib
 import json
 import shutil
 import datetime
 import cv2
-from typing import Optional, List, Tuple, Union, Dict, Any
+import numpy as np
+from typing import Optional, List, Tuple, Dict, Any
 
 from roboto import ActionRuntime
 from roboto import Dataset, RobotoClient
 
-from robologs_ros_utils.sources.ros1 import argument_parsers, ros_utils, ros_img_tools
+from robologs_ros_utils.sources.ros1 import argument_parsers, ros_utils
 from robologs_ros_utils.utils import file_utils
-from ultralytics import YOLO
 
+from get_images_from_rosbag.checkpoint import get_rosbag_fingerprint
 
-ALLOWED_MODELS = [
-    "yolov8n",
-    "yolov8s",
-    "yolov8m",
-    "yolov8l",
-    "yolov8x",
-    "yolov8n-seg",
-    "yolov8s-seg",
-    "yolov8m-seg",
-    "yolov8l-seg",
-    "yolov8x-seg",
-]
+from . import backends, columnar, detection, frame_stream, model_registry, motion_gate, video_writer, worker_pool
+from .model_registry import ALLOWED_MODELS
+
+
+STATE_NAME = "detection_state.json"
 
 
 def count_detections(detections_data: Dict[str, Any]) -> Dict[str, int]:
@@ -48,8 +43,8 @@ def count_detections(detections_data: Dict[str, Any]) -> Dict[str, int]:
     # Loop through the images in the JSON
     for image, detections in detections_data["images"].items():
         # Loop through each detection in the image
-        for detection in detections:
-            object_name = detection["name"]
+        for image_detection in detections:
+            object_name = image_detection["name"]
             # Increment the count for each detected object
             if object_name in detection_counts:
                 detection_counts[object_name] += 1
@@ -80,6 +75,94 @@ def add_object_counts(dict1: Dict[str, int], dict2: Dict[str, int]) -> Dict[str,
     return combined_dict
 
 
+def load_state(bag_output_folder: str) -> Optional[Dict[str, Any]]:
+    """
+    Load the state of an earlier run written to the output folder of a rosbag.
+
+    Args:
+        bag_output_folder (str): Output folder of the rosbag.
+
+    Returns:
+        Dict[str, Any]: The fingerprint of the rosbag, the settings and whether
+        detection was completed, or None if there is no state.
+    """
+    try:
+        with open(os.path.join(bag_output_folder, STATE_NAME), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_state(bag_output_folder: str, state: Dict[str, Any]) -> None:
+    os.makedirs(bag_output_folder, exist_ok=True)
+    with open(os.path.join(bag_output_folder, STATE_NAME), "w") as f:
+        json.dump(state, f, indent=4)
+
+
+def should_skip_rosbag(rosbag_path: str, output_folder: str, settings: Dict[str, Any]) -> bool:
+    """
+    Check whether a rosbag was completely processed by an earlier run, and
+    start its state otherwise.
+
+    The output of an interrupted run with the same rosbag and settings is
+    kept, so that finished topics are not detected again.
+
+    Args:
+        rosbag_path (str): Path to the rosbag.
+        output_folder (str): Root output folder.
+        settings (Dict[str, Any]): Extraction and detection settings of this run.
+
+    Returns:
+        bool: True if the rosbag is unchanged and was completely processed with the same settings.
+
+    Raises:
+        ValueError: If the output folder of the rosbag holds the output of another version
+        of the rosbag or of other settings, which is never overwritten.
+    """
+    bag_name = os.path.splitext(os.path.basename(rosbag_path))[0]
+    bag_output_folder = os.path.join(output_folder, bag_name)
+    fingerprint = get_rosbag_fingerprint(rosbag_path)
+    state = load_state(bag_output_folder)
+
+    if state and state["rosbag"] == fingerprint and state["settings"] == settings:
+        return state["complete"]
+
+    if state:
+        changes = [name for name in settings if state["settings"].get(name) != settings[name]]
+        if state["rosbag"] != fingerprint:
+            changes.insert(0, "rosbag")
+        raise ValueError(
+            f"{bag_output_folder} holds the output of an earlier run with a different {', '.join(changes)}. "
+            "Remove it or choose another output folder to process the rosbag again."
+        )
+    save_state(bag_output_folder, {"rosbag": fingerprint, "settings": settings, "complete": False})
+    return False
+
+
+def get_rosbag_files(input_file_or_folder: str) -> List[str]:
+    """
+    Get the rosbags to process.
+
+    Args:
+        input_file_or_folder (str): Path to the input rosbag or directory of rosbags.
+
+    Returns:
+        List[str]: Paths of the rosbags.
+    """
+    if os.path.isdir(input_file_or_folder):
+        return file_utils.get_all_files_of_type_in_directory(
+            input_folder=input_file_or_folder, file_format="bag"
+        )
+
+    elif os.path.isfile(input_file_or_folder):
+        return [input_file_or_folder]
+
+    else:
+        raise ValueError(
+            f"'{input_file_or_folder}' is neither a valid file nor a directory."
+        )
+
+
 def get_images(
     input_file_or_folder: str,
     output_folder: str,
@@ -91,6 +174,7 @@ def get_images(
     sample: Optional[str] = None,
     start_time: Optional[float] = None,
     end_time: Optional[float] = None,
+    resume_settings: Optional[Dict[str, Any]] = None,
 ) -> None:
     """
     Extract images from a Rosbag1 format.
@@ -106,6 +190,8 @@ def get_images(
         sample (str, optional): Sampling rate or None for no sampling.
         start_time (float, optional): Start time for extraction or None for the beginning.
         end_time (float, optional): End time for extraction or None for the end.
+        resume_settings (Dict[str, Any], optional): Settings of this run, to skip rosbags that were
+        completely processed with the same settings, or None to process all rosbags.
     """
 
     topics_list = topics.split(",") if topics else None
@@ -114,27 +200,15 @@ def get_images(
     )
     sample_rate = int(sample) if sample else None
 
-    if os.path.isdir(input_file_or_folder):
-        rosbag_files = file_utils.get_all_files_of_type_in_directory(
-            input_folder=input_file_or_folder, file_format="bag"
-        )
-        for rosbag_path in rosbag_files:
-            process_rosbag(
-                rosbag_path,
-                output_folder,
-                file_format,
-                manifest,
-                topics_list,
-                naming,
-                resize_dims,
-                sample_rate,
-                start_time,
-                end_time,
-            )
+    for rosbag_path in get_rosbag_files(input_file_or_folder):
+        if resume_settings is not None and should_skip_rosbag(
+            rosbag_path, output_folder, resume_settings
+        ):
+            print(f"Skipping {rosbag_path}, it is unchanged since it was processed.")
+            continue
 
-    elif os.path.isfile(input_file_or_folder):
         process_rosbag(
-            input_file_or_folder,
+            rosbag_path,
             output_folder,
             file_format,
             manifest,
@@ -145,10 +219,6 @@ def get_images(
             start_time,
             end_time,
         )
-    else:
-        raise ValueError(
-            f"'{input_file_or_folder}' is neither a valid file nor a directory."
-        )
 
 
 def process_rosbag(
@@ -200,68 +270,524 @@ def process_rosbag(
     )
 
 
+def find_extracted_images(input_folder: str) -> List[str]:
+    """
+    Find image manifests of get_images_from_rosbag output in the input folder.
+
+    Args:
+        input_folder (str): Input folder, with one folder per rosbag and one folder per topic in it.
+
+    Returns:
+        List[str]: Paths of the image manifests.
+    """
+    return sorted(glob.glob(os.path.join(input_folder, "*", "*", "img_manifest.json")))
+
+
+def load_image(topic_path: str, image_data: Dict[str, Any]) -> np.ndarray:
+    """
+    Read the image of a manifest entry.
+
+    Images of get_images_from_rosbag tar output are read from their byte
+    range in the tar shard, others from their file.
+
+    Args:
+        topic_path (str): Folder containing the manifest.
+        image_data (Dict[str, Any]): Manifest entry of the image.
+
+    Returns:
+        np.ndarray: Image as read by cv2.imread(path, -1).
+    """
+    if "shard" not in image_data:
+        return cv2.imread(image_data["path"], -1)
+
+    with open(os.path.join(topic_path, image_data["shard"]), "rb") as f:
+        f.seek(image_data["offset"])
+        data = f.read(image_data["size"])
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_UNCHANGED)
+
+
+def get_calibration_images(input_dir: str, count: int, topics: Optional[str] = None) -> List[np.ndarray]:
+    """
+    Get images spread over the input to calibrate the INT8 quantization of a model with.
+
+    Images are read from images extracted by get_images_from_rosbag in the
+    input folder, or decoded from the first rosbag.
+
+    Args:
+        input_dir (str): Input rosbag or folder.
+        count (int): Number of images.
+        topics (str, optional): Comma-separated list of topics. If None, all image topics are considered.
+
+    Returns:
+        List[np.ndarray]: BGR images.
+    """
+    images = []
+    manifest_paths = find_extracted_images(input_dir) if os.path.isdir(input_dir) else []
+    if manifest_paths:
+        entries = []
+        for manifest_path in manifest_paths:
+            with open(manifest_path, "r") as f:
+                manifest = json.load(f)
+            entries += [(os.path.dirname(manifest_path), x) for x in manifest["images"].values()]
+        for topic_path, image_data in entries[:: max(1, len(entries) // count)][:count]:
+            images.append(load_image(topic_path, image_data))
+
+    else:
+        rosbag_files = get_rosbag_files(input_dir)
+        if not rosbag_files:
+            return []
+        stream = frame_stream.FrameStream(rosbag_files[0], "", topics=topics.split(",") if topics else None)
+        image_count = sum(stream.topic_dict[topic]["Message Count"] for topic in stream.topics)
+        stream.sample = max(1, image_count // count)
+        for frame in stream:
+            images.append(frame.image)
+            if len(images) == count:
+                break
+
+    return [detection.to_bgr(img) for img in images]
+
+
 def run_detector_on_folders(
     root_output_folder: str,
     model_name: str = "yolov8n.pt",
     visualize: bool = False,
     save_video: bool = False,
+    root_image_folder: Optional[str] = None,
+    resume: bool = False,
+    batch_size: int = 1,
+    backend: str = "torch",
+    int8: bool = False,
+    motion_threshold: Optional[float] = None,
+    max_frame_gap: int = 30,
+    columnar_format: Optional[str] = None,
+    workers: int = 1,
+    threads: int = 1,
 ) -> None:
     """
     Run detector on each image in topic folders that have a img_manifest.json.
 
+    Topic folders of all rosbags are spread over up to workers processes, and
+    the object counts of the topics of each rosbag are combined once all of
+    them are done.
+
     Args:
         root_output_folder (str): Root folder containing the output of the get_images action
         model_name (str): Model name to use for inference: allowed values are yolov8n,
         yolov8s, yolov8m, yolov8l, yolov8x
         visualize (bool): True to draw bounding boxes
         save_video (bool): True to save videos with visualized bounding boxes
+        root_image_folder (str, optional): Root folder of the images if they are not
+        in root_output_folder, such as get_images_from_rosbag output in the input folder
+        resume (bool): True to skip rosbags and topics completed by an earlier run
+        batch_size (int): Number of images per forward pass of the detector
+        backend (str): Inference backend: torch, onnx or openvino
+        int8 (bool): True to run the INT8 quantized export of the model
+        motion_threshold (float, optional): Minimum difference in gray levels to the last detected
+        image of a topic to run the detector again, or None to run it on every image
+        max_frame_gap (int): Maximum number of images in a row that are not detected with motion_threshold
+        columnar_format (str, optional): 'parquet' or 'npz' to also write the detections of each topic
+        with one row per detection, or None
+        workers (int): Number of topic folders processed in parallel worker processes
+        threads (int): Number of torch and OpenCV threads of each worker
 
     Returns: None
 
     """
-    temp_dir = os.path.join(root_output_folder, "temp_imgs") if save_video else None
+    root_image_folder = root_image_folder or root_output_folder
 
     runtime = ActionRuntime.from_env()
     dataset_id = runtime.dataset_id
     dataset = Dataset.from_id(dataset_id=str(dataset_id),
                               roboto_client=RobotoClient.from_env())
 
-    # Iterate over directories
-    for bag_dir in os.listdir(root_output_folder):
+    # Collect the topic directories of all bags
+    bag_topics: Dict[str, List[str]] = {}
+    tasks: Dict[str, Dict[str, Any]] = {}
+    for bag_dir in os.listdir(root_image_folder):
         bag_path = os.path.join(root_output_folder, bag_dir)
+        bag_image_path = os.path.join(root_image_folder, bag_dir)
 
-        object_count_dict = {}
+        state = load_state(bag_path) if resume else None
+        if state and state["complete"]:
+            print(f"Skipping {bag_dir}, its detections are done.")
+            continue
 
         # Process topic directories inside the bag's output folder
-        if os.path.isdir(bag_path):
-            for topic_dir in os.listdir(bag_path):
-                # Create temporary directory if needed
-                if save_video:
-                    os.makedirs(temp_dir, exist_ok=True)
-
-                detection_count=process_topic_directory(
+        if os.path.isdir(bag_image_path):
+            bag_topics[bag_dir] = []
+            for topic_dir in os.listdir(bag_image_path):
+                # skip files next to the topic folders, such as detection_state.json
+                if not os.path.isdir(os.path.join(bag_image_path, topic_dir)):
+                    continue
+                task_name = os.path.join(bag_path, topic_dir)
+                bag_topics[bag_dir].append(task_name)
+                tasks[task_name] = dict(
                     topic_dir=topic_dir,
                     bag_path=bag_path,
                     model_name=model_name,
                     visualize=visualize,
                     save_video=save_video,
-                    temp_dir=temp_dir)
-
-                if detection_count:
-                    object_count_dict=add_object_counts(object_count_dict, detection_count)
-
-            # Add metadata logic
-            print("object_count_dict")
-            print(object_count_dict)
-            if object_count_dict:
-                bag_file = bag_dir + ".bag"
-                try:
-                    print("Adding metadata to bag file {}".format(bag_file))
-                    file_record = dataset.get_file_by_path(bag_file)
-                    file_record.put_metadata(metadata=object_count_dict)
-                except Exception as e:
-                    print("Error adding metadata to bag file {}: {}".format(bag_file, e))
-                    continue
+                    image_path=os.path.join(bag_image_path, topic_dir),
+                    resume=resume,
+                    batch_size=batch_size,
+                    backend=backend,
+                    int8=int8,
+                    motion_threshold=motion_threshold,
+                    max_frame_gap=max_frame_gap,
+                    columnar_format=columnar_format,
+                )
+
+    results = worker_pool.run_tasks(process_topic_directory, tasks, workers, threads)
+
+    for bag_dir, task_names in bag_topics.items():
+        bag_path = os.path.join(root_output_folder, bag_dir)
+        object_count_dict = {}
+        for task_name in task_names:
+            detection_count = results.get(task_name)
+            if detection_count:
+                object_count_dict = add_object_counts(object_count_dict, detection_count)
+
+        # a rosbag with failed topics is processed again by a resumed run
+        state = load_state(bag_path) if resume else None
+        if state and all(x in results for x in task_names):
+            state["complete"] = True
+            save_state(bag_path, state)
+
+        add_metadata_to_bag_file(dataset, bag_dir, object_count_dict)
+
+    if len(results) < len(tasks):
+        failed = sorted(set(tasks) - set(results))
+        raise RuntimeError(f"Failed to process {len(failed)} of {len(tasks)} topics: " + ", ".join(failed))
+
+
+def add_metadata_to_bag_file(dataset: Dataset, bag_dir: str, object_count_dict: Dict[str, int]) -> None:
+    """
+    Add the object counts of a rosbag as metadata to its file in the dataset.
+
+    Args:
+        dataset (Dataset): Dataset of the Action invocation.
+        bag_dir (str): Name of the rosbag without extension.
+        object_count_dict (Dict[str, int]): Object counts of the rosbag.
+    """
+    print("object_count_dict")
+    print(object_count_dict)
+    if object_count_dict:
+        bag_file = bag_dir + ".bag"
+        try:
+            print("Adding metadata to bag file {}".format(bag_file))
+            file_record = dataset.get_file_by_path(bag_file)
+            file_record.put_metadata(metadata=object_count_dict)
+        except Exception as e:
+            print("Error adding metadata to bag file {}: {}".format(bag_file, e))
+
+
+def run_detector_on_rosbags(
+    input_file_or_folder: str,
+    root_output_folder: str,
+    model_name: str = "yolov8n",
+    visualize: bool = False,
+    save_video: bool = False,
+    keep_images: bool = False,
+    manifest: bool = True,
+    file_format: str = "jpg",
+    topics: Optional[str] = None,
+    naming: str = "sequential",
+    resize: Optional[str] = None,
+    sample: Optional[str] = None,
+    start_time: Optional[float] = None,
+    end_time: Optional[float] = None,
+    batch_size: int = 1,
+    backend: str = "torch",
+    int8: bool = False,
+    motion_threshold: Optional[float] = None,
+    max_frame_gap: int = 30,
+    columnar_format: Optional[str] = None,
+    queue_size: int = 32,
+    resume_settings: Optional[Dict[str, Any]] = None,
+) -> None:
+    """
+    Run detector on the images of each rosbag while they are decoded, without
+    extracting them to disk first.
+
+    The output has the same layout as get_images followed by run_detector_on_folders,
+    but images are only written with visualize or keep_images.
+
+    Args:
+        input_file_or_folder (str): Path to the input rosbag or directory of rosbags.
+        root_output_folder (str): Root folder for one output folder per rosbag.
+        model_name (str): Model name to use for inference
+        visualize (bool): True to write images with drawn bounding boxes
+        save_video (bool): True to save videos with visualized bounding boxes
+        keep_images (bool): True to write the extracted images
+        manifest (bool): True to write the image manifest of each topic
+        file_format (str): Image format of written images.
+        topics (str, optional): Comma-separated list of topics. If None, all image topics are considered.
+        naming (str): Naming schema for images.
+        resize (str, optional): Desired resolution in WIDTH,HEIGHT format or None for no resizing.
+        sample (str, optional): Sampling rate or None for no sampling.
+        start_time (float, optional): Start time for extraction or None for the beginning.
+        end_time (float, optional): End time for extraction or None for the end.
+        batch_size (int): Number of images per forward pass of the detector
+        backend (str): Inference backend: torch, onnx or openvino
+        int8 (bool): True to run the INT8 quantized export of the model
+        motion_threshold (float, optional): Minimum difference in gray levels to the last detected
+        image of a topic to run the detector again, or None to run it on every image
+        max_frame_gap (int): Maximum number of images in a row that are not detected with motion_threshold
+        columnar_format (str, optional): 'parquet' or 'npz' to also write the detections of each topic
+        with one row per detection, or None
+        queue_size (int): Number of decoded images that may wait for the detector
+        resume_settings (Dict[str, Any], optional): Settings of this run, to skip rosbags that were
+        completely processed with the same settings, or None to process all rosbags.
+
+    Returns: None
+    """
+    runtime = ActionRuntime.from_env()
+    dataset_id = runtime.dataset_id
+    dataset = Dataset.from_id(dataset_id=str(dataset_id),
+                              roboto_client=RobotoClient.from_env())
+
+    for rosbag_path in get_rosbag_files(input_file_or_folder):
+        if resume_settings is not None and should_skip_rosbag(
+            rosbag_path, root_output_folder, resume_settings
+        ):
+            print(f"Skipping {rosbag_path}, it is unchanged since it was processed.")
+            continue
+
+        bag_dir = os.path.splitext(os.path.basename(rosbag_path))[0]
+        bag_path = os.path.join(root_output_folder, bag_dir)
+        os.makedirs(bag_path, exist_ok=True)
+        os.chmod(bag_path, 0o777)
+
+        stream = frame_stream.FrameStream(
+            rosbag_path,
+            bag_path,
+            file_format=file_format,
+            topics=topics.split(",") if topics else None,
+            naming=naming,
+            resize=argument_parsers.get_width_height_from_args(resize) if resize else None,
+            sample=int(sample) if sample else None,
+            start_time=start_time,
+            end_time=end_time,
+            queue_size=queue_size,
+        )
+        object_count_dict = process_frame_stream(
+            stream=stream,
+            bag_path=bag_path,
+            model_name=model_name,
+            visualize=visualize,
+            save_video=save_video,
+            keep_images=keep_images,
+            manifest=manifest,
+            batch_size=batch_size,
+            backend=backend,
+            int8=int8,
+            motion_threshold=motion_threshold,
+            max_frame_gap=max_frame_gap,
+            columnar_format=columnar_format,
+        )
+
+        state = load_state(bag_path) if resume_settings is not None else None
+        if state:
+            state["complete"] = True
+            save_state(bag_path, state)
+
+        add_metadata_to_bag_file(dataset, bag_dir, object_count_dict)
+
+
+def process_frame_stream(
+    stream: frame_stream.FrameStream,
+    bag_path: str,
+    model_name: str,
+    visualize: bool,
+    save_video: bool,
+    keep_images: bool,
+    manifest: bool,
+    batch_size: int,
+    backend: str,
+    int8: bool,
+    motion_threshold: Optional[float] = None,
+    max_frame_gap: int = 30,
+    columnar_format: Optional[str] = None,
+) -> Dict[str, int]:
+    """
+    Run detector on the frames of a rosbag as they are decoded.
+
+    Frames of each topic are collected into batches. Every topic folder gets
+    the imgs folder and video that process_topic_directory creates, and the
+    frames of each video are piped to its encoder as they are detected.
+
+    Args:
+        stream (frame_stream.FrameStream): Decoded frames of the rosbag
+        bag_path (str): Output folder of the rosbag
+        model_name (str): Model name to use for inference
+        visualize (bool): True to write images with drawn bounding boxes
+        save_video (bool): True to save videos with visualized bounding boxes
+        keep_images (bool): True to write the extracted images
+        manifest (bool): True to write the image manifest of each topic
+        batch_size (int): Number of images per forward pass of the detector
+        backend (str): Inference backend: torch, onnx or openvino
+        int8 (bool): True to run the INT8 quantized export of the model
+        motion_threshold (float, optional): Minimum difference in gray levels to the last detected
+        frame of a topic to run the detector again, or None to run it on every frame
+        max_frame_gap (int): Maximum number of frames in a row that are not detected with motion_threshold
+        columnar_format (str, optional): 'parquet' or 'npz' to also write the detections of each topic
+        with one row per detection, or None
+
+    Returns:
+        Dict[str, int]: Object counts of all topics of the rosbag.
+    """
+    detections: Dict[str, Dict[str, Any]] = {}
+    manifests: Dict[str, Dict[str, Any]] = {}
+    batches: Dict[str, List[frame_stream.Frame]] = {}
+    gates: Dict[str, Optional[motion_gate.MotionGate]] = {}
+    tables: Dict[str, columnar.DetectionTable] = {}
+    writers: Dict[str, Optional[video_writer.FfmpegVideoWriter]] = {}
+
+    try:
+        for frame in stream:
+            topic = frame.topic
+            topic_dir = ros_utils.replace_ros_topic_name(topic)
+            if topic not in batches:
+                os.makedirs(os.path.join(bag_path, topic_dir, "imgs"), exist_ok=True)
+                batches[topic] = []
+                manifests[topic] = {}
+                gates[topic] = None
+                tables[topic] = columnar.DetectionTable()
+                writers[topic] = None
+                if motion_threshold is not None:
+                    gates[topic] = motion_gate.MotionGate(motion_threshold, max_frame_gap)
+                if save_video:
+                    writers[topic] = video_writer.FfmpegVideoWriter(
+                        os.path.join(bag_path, topic_dir, video_writer.VIDEO_NAME),
+                        round(stream.topic_dict[topic]["Frequency"], 2),
+                    )
+                detections[topic] = {
+                    "images": {},
+                    "metadata": {
+                        "model_name": model_name,
+                        "date": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    },
+                }
+
+            manifests[topic][frame.image_name] = frame.manifest_entry
+            batches[topic].append(frame)
+            if len(batches[topic]) == batch_size:
+                detect_frames(
+                    batch=batches[topic],
+                    detections=detections[topic],
+                    topic_path=os.path.join(bag_path, topic_dir),
+                    writer=writers[topic],
+                    model_name=model_name,
+                    visualize=visualize,
+                    save_video=save_video,
+                    keep_images=keep_images,
+                    backend=backend,
+                    int8=int8,
+                    gate=gates[topic],
+                    table=tables[topic],
+                )
+                batches[topic] = []
+
+        for topic in batches:
+            if batches[topic]:
+                detect_frames(
+                    batch=batches[topic],
+                    detections=detections[topic],
+                    topic_path=os.path.join(bag_path, ros_utils.replace_ros_topic_name(topic)),
+                    writer=writers[topic],
+                    model_name=model_name,
+                    visualize=visualize,
+                    save_video=save_video,
+                    keep_images=keep_images,
+                    backend=backend,
+                    int8=int8,
+                    gate=gates[topic],
+                    table=tables[topic],
+                )
+
+    except BaseException:
+        # a video left unfinished by the error may fail to encode, which must not hide the error
+        video_writer.close_writers(writers.values(), suppress_errors=True)
+        raise
+    else:
+        video_writer.close_writers(writers.values())
+
+    object_count_dict: Dict[str, int] = {}
+    for topic in batches:
+        topic_path = os.path.join(bag_path, ros_utils.replace_ros_topic_name(topic))
+        if writers[topic]:
+            print(f"Encoded {writers[topic].frame_count} frames of {topic} to {writers[topic].path}")
+
+        if gates[topic]:
+            detections[topic]["metadata"]["motion_gate"] = gates[topic].get_metadata()
+            print_gate_summary(topic_path, gates[topic])
+
+        with open(os.path.join(topic_path, "imgs", "detections.json"), "w") as f:
+            json.dump(detections[topic], f, indent=4)
+        if columnar_format:
+            tables[topic].write(os.path.join(topic_path, "imgs"), columnar_format)
+        if manifest:
+            file_utils.save_json(
+                {"images": manifests[topic], "topic": stream.topic_dict[topic]},
+                os.path.join(topic_path, "imgs", ros_utils.get_name_img_manifest()),
+            )
+
+        object_count_dict = add_object_counts(object_count_dict, tables[topic].count_classes())
+    return object_count_dict
+
+
+def detect_frames(
+    batch: List[frame_stream.Frame],
+    detections: Dict[str, Any],
+    topic_path: str,
+    writer: Optional[video_writer.FfmpegVideoWriter],
+    model_name: str,
+    visualize: bool,
+    save_video: bool,
+    keep_images: bool,
+    backend: str,
+    int8: bool,
+    gate: Optional[motion_gate.MotionGate] = None,
+    table: Optional[columnar.DetectionTable] = None,
+) -> None:
+    """
+    Run detector on a batch of streamed frames of one topic.
+
+    Args:
+        batch (List[frame_stream.Frame]): Frames of the topic
+        detections (Dict[str, Any]): Detections of the topic, to add the detections of the frames to
+        topic_path (str): Output folder of the topic
+        writer (video_writer.FfmpegVideoWriter, optional): Encoder of the video of the topic, or None
+        model_name (str): Model name to use for inference
+        visualize (bool): True to write images with drawn bounding boxes
+        save_video (bool): True to save videos with visualized bounding boxes
+        keep_images (bool): True to write the extracted images
+        backend (str): Inference backend: torch, onnx or openvino
+        int8 (bool): True to run the INT8 quantized export of the model
+        gate (motion_gate.MotionGate, optional): Motion gate of the topic, or None to detect every frame
+        table (columnar.DetectionTable, optional): Columns of the detections of the topic, to add the
+        detections of the frames to
+
+    Returns: None
+    """
+    outputs = run_detect_batch(
+        images=[frame.image for frame in batch],
+        model_name=model_name,
+        visualize=visualize,
+        create_video=save_video,
+        backend=backend,
+        int8=int8,
+        output_paths=[os.path.join(topic_path, "imgs", frame.image_name) for frame in batch],
+        gate=gate,
+    )
+    for frame, (image_detections, img) in zip(batch, outputs):
+        detections["images"][frame.image_name] = image_detections
+        if table:
+            table.add_image(frame.image_name, frame.manifest_entry, image_detections)
+        if keep_images and not visualize:
+            cv2.imwrite(os.path.join(topic_path, "imgs", frame.image_name), frame.image)
+        if writer:
+            writer.write(frame_stream.to_stored_image(img, "jpg"))
 
 
 def process_topic_directory(
@@ -270,7 +796,14 @@ def process_topic_directory(
     model_name: str,
     visualize: bool,
     save_video: bool,
-    temp_dir: Optional[str],
+    image_path: Optional[str] = None,
+    resume: bool = False,
+    batch_size: int = 1,
+    backend: str = "torch",
+    int8: bool = False,
+    motion_threshold: Optional[float] = None,
+    max_frame_gap: int = 30,
+    columnar_format: Optional[str] = None,
 ) -> Dict[str, int]:
     """
     Helper function to process a given topic directory.
@@ -281,18 +814,39 @@ def process_topic_directory(
         model_name (str): Model name to use for inference
         visualize (bool): True to draw bounding boxes
         save_video (bool): True to save videos with visualized bounding boxes
-        temp_dir (str): Temporary directory to save images to
+        image_path (str, optional): Directory containing the images and manifest file
+        if not bag_path/topic_dir
+        resume (bool): True to skip the topic if an earlier run completed its detections
+        batch_size (int): Number of images per forward pass of the detector
+        backend (str): Inference backend: torch, onnx or openvino
+        int8 (bool): True to run the INT8 quantized export of the model
+        motion_threshold (float, optional): Minimum difference in gray levels to the last detected
+        image to run the detector again, or None to run it on every image
+        max_frame_gap (int): Maximum number of images in a row that are not detected with motion_threshold
+        columnar_format (str, optional): 'parquet' or 'npz' to also write the detections with one row
+        per detection, or None
 
     Returns: None
     """
 
     topic_path = os.path.join(bag_path, topic_dir)
-    manifest_path = os.path.join(topic_path, "img_manifest.json")
+    image_path = image_path or topic_path
+    manifest_path = os.path.join(image_path, "img_manifest.json")
 
     # Continue only if manifest exists
     if not os.path.isfile(manifest_path):
         return
 
+    # detections.json is moved to imgs once the topic is done
+    done_path = os.path.join(topic_path, "imgs", "detections.json")
+    if resume and os.path.isfile(done_path):
+        with open(done_path, "r") as f:
+            done = json.load(f)
+        if done["metadata"]["model_name"] == model_name:
+            print(f"Skipping {topic_path}, its detections are done.")
+            remove_extracted_images(topic_path)
+            return count_detections(done)
+
     with open(manifest_path, "r") as f:
         manifest = json.load(f)
 
@@ -305,36 +859,83 @@ def process_topic_directory(
         },
     }
 
-    for image_data in manifest["images"].values():
-        detections["images"][image_data["img_name"]], img = run_detect(
-            image_path=image_data["path"],
-            model_name=model_name,
-            visualize=visualize,
-            create_video=save_video,
-        )
+    os.makedirs(topic_path, exist_ok=True)
+
+    gate = None
+    if motion_threshold is not None:
+        gate = motion_gate.MotionGate(motion_threshold, max_frame_gap)
 
-        # Save processed image if needed
-        if save_video:
-            cv2.imwrite(os.path.join(temp_dir, image_data["img_name"]), img)
+    table = columnar.DetectionTable()
 
-    detection_count = count_detections(detections)
+    # frames are piped to the encoder as they are detected, instead of staging them as images
+    writer = None
+    if save_video:
+        writer = video_writer.FfmpegVideoWriter(os.path.join(topic_path, video_writer.VIDEO_NAME), frame_rate)
+
+    batch = []
+    image_list = list(manifest["images"].values())
+    try:
+        for i, image_data in enumerate(image_list):
+            batch.append((image_data, load_image(image_path, image_data)))
+            if len(batch) < batch_size and i + 1 < len(image_list):
+                continue
+
+            image_entries = [data for data, _ in batch]
+            img_names = [data["img_name"] for data in image_entries]
+            outputs = run_detect_batch(
+                images=[img for _, img in batch],
+                model_name=model_name,
+                visualize=visualize,
+                create_video=save_video,
+                backend=backend,
+                int8=int8,
+                output_paths=[os.path.join(topic_path, name) for name in img_names],
+                gate=gate,
+            )
+            batch = []
+
+            for img_name, image_data, (image_detections, img) in zip(img_names, image_entries, outputs):
+                detections["images"][img_name] = image_detections
+                table.add_image(img_name, image_data, image_detections)
+
+                if writer:
+                    writer.write(frame_stream.to_stored_image(img, "jpg"))
+
+    except BaseException:
+        # a video left unfinished by the error may fail to encode, which must not hide the error
+        video_writer.close_writers([writer], suppress_errors=True)
+        raise
+    else:
+        video_writer.close_writers([writer])
+
+    if gate:
+        detections["metadata"]["motion_gate"] = gate.get_metadata()
+        print_gate_summary(topic_path, gate)
+
+    detection_count = table.count_classes()
 
     # Save detections to file
     with open(os.path.join(topic_path, "detections.json"), "w") as f:
         json.dump(detections, f, indent=4)
+    if columnar_format:
+        os.makedirs(os.path.join(topic_path, "imgs"), exist_ok=True)
+        table.write(os.path.join(topic_path, "imgs"), columnar_format)
 
-    # Create video if required
-    if save_video:
-        print(temp_dir, topic_path, frame_rate)
-        ros_img_tools.create_video_from_images(
-            input_path=temp_dir, output_path=topic_path, frame_rate=frame_rate
-        )
-        shutil.rmtree(temp_dir)
+    if writer:
+        print(f"Encoded {writer.frame_count} frames of {topic_path} to {writer.path}")
 
     move_images_to_subfolder(topic_path)
     return detection_count
 
 
+def print_gate_summary(topic_path: str, gate: motion_gate.MotionGate) -> None:
+    total = gate.detected_count + gate.propagated_count
+    print(
+        f"Ran detection on {gate.detected_count} of {total} images of {topic_path}, "
+        f"carried forward detections to {gate.propagated_count}"
+    )
+
+
 def move_images_to_subfolder(topic_path: str) -> None:
     """
     Move all images (.jpg, .jpeg, .png) from the specified directory to a subfolder named "imgs".
@@ -360,50 +961,86 @@ def move_images_to_subfolder(topic_path: str) -> None:
                 shutil.move(src_path, dest_path)
 
 
-def run_detect(
-    image_path: str,
+def remove_extracted_images(topic_path: str) -> None:
+    """
+    Remove images and the manifest extracted again into a topic directory that is done.
+
+    Parameters:
+    - topic_path (str): Path to the directory containing the images.
+    """
+    for file in os.listdir(topic_path):
+        file_path = os.path.join(topic_path, file)
+        if os.path.isfile(file_path) and (
+            file.lower().endswith((".jpg", ".jpeg", ".png")) or file == "img_manifest.json"
+        ):
+            os.remove(file_path)
+
+
+def run_detect_batch(
+    images: List[np.ndarray],
     model_name: str,
     visualize: bool = False,
     create_video: bool = False,
-) -> Tuple[Union[None, str], Union[None, str]]:
+    output_paths: Optional[List[str]] = None,
+    backend: str = "torch",
+    int8: bool = False,
+    gate: Optional[motion_gate.MotionGate] = None,
+) -> List[Tuple[List[Dict[str, Any]], np.ndarray]]:
     """
-    Runs the YOLO detector on the provided image.
+    Runs the YOLO detector on a batch of images in one forward pass.
 
     Parameters:
-    - image_path (str): Path to the image file.
-    - ... (additional parameters with their descriptions)
+    - images (List[np.ndarray]): Images as read by cv2.imread(path, -1).
+    - model_name (str): Model name to use for inference.
+    - visualize (bool): True to write the images with drawn detections to output_paths.
+    - create_video (bool): True to return the images with drawn detections.
+    - output_paths (List[str], optional): Paths for the visualized images.
+    - backend (str): Inference backend: torch, onnx or openvino.
+    - int8 (bool): True to run the INT8 quantized export of the model.
+    - gate (motion_gate.MotionGate, optional): Motion gate of the topic of the images. Images
+      it skips get the detections of the last detected image of the topic, marked as propagated.
 
     Returns:
-    - Tuple of JSON results and optionally the processed image.
+    - List of the JSON results and the image, with drawn detections if visualize
+      or create_video, of each image.
     """
 
-    global model  # Ensure model is loaded only once
-    if "model" not in globals():
-        model = YOLO(f"{model_name}.pt")
-
-    img = cv2.imread(image_path, -1)
-    if len(img.shape) == 2:
-        img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    model = model_registry.get_model(model_name, backend, int8)
+    images = [detection.to_bgr(img) for img in images]
+    detect = [gate.should_detect(img) if gate else True for img in images]
+    detected_images = [img for img, x in zip(images, detect) if x]
 
     # Run detection
     start_time = datetime.datetime.now()
-    results = model(img)
+    results = iter(detection.detect_batch(model, detected_images))
     end_time = datetime.datetime.now()
 
-    delta = end_time - start_time
-    print(
-        f"Detection on {os.path.basename(image_path)} took {int(delta.total_seconds() * 1000)} ms"
-    )
+    if detected_images:
+        delta_ms = (end_time - start_time).total_seconds() * 1000
+        print(
+            f"Detection on {len(detected_images)} images took {int(delta_ms)} ms "
+            f"({delta_ms / len(detected_images):.1f} ms per image)"
+        )
 
-    if visualize:
-        img = results[0].plot()
-        cv2.imwrite(image_path, img)
+    outputs = []
+    for i, img in enumerate(images):
+        if detect[i]:
+            result = next(results)
+            image_detections = detection.get_detections(result)
+            if gate:
+                gate.last_result = result
+                gate.last_detections = image_detections
+        else:
+            result = gate.last_result
+            image_detections = gate.get_propagated_detections()
 
-    if create_video:
-        img = results[0].plot()
-    return json.loads(results[0].tojson(normalize=True)), img if len(
-        results
-    ) == 1 else (None, None)
+        if visualize or create_video:
+            # carried forward detections are drawn on the skipped image
+            img = result.plot() if detect[i] else result.plot(img=img)
+        if visualize:
+            cv2.imwrite(output_paths[i], img)
+        outputs.append((image_detections, img))
+    return outputs
 
 
 parser = argparse.ArgumentParser()
@@ -508,6 +1145,114 @@ parser.add_argument(
     default=(os.environ.get("ROBOTO_PARAM_VISUALIZE") == "True"),
 )
 
+parser.add_argument(
+    "--resume",
+    action="store_true",
+    required=False,
+    help="Skip rosbags and topics completed by an earlier run with the same settings",
+    default=(os.environ.get("ROBOTO_PARAM_RESUME") == "True"),
+)
+
+parser.add_argument(
+    "--stream",
+    action="store_true",
+    required=False,
+    help="Run detection on images while they are decoded from the rosbag, instead of extracting them to disk first",
+    default=(os.environ.get("ROBOTO_PARAM_STREAM") == "True"),
+)
+
+parser.add_argument(
+    "--keep_images",
+    action="store_true",
+    required=False,
+    help="Write the extracted images in streaming mode",
+    default=(os.environ.get("ROBOTO_PARAM_KEEP_IMAGES") == "True"),
+)
+
+parser.add_argument(
+    "--queue_size",
+    type=int,
+    required=False,
+    help="Number of decoded images that may wait for the detector in streaming mode",
+    default=int(os.environ.get("ROBOTO_PARAM_QUEUE_SIZE", 32)),
+)
+
+parser.add_argument(
+    "--backend",
+    type=str,
+    required=False,
+    help="Inference backend. Valid values are 'torch', 'onnx', 'openvino'",
+    choices=backends.BACKENDS,
+    default=os.environ.get("ROBOTO_PARAM_BACKEND", "torch"),
+)
+
+parser.add_argument(
+    "--int8",
+    action="store_true",
+    required=False,
+    help="Quantize the onnx or openvino model to INT8, calibrated with images of the input",
+    default=(os.environ.get("ROBOTO_PARAM_INT8") == "True"),
+)
+
+parser.add_argument(
+    "--calibration_size",
+    type=int,
+    required=False,
+    help="Number of images to calibrate the INT8 quantization with",
+    default=int(os.environ.get("ROBOTO_PARAM_CALIBRATION_SIZE", 64)),
+)
+
+parser.add_argument(
+    "--batch_size",
+    type=int,
+    required=False,
+    help="Number of images per forward pass of the detector",
+    default=int(os.environ.get("ROBOTO_PARAM_BATCH_SIZE", 4)),
+)
+
+parser.add_argument(
+    "--motion_threshold",
+    type=float,
+    required=False,
+    help="Only run the detector on images that differ from the last detected image of their topic by at "
+    "least this many gray levels on average, and carry forward its detections to the others, or None to "
+    "run the detector on every image",
+    default=os.environ.get("ROBOTO_PARAM_MOTION_THRESHOLD"),
+)
+
+parser.add_argument(
+    "--max_frame_gap",
+    type=int,
+    required=False,
+    help="Maximum number of images in a row that are not detected with a motion threshold",
+    default=int(os.environ.get("ROBOTO_PARAM_MAX_FRAME_GAP", 30)),
+)
+
+parser.add_argument(
+    "--columnar_format",
+    type=str,
+    required=False,
+    help="Also write the detections of each topic with one row per detection. Valid values are 'parquet', 'npz'",
+    choices=columnar.COLUMNAR_FORMATS,
+    default=os.environ.get("ROBOTO_PARAM_COLUMNAR_FORMAT"),
+)
+
+parser.add_argument(
+    "--workers",
+    type=int,
+    required=False,
+    help="Number of topic folders processed in parallel worker processes",
+    default=int(os.environ.get("ROBOTO_PARAM_WORKERS", 1)),
+)
+
+parser.add_argument(
+    "--threads_per_worker",
+    type=int,
+    required=False,
+    help="Number of torch and OpenCV threads of each worker, or 0 to split the allotted vCPUs between the workers",
+    default=int(os.environ.get("ROBOTO_PARAM_THREADS_PER_WORKER", 0)),
+)
+
 parser.add_argument(
     "--model-name",
     type=str,
@@ -526,23 +1271,104 @@ if args.model_name not in ALLOWED_MODELS:
 if args.save_video:
     args.manifest = True
 
-get_images(
-    input_file_or_folder=args.input_dir,
-    output_folder=args.output_dir,
-    file_format=args.format,
-    manifest=args.manifest,
-    topics=args.topics,
-    naming=args.naming,
-    resize=args.resize,
-    sample=args.sample,
-    start_time=args.start_time,
-    end_time=args.end_time,
-)
+if args.batch_size < 1:
+    raise ValueError(f"Invalid BATCH_SIZE {args.batch_size}, it must be at least 1")
 
+if args.queue_size < 1:
+    raise ValueError(f"Invalid QUEUE_SIZE {args.queue_size}, it must be at least 1")
 
-run_detector_on_folders(
-    root_output_folder=args.output_dir,
-    model_name=args.model_name,
-    visualize=args.visualize,
-    save_video=args.save_video,
-)
+if args.max_frame_gap < 0:
+    raise ValueError(f"Invalid MAX_FRAME_GAP {args.max_frame_gap}, it must be at least 0")
+
+if args.int8 and args.backend == "torch":
+    raise ValueError("INT8 quantization needs BACKEND 'onnx' or 'openvino'")
+
+if args.workers < 1:
+    raise ValueError(f"Invalid WORKERS {args.workers}, it must be at least 1")
+
+if args.workers > 1 and args.stream:
+    raise ValueError("WORKERS above 1 needs STREAM False, streamed rosbags are processed in one process")
+
+threads = worker_pool.get_thread_budget(args.workers, args.threads_per_worker)
+# forked workers hang if this process ran torch with several threads, e.g. to export the model
+worker_pool.set_thread_budget(1 if args.workers > 1 else threads)
+
+resume_settings = None
+if args.resume:
+    resume_settings = {
+        name: getattr(args, name)
+        for name in ["format", "manifest", "topics", "naming", "resize", "sample", "start_time", "end_time",
+                     "save_video", "visualize", "model_name", "stream", "keep_images", "backend", "int8",
+                     "motion_threshold", "max_frame_gap", "columnar_format"]
+    }
+
+# exports are cached next to the weights, and only created by the first run
+weights_path = model_registry.get_weights_path(args.model_name)
+calibration_images = None
+if args.int8 and not os.path.exists(backends.get_model_path(weights_path, args.backend, int8=True)):
+    calibration_images = get_calibration_images(args.input_dir, args.calibration_size, args.topics)
+backends.export_model(weights_path, args.backend, args.int8, calibration_images)
+
+# images already extracted by get_images_from_rosbag, e.g. as tar shards, are read in place
+extracted = os.path.isdir(args.input_dir) and find_extracted_images(args.input_dir)
+if args.stream and not extracted:
+    run_detector_on_rosbags(
+        input_file_or_folder=args.input_dir,
+        root_output_folder=args.output_dir,
+        model_name=args.model_name,
+        visualize=args.visualize,
+        save_video=args.save_video,
+        keep_images=args.keep_images,
+        manifest=args.manifest,
+        file_format=args.format,
+        topics=args.topics,
+        naming=args.naming,
+        resize=args.resize,
+        sample=args.sample,
+        start_time=args.start_time,
+        end_time=args.end_time,
+        batch_size=args.batch_size,
+        backend=args.backend,
+        int8=args.int8,
+        motion_threshold=args.motion_threshold,
+        max_frame_gap=args.max_frame_gap,
+        columnar_format=args.columnar_format,
+        queue_size=args.queue_size,
+        resume_settings=resume_settings,
+    )
+
+else:
+    root_image_folder = None
+    if extracted:
+        root_image_folder = args.input_dir
+    else:
+        get_images(
+            input_file_or_folder=args.input_dir,
+            output_folder=args.output_dir,
+            file_format=args.format,
+            manifest=args.manifest,
+            topics=args.topics,
+            naming=args.naming,
+            resize=args.resize,
+            sample=args.sample,
+            start_time=args.start_time,
+            end_time=args.end_time,
+            resume_settings=resume_settings,
+        )
+
+    run_detector_on_folders(
+        root_output_folder=args.output_dir,
+        model_name=args.model_name,
+        visualize=args.visualize,
+        save_video=args.save_video,
+        root_image_folder=root_image_folder,
+        resume=args.resume,
+        batch_size=args.batch_size,
+        backend=args.backend,
+        int8=args.int8,
+        motion_threshold=args.motion_threshold,
+        max_frame_gap=args.max_frame_gap,
+        columnar_format=args.columnar_format,
+        workers=args.workers,
+        threads=threads,
+    )
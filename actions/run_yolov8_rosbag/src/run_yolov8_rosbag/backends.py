@@ -0,0 +1,155 @@
+"""
+Inference backends for the YOLOv8 models.
+
+torch runs the .pt weights with PyTorch. onnx and openvino export the
+weights once with ultralytics, to an ONNX model or OpenVINO IR next to the
+.pt file, and later runs load the cached export. With int8, the export is
+quantized after training with calibration images, such as frames of the
+rosbag to process, and cached separately from the float export.
+
+Every backend is loaded with ultralytics.YOLO, so all of them return the
+same Results and detections.json.
+"""
+
+import os
+import shutil
+
+from typing import List, Optional
+
+import numpy as np
+from ultralytics import YOLO
+from ultralytics.data.augment import LetterBox
+
+BACKENDS = ["torch", "onnx", "openvino"]
+
+# exported models take square, letterboxed input of any batch size
+EXPORT_IMAGE_SIZE = 640
+
+# name of the model input in ultralytics ONNX exports
+ONNX_INPUT_NAME = "images"
+
+
+def get_model_path(weights_path: str, backend: str = "torch", int8: bool = False) -> str:
+    """
+    Get the path of the model file or folder of a backend.
+
+    Args:
+        weights_path (str): Path of the .pt weights, such as "yolov8n.pt".
+        backend (str): One of BACKENDS.
+        int8 (bool): True for the INT8 quantized export.
+
+    Returns:
+        str: Path to load with ultralytics.YOLO.
+    """
+    if backend == "torch":
+        return weights_path
+
+    base_path = os.path.splitext(weights_path)[0] + ("_int8" if int8 else "")
+    if backend == "onnx":
+        return base_path + ".onnx"
+    if backend == "openvino":
+        return base_path + "_openvino_model"
+    raise ValueError(f"Invalid backend '{backend}'. Allowed values are {', '.join(BACKENDS)}")
+
+
+def preprocess_calibration_image(img: np.ndarray) -> np.ndarray:
+    """Convert a BGR image to the input tensor of an exported model, as ultralytics does for inference."""
+    img = LetterBox((EXPORT_IMAGE_SIZE, EXPORT_IMAGE_SIZE), auto=False)(image=img)
+    img = np.ascontiguousarray(img[:, :, ::-1].transpose(2, 0, 1)[None])
+    return img.astype(np.float32) / 255
+
+
+def quantize_onnx(float_path: str, int8_path: str, calibration_tensors: List[np.ndarray]) -> None:
+    """
+    Quantize the convolutions of an ONNX export to INT8 with static activation ranges.
+
+    The box decoding after the convolutions stays in float.
+    """
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+    class TensorReader(CalibrationDataReader):
+        def __init__(self):
+            self.tensors = iter(calibration_tensors)
+
+        def get_next(self):
+            tensor = next(self.tensors, None)
+            return None if tensor is None else {ONNX_INPUT_NAME: tensor}
+
+    quantize_static(
+        float_path,
+        int8_path,
+        TensorReader(),
+        quant_format=QuantFormat.QDQ,
+        op_types_to_quantize=["Conv"],
+        per_channel=True,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+    )
+
+
+def quantize_openvino(float_path: str, int8_path: str, calibration_tensors: List[np.ndarray]) -> None:
+    """
+    Quantize an OpenVINO export to INT8 with NNCF.
+
+    The box decoding operations stay in float, as in the ultralytics INT8 export.
+    """
+    import nncf
+    import openvino as ov
+
+    xml_name = next(x for x in os.listdir(float_path) if x.endswith(".xml"))
+    ov_model = ov.Core().read_model(os.path.join(float_path, xml_name))
+    quantized_model = nncf.quantize(
+        ov_model,
+        nncf.Dataset(calibration_tensors),
+        preset=nncf.QuantizationPreset.MIXED,
+        subset_size=len(calibration_tensors),
+        ignored_scope=nncf.IgnoredScope(types=["Multiply", "Subtract", "Sigmoid"]),
+    )
+    os.makedirs(int8_path, exist_ok=True)
+    ov.save_model(quantized_model, os.path.join(int8_path, xml_name))
+    shutil.copy(os.path.join(float_path, "metadata.yaml"), int8_path)
+
+
+def export_model(
+    weights_path: str,
+    backend: str,
+    int8: bool = False,
+    calibration_images: Optional[List[np.ndarray]] = None,
+) -> str:
+    """
+    Export the weights to a backend, unless the export is cached next to the weights.
+
+    Args:
+        weights_path (str): Path of the .pt weights. ultralytics downloads
+        the weights of its models to this path if they are missing.
+        backend (str): One of BACKENDS.
+        int8 (bool): True to quantize the export to INT8.
+        calibration_images (List[np.ndarray], optional): BGR images to
+        calibrate the INT8 quantization with.
+
+    Returns:
+        str: Path of the exported model.
+    """
+    model_path = get_model_path(weights_path, backend, int8)
+    if backend == "torch" or os.path.exists(model_path):
+        return model_path
+
+    if not int8:
+        YOLO(weights_path).export(format=backend, imgsz=EXPORT_IMAGE_SIZE, dynamic=True)
+        return model_path
+
+    if not calibration_images:
+        raise ValueError("INT8 quantization needs calibration images")
+
+    float_path = export_model(weights_path, backend)
+    calibration_tensors = [preprocess_calibration_image(img) for img in calibration_images]
+    print(f"Quantizing {float_path} to INT8 with {len(calibration_tensors)} calibration images")
+
+    # quantize to a temporary path, so that an interrupted run does not leave a broken cache
+    temp_path = model_path + ".partial"
+    if backend == "onnx":
+        quantize_onnx(float_path, temp_path, calibration_tensors)
+    else:
+        quantize_openvino(float_path, temp_path, calibration_tensors)
+    os.rename(temp_path, model_path)
+    return model_path
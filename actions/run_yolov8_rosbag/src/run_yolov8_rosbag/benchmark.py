@@ -0,0 +1,311 @@
+"""
+Benchmarks YOLOv8 inference on synthetic frames or frames of a rosbag.
+
+--benchmark batch runs each model on the same frames with every batch size
+and compares the time per frame and the detections with those of one image
+per forward pass.
+
+--benchmark backends runs each model with the onnx and openvino backends,
+optionally also INT8 quantized, and compares the speedup over torch with the
+drift of the detections: the recall and precision of the torch detections,
+matched by class and IoU, and the mean IoU of matched boxes.
+
+--benchmark cold_start loads each model with each backend through the
+model registry, and reports whether its weights were preloaded in
+YOLOV8_MODEL_DIR, the load and warmup times, and the time per frame after.
+
+--benchmark workers splits the frames between worker processes for every
+split of the vCPUs into workers and threads per worker, and reports the
+wall time including the start of the workers and the throughput once their
+models are loaded, to choose WORKERS and THREADS_PER_WORKER:
+
+    ./scripts/benchmark.sh --benchmark workers --models yolov8n
+"""
+
+import argparse
+import os
+import time
+
+from concurrent.futures import wait
+
+import numpy as np
+from ultralytics import YOLO
+
+from . import backends, detection, frame_stream, model_registry, worker_pool
+
+
+def make_frames(count, width, height, seed=0):
+    """Smoothed random frames, so that they are not pure noise to the model."""
+    rng = np.random.default_rng(seed)
+    frames = []
+    for _ in range(count):
+        small = rng.integers(0, 256, (height // 16 + 1, width // 16 + 1, 3), dtype=np.uint8)
+        frames.append(np.ascontiguousarray(np.kron(small, np.ones((16, 16, 1), np.uint8))[:height, :width]))
+    return frames
+
+
+def load_rosbag_frames(rosbag_path, count):
+    """BGR frames spread over the image topics of a rosbag."""
+    stream = frame_stream.FrameStream(rosbag_path, "")
+    image_count = sum(stream.topic_dict[topic]["Message Count"] for topic in stream.topics)
+    stream.sample = max(1, image_count // count)
+    frames = []
+    for frame in stream:
+        frames.append(detection.to_bgr(frame.image))
+        if len(frames) == count:
+            break
+    return frames
+
+
+def run_batches(model, frames, batch_size, conf):
+    """
+    Returns:
+        Tuple of the time per frame in milliseconds and the detections of each frame.
+    """
+    detections = []
+    start = time.perf_counter()
+    for i in range(0, len(frames), batch_size):
+        results = detection.detect_batch(model, frames[i : i + batch_size], conf=conf)
+        detections.extend(detection.get_detections(x) for x in results)
+    elapsed = (time.perf_counter() - start) * 1000 / len(frames)
+    return elapsed, detections
+
+
+def max_box_difference(detections, reference):
+    """Largest difference of normalized box coordinates, or None if the detected classes differ."""
+    difference = 0.0
+    for image, reference_image in zip(detections, reference):
+        if [x["class"] for x in image] != [x["class"] for x in reference_image]:
+            return None
+        for x, y in zip(image, reference_image):
+            difference = max(difference, *(abs(x["box"][k] - y["box"][k]) for k in x["box"]))
+    return difference
+
+
+def get_iou(box, other):
+    width = min(box["x2"], other["x2"]) - max(box["x1"], other["x1"])
+    height = min(box["y2"], other["y2"]) - max(box["y1"], other["y1"])
+    if width <= 0 or height <= 0:
+        return 0.0
+    intersection = width * height
+    area = (box["x2"] - box["x1"]) * (box["y2"] - box["y1"])
+    other_area = (other["x2"] - other["x1"]) * (other["y2"] - other["y1"])
+    return intersection / (area + other_area - intersection)
+
+
+def match_detections(detections, reference, iou_threshold=0.5):
+    """
+    Match detections to reference detections of the same class, greedily in order of confidence.
+
+    Returns:
+        Tuple of the number of matched detections and the sum of their IoU.
+    """
+    matched, iou_sum = 0, 0.0
+    for image, reference_image in zip(detections, reference):
+        unmatched = list(reference_image)
+        for x in sorted(image, key=lambda x: -x["confidence"]):
+            candidates = [(get_iou(x["box"], y["box"]), i) for i, y in enumerate(unmatched) if y["class"] == x["class"]]
+            iou, i = max(candidates, default=(0.0, None))
+            if iou >= iou_threshold:
+                matched += 1
+                iou_sum += iou
+                del unmatched[i]
+    return matched, iou_sum
+
+
+def benchmark_backends(models, backend_names, int8, frames, calibration_frames, batch_size, conf):
+    print(
+        f"{'model':<10}{'backend':>16}{'ms/frame':>10}{'speedup':>9}{'detections':>12}"
+        f"{'recall':>8}{'precision':>11}{'mean IoU':>10}"
+    )
+    for model_name in models:
+        weights_path = model_registry.get_weights_path(model_name)
+        model_paths = [("torch", weights_path)]
+        for backend in backend_names:
+            model_paths.append((backend, backends.export_model(weights_path, backend)))
+            if int8:
+                model_paths.append(
+                    (f"{backend}-int8", backends.export_model(weights_path, backend, True, calibration_frames))
+                )
+
+        reference_ms, reference = None, None
+        for name, model_path in model_paths:
+            model = YOLO(model_path)
+            # warm up, the first forward pass initializes the predictor
+            detection.detect_batch(model, frames[:batch_size], conf=conf)
+            elapsed, detections = run_batches(model, frames, batch_size, conf)
+            if reference is None:
+                reference_ms, reference = elapsed, detections
+
+            count = sum(len(x) for x in detections)
+            reference_count = sum(len(x) for x in reference)
+            matched, iou_sum = match_detections(detections, reference)
+            recall = matched / reference_count if reference_count else 1.0
+            precision = matched / count if count else 1.0
+            mean_iou = iou_sum / matched if matched else 0.0
+            print(
+                f"{model_name:<10}{name:>16}{elapsed:>10.1f}{reference_ms / elapsed:>8.2f}x{count:>12}"
+                f"{recall:>8.3f}{precision:>11.3f}{mean_iou:>10.3f}"
+            )
+
+
+def benchmark_cold_start(models, backend_names, int8, frames, calibration_frames, batch_size):
+    print(f"{'model':<12}{'backend':>16}{'preloaded':>11}{'load ms':>10}{'warmup ms':>11}{'ms/frame':>10}")
+    registry = model_registry.ModelRegistry()
+    for model_name in models:
+        weights_path = model_registry.get_weights_path(model_name)
+        preloaded = os.path.exists(weights_path)
+        keys = [(model_name, "torch", False)]
+        for backend in backend_names:
+            keys += [(model_name, backend, x) for x in ([False, True] if int8 else [False])]
+
+        for key in keys:
+            # exports are created beforehand, as in the Action
+            backends.export_model(weights_path, key[1], key[2], calibration_frames)
+            model = registry.get(*key)
+            load_ms, warmup_ms = registry.load_times[key]
+            elapsed, _ = run_batches(model, frames, batch_size, conf=0.25)
+            name = f"{key[1]}-int8" if key[2] else key[1]
+            print(f"{model_name:<12}{name:>16}{str(preloaded):>11}{load_ms:>10.0f}{warmup_ms:>11.0f}{elapsed:>10.1f}")
+            # later backends of a model find the weights
+            preloaded = True
+
+
+def benchmark_batches(models, batch_sizes, frames, conf):
+    print(f"{'model':<10}{'batch':>7}{'ms/frame':>10}{'speedup':>9}{'detections':>12}{'max box diff':>14}")
+    for model_name in models:
+        model = YOLO(model_registry.get_weights_path(model_name))
+        # warm up, the first forward pass initializes the predictor
+        detection.detect_batch(model, frames[:1])
+
+        reference_ms, reference = run_batches(model, frames, 1, conf)
+        for batch_size in batch_sizes:
+            if batch_size == 1:
+                elapsed, detections = reference_ms, reference
+            else:
+                elapsed, detections = run_batches(model, frames, batch_size, conf)
+            difference = max_box_difference(detections, reference)
+            difference = "classes differ" if difference is None else f"{difference:.2e}"
+            print(
+                f"{model_name:<10}{batch_size:>7}{elapsed:>10.1f}{reference_ms / elapsed:>8.2f}x"
+                f"{sum(len(x) for x in detections):>12}{difference:>14}"
+            )
+
+
+def detect_chunk(model_name, frames, batch_size, conf):
+    """Worker task of the workers benchmark. Returns the detection time of the frames in milliseconds."""
+    model = model_registry.get_model(model_name)
+    elapsed, _ = run_batches(model, frames, batch_size, conf)
+    return elapsed * len(frames)
+
+
+def get_splits(cpu_count):
+    """Splits of the vCPUs into workers and threads per worker that use all of them, or as many as possible."""
+    splits = []
+    for threads in range(cpu_count, 0, -1):
+        workers = cpu_count // threads
+        if not splits or workers != splits[-1][0]:
+            splits.append((workers, threads))
+    return splits
+
+
+def benchmark_workers(models, splits, frames, batch_size, conf):
+    # the benchmark forks workers, so it must not run torch with several threads itself
+    worker_pool.set_thread_budget(1)
+    print(f"{'model':<10}{'workers':>9}{'threads':>9}{'wall s':>9}{'frames/s':>10}{'speedup':>9}")
+    for model_name in models:
+        reference = None
+        best = None
+        for workers, threads in splits:
+            chunks = [frames[i::workers] for i in range(workers)]
+            start = time.perf_counter()
+            # a new pool per split, so that every worker loads its model with its thread budget
+            with worker_pool.get_executor(workers, threads) as executor:
+                futures = [executor.submit(detect_chunk, model_name, x, batch_size, conf) for x in chunks]
+                wait(futures)
+            wall = time.perf_counter() - start
+            # all workers detect at the same time, so the slowest one sets the throughput
+            throughput = len(frames) * 1000 / max(x.result() for x in futures)
+            reference = reference or throughput
+            if best is None or throughput > best[2]:
+                best = (workers, threads, throughput)
+            print(
+                f"{model_name:<10}{workers:>9}{threads:>9}{wall:>9.1f}{throughput:>10.1f}{throughput / reference:>8.2f}x"
+            )
+        print(f"Best split for {model_name}: {best[0]} workers of {best[1]} threads")
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--benchmark", type=str, default="batch", choices=["batch", "backends", "cold_start", "workers"], help="Benchmark to run")
+parser.add_argument("--models", type=str, default="yolov8n,yolov8s", help="Comma-separated model names")
+parser.add_argument("--batch_sizes", type=str, default="1,2,4,8,16", help="Comma-separated batch sizes")
+parser.add_argument("--frames", type=int, default=64, help="Frames per model and batch size")
+parser.add_argument("--resolution", type=str, default="1280x720", help="Frame resolution as WIDTHxHEIGHT")
+parser.add_argument("--conf", type=float, default=0.25, help="Confidence threshold of the detections")
+parser.add_argument(
+    "--backends", type=str, default="onnx,openvino", help="Comma-separated backends to compare with torch"
+)
+parser.add_argument(
+    "--splits",
+    type=str,
+    default=None,
+    help="Comma-separated WORKERSxTHREADS splits of the workers benchmark, such as 1x4,2x2,4x1. "
+    "By default, every split of the allotted vCPUs",
+)
+parser.add_argument("--int8", action="store_true", help="Also compare the INT8 quantized backends")
+parser.add_argument("--batch_size", type=int, default=4, help="Batch size of the backends, cold_start and workers benchmarks")
+parser.add_argument(
+    "--calibration_size", type=int, default=32, help="Frames to calibrate the INT8 quantization with"
+)
+parser.add_argument(
+    "--rosbag",
+    type=str,
+    default=None,
+    help="Rosbag to take frames from instead of synthetic frames, calibrating with other frames than the benchmarked ones",
+)
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    models = args.models.split(",")
+    resolution = tuple(int(x) for x in args.resolution.split("x"))
+    if args.rosbag:
+        rosbag_frames = load_rosbag_frames(args.rosbag, args.frames + args.calibration_size)
+        frames = rosbag_frames[: args.frames]
+        calibration_frames = rosbag_frames[args.frames :] or frames
+    else:
+        frames = make_frames(args.frames, *resolution)
+        calibration_frames = make_frames(args.calibration_size, *resolution, seed=1)
+
+    if args.benchmark == "workers":
+        if args.splits:
+            splits = [tuple(int(y) for y in x.split("x")) for x in args.splits.split(",")]
+        else:
+            splits = get_splits(worker_pool.get_cpu_count())
+        benchmark_workers(models, splits, frames, args.batch_size, args.conf)
+    elif args.benchmark == "cold_start":
+        benchmark_cold_start(
+            models,
+            [x for x in args.backends.split(",") if x],
+            args.int8,
+            frames,
+            calibration_frames,
+            args.batch_size,
+        )
+    elif args.benchmark == "backends":
+        benchmark_backends(
+            models,
+            args.backends.split(","),
+            args.int8,
+            frames,
+            calibration_frames,
+            args.batch_size,
+            args.conf,
+        )
+    else:
+        benchmark_batches(
+            models,
+            [int(x) for x in args.batch_sizes.split(",")],
+            frames,
+            args.conf,
+        )
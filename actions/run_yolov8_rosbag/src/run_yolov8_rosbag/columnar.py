@@ -0,0 +1,187 @@
+"""
+Columnar output of the detections of a topic.
+
+detections.parquet or detections.npz next to detections.json hold one row
+per detection, in the order of the images of the topic, with the columns of
+COLUMNS. Boxes are normalized like in detections.json, and the masks of
+segmentation models stay in detections.json, referenced by mask_index.
+
+Readers load only the columns they need. Parquet files are written in row
+groups with min/max statistics, so that filters on timestamp skip the row
+groups outside the time range. Parquet needs pyarrow, NPZ only numpy.
+"""
+
+import os
+
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+COLUMNAR_FORMATS = ["parquet", "npz"]
+
+# column name and numpy dtype
+COLUMNS = {
+    # index of the image message in its topic
+    "frame_index": np.int64,
+    # rosbag timestamp of the image in nanoseconds
+    "timestamp": np.int64,
+    "image_name": np.str_,
+    "class_id": np.int32,
+    "class_name": np.str_,
+    "confidence": np.float32,
+    "x1": np.float32,
+    "y1": np.float32,
+    "x2": np.float32,
+    "y2": np.float32,
+    # index of the detection in the list of its image in detections.json, where its segments are, or -1
+    "mask_index": np.int32,
+    # True for detections carried forward by the motion gate
+    "propagated": np.bool_,
+}
+
+# rows per Parquet row group, the unit that timestamp filters skip
+ROW_GROUP_SIZE = 16384
+
+
+class DetectionTable:
+    """
+    Collects the detections of the images of a topic into columns.
+
+    Usage:
+        table = DetectionTable()
+        table.add_image(image_name, manifest_entry, image_detections)
+        table.write(os.path.join(topic_path, "imgs"), "parquet")
+        counts = table.count_classes()
+    """
+
+    def __init__(self):
+        self.rows: Dict[str, List[Any]] = {name: [] for name in COLUMNS}
+
+    def add_image(
+        self, image_name: str, manifest_entry: Dict[str, Any], image_detections: List[Dict[str, Any]]
+    ) -> None:
+        """
+        Add the detections of one image.
+
+        Args:
+            image_name (str): Name of the image in detections.json.
+            manifest_entry (Dict[str, Any]): Entry of the image in the image manifest.
+            image_detections (List[Dict[str, Any]]): Detections of the image as stored in detections.json.
+        """
+        count = len(image_detections)
+        self.rows["frame_index"] += [manifest_entry["msg_index"]] * count
+        self.rows["timestamp"] += [manifest_entry["rosbag_timestamp"]] * count
+        self.rows["image_name"] += [image_name] * count
+        for i, x in enumerate(image_detections):
+            self.rows["class_id"].append(x["class"])
+            self.rows["class_name"].append(x["name"])
+            self.rows["confidence"].append(x["confidence"])
+            for key in ("x1", "y1", "x2", "y2"):
+                self.rows[key].append(x["box"][key])
+            self.rows["mask_index"].append(i if "segments" in x else -1)
+            self.rows["propagated"].append(x.get("propagated", False))
+
+    def get_columns(self) -> Dict[str, np.ndarray]:
+        """Get the columns as numpy arrays."""
+        return {name: np.array(self.rows[name], dtype=dtype) for name, dtype in COLUMNS.items()}
+
+    def count_classes(self) -> Dict[str, int]:
+        """Get the number of detections of each class, as count_detections does."""
+        return count_classes(np.array(self.rows["class_id"], dtype=np.int32), self.rows["class_name"])
+
+    def write(self, output_folder: str, file_format: str) -> str:
+        """
+        Write the columns to detections.parquet or detections.npz.
+
+        Args:
+            output_folder (str): Folder of detections.json.
+            file_format (str): One of COLUMNAR_FORMATS.
+
+        Returns:
+            str: Path of the written file.
+        """
+        path = os.path.join(output_folder, f"detections.{file_format}")
+        columns = self.get_columns()
+        if file_format == "parquet":
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.table({name: pa.array(values) for name, values in columns.items()})
+            pq.write_table(table, path, row_group_size=ROW_GROUP_SIZE, compression="zstd")
+        elif file_format == "npz":
+            np.savez_compressed(path, **columns)
+        else:
+            raise ValueError(
+                f"Invalid columnar format '{file_format}'. Allowed values are {', '.join(COLUMNAR_FORMATS)}"
+            )
+        return path
+
+
+def count_classes(class_ids: np.ndarray, class_names: np.ndarray) -> Dict[str, int]:
+    """
+    Count the detections of each class.
+
+    Classes are counted by id, which is much faster than sorting the names,
+    and named after their first detection.
+
+    Args:
+        class_ids (np.ndarray): class_id column.
+        class_names (np.ndarray): class_name column.
+
+    Returns:
+        Dict[str, int]: Number of detections of each class name.
+    """
+    _, first, counts = np.unique(class_ids, return_index=True, return_counts=True)
+    return {str(class_names[i]): int(count) for i, count in zip(first, counts)}
+
+
+def read_detections(
+    path: str,
+    columns: Optional[List[str]] = None,
+    start_time: Optional[int] = None,
+    end_time: Optional[int] = None,
+    classes: Optional[List[str]] = None,
+) -> Dict[str, np.ndarray]:
+    """
+    Read detections from detections.parquet or detections.npz, optionally filtered.
+
+    Only the requested columns, and the columns filtered on, are read.
+
+    Args:
+        path (str): Path of the file.
+        columns (List[str], optional): Columns to read, or None for all of them.
+        start_time (int, optional): Minimum rosbag timestamp in nanoseconds, or None for no minimum.
+        end_time (int, optional): Maximum rosbag timestamp in nanoseconds, or None for no maximum.
+        classes (List[str], optional): Class names to keep, or None for all classes.
+
+    Returns:
+        Dict[str, np.ndarray]: Filtered columns.
+    """
+    columns = list(columns or COLUMNS)
+
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        filters = []
+        if start_time is not None:
+            filters.append(("timestamp", ">=", start_time))
+        if end_time is not None:
+            filters.append(("timestamp", "<=", end_time))
+        if classes is not None:
+            filters.append(("class_name", "in", classes))
+        table = pq.read_table(path, columns=columns, filters=filters or None)
+        return {name: table.column(name).to_numpy() for name in columns}
+
+    with np.load(path) as npz:
+        mask = None
+        if start_time is not None or end_time is not None:
+            timestamps = npz["timestamp"]
+            mask = np.ones(len(timestamps), dtype=bool)
+            if start_time is not None:
+                mask &= timestamps >= start_time
+            if end_time is not None:
+                mask &= timestamps <= end_time
+        if classes is not None:
+            class_mask = np.isin(npz["class_name"], classes)
+            mask = class_mask if mask is None else mask & class_mask
+        return {name: npz[name] if mask is None else npz[name][mask] for name in columns}
@@ -0,0 +1,50 @@
+"""
+YOLOv8 inference on batches of images.
+
+All images of a batch go through one forward pass of the model, which
+keeps the CPU busier than one forward pass per image. Results are split
+back into the per-image detections of detections.json.
+"""
+
+import json
+from typing import Any, Dict, List
+
+import cv2
+import numpy as np
+
+
+def to_bgr(img: np.ndarray) -> np.ndarray:
+    """Convert grayscale images to the 3-channel images the model expects."""
+    if len(img.shape) == 2:
+        return cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    return img
+
+
+def detect_batch(model, images: List[np.ndarray], **kwargs) -> list:
+    """
+    Run the model on a batch of images in one forward pass.
+
+    Args:
+        model: Loaded ultralytics YOLO model.
+        images (List[np.ndarray]): BGR images.
+        **kwargs: Prediction arguments of ultralytics, such as conf.
+
+    Returns:
+        list: ultralytics Results of each image, in the order of images.
+    """
+    if not images:
+        return []
+    return model(images, verbose=False, **kwargs)
+
+
+def get_detections(result) -> List[Dict[str, Any]]:
+    """
+    Get the detections of one image as stored in detections.json.
+
+    Args:
+        result: ultralytics Results of the image.
+
+    Returns:
+        List[Dict[str, Any]]: Detections with normalized coordinates.
+    """
+    return json.loads(result.tojson(normalize=True))
@@ -0,0 +1,206 @@
+"""
+Streaming of decoded rosbag images to the detector.
+
+A reader thread selects and decodes the image messages of a rosbag with the
+image extraction of get_images_from_rosbag, so that sampled-out messages are
+never read, and passes them to the detector through a bounded queue instead
+of writing every image to disk and reading it back. Decoding runs ahead of
+detection by at most the size of the queue, which bounds the memory used for
+frames.
+"""
+
+import logging
+import os
+import queue
+import threading
+
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import cv2
+import numpy as np
+from rosbags.rosbag1 import Reader
+
+from robologs_ros_utils.sources.ros1 import ros_utils
+from robologs_ros_utils.utils import img_utils
+
+from get_images_from_rosbag.image_extraction import (
+    decode_message,
+    get_image_name,
+    read_selected_messages,
+    select_topic_messages,
+)
+
+# seconds between checks whether the consumer stopped, while the queue is full
+PUT_TIMEOUT = 0.1
+
+
+class Frame(NamedTuple):
+    topic: str
+    image_name: str
+    manifest_entry: Dict[str, Any]
+    image: np.ndarray
+
+
+class ReaderError(NamedTuple):
+    error: BaseException
+
+
+def to_stored_image(cv_image: np.ndarray, file_format: str) -> np.ndarray:
+    """
+    Convert an image array to what cv2.imread(path, -1) returns after cv2.imwrite(path, cv_image).
+
+    JPEG stores 8-bit grayscale or BGR images, so other depths are saturated
+    to 8 bit and alpha is dropped, as cv2.imwrite does. PNG keeps them. Lossy
+    JPEG compression itself is not applied.
+
+    Args:
+        cv_image (np.ndarray): Decoded image array.
+        file_format (str): Image format of the extracted images, 'jpg' or 'png'.
+
+    Returns:
+        np.ndarray: Image array.
+    """
+    if cv_image.ndim == 3 and cv_image.shape[2] == 1:
+        cv_image = cv_image[:, :, 0]
+    if file_format == "png":
+        return cv_image
+
+    if cv_image.dtype != np.uint8:
+        cv_image = np.clip(np.rint(cv_image), 0, 255).astype(np.uint8)
+    if cv_image.ndim == 3 and cv_image.shape[2] == 4:
+        cv_image = cv2.cvtColor(cv_image, cv2.COLOR_BGRA2BGR)
+    return cv_image
+
+
+class FrameStream:
+    """
+    Decodes the images of a rosbag in a reader thread.
+
+    Iterating yields the frames of the selected topics in rosbag order, with
+    their image name and manifest entry as ros_utils.get_images_from_bag
+    would create them in output_folder, and raises errors of the reader
+    thread. At most queue_size decoded frames wait for the consumer.
+
+    Usage:
+        stream = FrameStream(rosbag_path, bag_output_folder, topics=["/camera/image_raw"])
+        for frame in stream:
+            ...
+    """
+
+    def __init__(
+        self,
+        rosbag_path: str,
+        output_folder: str,
+        file_format: str = "jpg",
+        topics: Optional[List[str]] = None,
+        naming: str = "sequential",
+        resize: Optional[Tuple[int, int]] = None,
+        sample: Optional[int] = None,
+        start_time: Optional[float] = None,
+        end_time: Optional[float] = None,
+        queue_size: int = 32,
+    ):
+        self.rosbag_path = rosbag_path
+        self.output_folder = output_folder
+        self.file_format = file_format
+        self.naming = naming
+        self.resize = resize
+        self.sample = sample
+        self.start_time = start_time
+        self.end_time = end_time
+
+        self.rosbag_metadata_dict = ros_utils.get_bag_info_from_file(rosbag_path=rosbag_path)
+        self.topic_dict = ros_utils.get_topic_dict(rosbag_metadata_dict=self.rosbag_metadata_dict)
+        self.topics: List[str] = []
+        if self.rosbag_metadata_dict:
+            if not topics:
+                topics = ros_utils.get_topic_names_of_type(
+                    all_topics=self.rosbag_metadata_dict["topics"],
+                    filter_topic_types=ros_utils.get_image_topic_types(),
+                )
+            for topic in topics:
+                if topic not in self.topic_dict.keys():
+                    logging.warning(f"{topic} not in rosbag, skipping.")
+                    continue
+                self.topics.append(topic)
+
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.read, daemon=True)
+
+    def __iter__(self) -> Iterator[Frame]:
+        if not self.topics:
+            logging.warning(f"No image topics to extract in {self.rosbag_path}.")
+            return
+
+        self.thread.start()
+        try:
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    return
+                if isinstance(item, ReaderError):
+                    raise item.error
+                yield item
+        finally:
+            self.stop()
+
+    def stop(self) -> None:
+        """Stop the reader thread, also if it waits for space in the queue."""
+        self.stopped.set()
+        if self.thread.is_alive():
+            self.thread.join()
+
+    def put(self, item) -> bool:
+        """Queue an item for the consumer. Returns False if the consumer stopped."""
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=PUT_TIMEOUT)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def read(self) -> None:
+        try:
+            self.read_frames()
+        except Exception as e:
+            self.put(ReaderError(e))
+        else:
+            self.put(None)
+
+    def read_frames(self) -> None:
+        with Reader(self.rosbag_path) as reader:
+            msgtypes, selection = select_topic_messages(
+                reader,
+                self.topics,
+                self.rosbag_metadata_dict["start_time"],
+                self.start_time,
+                self.end_time,
+                self.sample,
+            )
+
+            for topic, index, t, rawdata in read_selected_messages(reader, selection):
+                sec, nanosec, cv_image = decode_message(rawdata, msgtypes[topic])
+                # same (unpadded) concatenation as ros_utils, so that image names stay the same
+                msg_timestamp = int(str(sec) + str(nanosec))
+
+                topic_name_underscore = ros_utils.replace_ros_topic_name(topic)
+                image_name = get_image_name(topic_name_underscore, self.naming, self.file_format, index, t, msg_timestamp)
+
+                if self.resize:
+                    cv_image = img_utils.resize_image(img=cv_image, new_width=self.resize[0], new_height=self.resize[1])
+
+                frame = Frame(
+                    topic=topic,
+                    image_name=image_name,
+                    manifest_entry=ros_utils.create_manifest_entry_dict(
+                        msg_timestamp=msg_timestamp,
+                        rosbag_timestamp=t,
+                        file_path=os.path.join(self.output_folder, topic_name_underscore, image_name),
+                        index=index,
+                    ),
+                    image=to_stored_image(cv_image, self.file_format),
+                )
+                if not self.put(frame):
+                    return
@@ -0,0 +1,94 @@
+"""
+Registry of loaded YOLOv8 models.
+
+Models are keyed by model name, backend and INT8, loaded on their first use
+with one warmup inference, and reused afterwards. The weights are read from
+the folder in YOLOV8_MODEL_DIR, into which the Action image preloads the
+weights of ALLOWED_MODELS, so that containers do not download them at
+startup. Exports of the backends are cached in the same folder.
+"""
+
+import os
+import time
+
+from typing import Dict, Tuple
+
+import numpy as np
+from ultralytics import YOLO
+
+from . import backends, detection
+
+ALLOWED_MODELS = [
+    "yolov8n",
+    "yolov8s",
+    "yolov8m",
+    "yolov8l",
+    "yolov8x",
+    "yolov8n-seg",
+    "yolov8s-seg",
+    "yolov8m-seg",
+    "yolov8l-seg",
+    "yolov8x-seg",
+]
+
+# folder of the .pt weights, the current folder if not set
+MODEL_DIR = os.environ.get("YOLOV8_MODEL_DIR", "")
+
+
+def get_weights_path(model_name: str) -> str:
+    """Path of the .pt weights of a model. ultralytics downloads missing weights of its models to this path."""
+    return os.path.join(MODEL_DIR, f"{model_name}.pt")
+
+
+class ModelRegistry:
+    """
+    Loaded models keyed by model name, backend and INT8.
+
+    The load and warmup times of every model are kept in load_times, in milliseconds.
+
+    Usage:
+        registry = ModelRegistry()
+        model = registry.get("yolov8n", backend="openvino")
+    """
+
+    def __init__(self):
+        self.models: Dict[Tuple[str, str, bool], YOLO] = dict()
+        self.load_times: Dict[Tuple[str, str, bool], Tuple[float, float]] = dict()
+
+    def get(self, model_name: str, backend: str = "torch", int8: bool = False) -> YOLO:
+        """
+        Get a model, loading it on first use.
+
+        Args:
+            model_name (str): One of ALLOWED_MODELS.
+            backend (str): One of backends.BACKENDS. The model must have been exported to it.
+            int8 (bool): True for the INT8 quantized export.
+
+        Returns:
+            YOLO: Loaded and warmed up model.
+        """
+        key = (model_name, backend, int8)
+        if key not in self.models:
+            start = time.perf_counter()
+            model = YOLO(backends.get_model_path(get_weights_path(model_name), backend, int8))
+            loaded = time.perf_counter()
+            # the first inference sets up the predictor and, for exported models, the runtime
+            size = backends.EXPORT_IMAGE_SIZE
+            detection.detect_batch(model, [np.zeros((size, size, 3), np.uint8)])
+            warm = time.perf_counter()
+
+            self.models[key] = model
+            self.load_times[key] = ((loaded - start) * 1000, (warm - loaded) * 1000)
+            print(
+                f"Loaded {model_name} ({backend}{', int8' if int8 else ''}) in {int(self.load_times[key][0])} ms, "
+                f"warmup took {int(self.load_times[key][1])} ms"
+            )
+        return self.models[key]
+
+
+registry = ModelRegistry()
+
+
+def get_model(model_name: str, backend: str = "torch", int8: bool = False) -> YOLO:
+    """Get a model from the registry of this process."""
+    return registry.get(model_name, backend, int8)
@@ -0,0 +1,86 @@
+"""
+Motion gating of the detector.
+
+Consecutive camera frames are often nearly identical. A MotionGate compares
+a small grayscale thumbnail of each frame of a topic, as made by the
+near-duplicate filter of get_images_from_rosbag, with the thumbnail of
+the last frame that was detected, and only lets frames through to the
+detector when the scene changed by more than a threshold, or when a maximum
+number of frames was skipped in a row. Skipped frames carry forward the
+detections of the last detected frame.
+"""
+
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from get_images_from_rosbag.image_extraction import get_thumbnail
+
+
+class MotionGate:
+    """
+    Decides which frames of one topic to run the detector on.
+
+    The gate also keeps the ultralytics Results and detections of the last
+    detected frame, which skipped frames carry forward.
+
+    Usage:
+        gate = MotionGate(threshold=2.0, max_frame_gap=30)
+        if gate.should_detect(img):
+            ...
+    """
+
+    def __init__(self, threshold: float, max_frame_gap: int = 30):
+        """
+        Args:
+            threshold (float): Minimum mean absolute difference to the thumbnail of the
+            last detected frame, in gray levels from 0 to 255, to run the detector again.
+            max_frame_gap (int): Maximum number of frames in a row that are not detected.
+        """
+        self.threshold = threshold
+        self.max_frame_gap = max_frame_gap
+        self.reference: Optional[np.ndarray] = None
+        self.gap = 0
+        self.last_result = None
+        self.last_detections: List[Dict[str, Any]] = []
+        self.detected_count = 0
+        self.propagated_count = 0
+
+    def should_detect(self, img: np.ndarray) -> bool:
+        """
+        Check whether to run the detector on the next frame of the topic.
+
+        Args:
+            img (np.ndarray): The frame.
+
+        Returns:
+            bool: True to run the detector, False to carry forward the detections of the last detected frame.
+        """
+        thumbnail = get_thumbnail(img)
+        # comparing against the last detected frame rather than the previous one means slow drift is detected
+        if (
+            self.reference is not None
+            and self.gap < self.max_frame_gap
+            and float(np.mean(np.abs(thumbnail - self.reference))) < self.threshold
+        ):
+            self.gap += 1
+            self.propagated_count += 1
+            return False
+
+        self.reference = thumbnail
+        self.gap = 0
+        self.detected_count += 1
+        return True
+
+    def get_propagated_detections(self) -> List[Dict[str, Any]]:
+        """Get the detections of the last detected frame, each marked as propagated."""
+        return [dict(x, propagated=True) for x in self.last_detections]
+
+    def get_metadata(self) -> Dict[str, Any]:
+        """Get the settings and frame counts of the gate for the metadata of detections.json."""
+        return {
+            "threshold": self.threshold,
+            "max_frame_gap": self.max_frame_gap,
+            "detected_images": self.detected_count,
+            "propagated_images": self.propagated_count,
+        }
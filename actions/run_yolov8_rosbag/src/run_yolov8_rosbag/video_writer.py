@@ -0,0 +1,123 @@
+"""
+Annotated video output without staging images on disk.
+
+Frames with drawn detections are piped into one ffmpeg/libx264 process per
+topic as they are produced. Writes block while ffmpeg is busy, so at most a
+pipe buffer of frames waits for the encoder.
+"""
+
+import subprocess
+
+from typing import Iterable, Optional, Tuple
+
+import cv2
+import numpy as np
+
+VIDEO_NAME = "video.mp4"
+
+
+class FfmpegVideoWriter:
+    """
+    Encodes raw frames to an H.264 video with an ffmpeg process reading from a pipe.
+
+    The frame size and pixel format are fixed by the first frame. Later frames
+    of a different size are resized to it.
+    """
+
+    def __init__(self, path: str, frame_rate: float):
+        self.path = path
+        self.frame_rate = frame_rate
+        self.size: Optional[Tuple[int, int]] = None
+        self.process: Optional[subprocess.Popen] = None
+        self.frame_count = 0
+
+    def start(self, width: int, height: int, pix_fmt: str) -> None:
+        self.size = (width, height)
+        self.process = subprocess.Popen(
+            [
+                "ffmpeg",
+                "-hide_banner",
+                "-loglevel",
+                "error",
+                "-f",
+                "rawvideo",
+                "-pix_fmt",
+                pix_fmt,
+                "-s",
+                f"{width}x{height}",
+                "-r",
+                str(self.frame_rate),
+                "-i",
+                "-",
+                "-vcodec",
+                "libx264",
+                # yuv420p needs even dimensions
+                "-vf",
+                "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+                "-pix_fmt",
+                "yuv420p",
+                "-y",
+                self.path,
+            ],
+            stdin=subprocess.PIPE,
+        )
+
+    def write(self, frame: np.ndarray) -> None:
+        """
+        Send one frame to the encoder.
+
+        Args:
+            frame (np.ndarray): 8-bit grayscale or BGR frame.
+        """
+        if self.process is None:
+            height, width = frame.shape[:2]
+            self.start(width, height, "gray" if frame.ndim == 2 else "bgr24")
+        elif (frame.shape[1], frame.shape[0]) != self.size:
+            frame = cv2.resize(frame, self.size)
+
+        try:
+            self.process.stdin.write(np.ascontiguousarray(frame).data)
+        except BrokenPipeError:
+            self.close()
+            raise RuntimeError(f"ffmpeg stopped reading frames for {self.path}")
+        self.frame_count += 1
+
+    def close(self) -> None:
+        """
+        Wait for the encoder to finish the video.
+
+        Raises:
+            RuntimeError: If ffmpeg failed.
+        """
+        if self.process is None:
+            return
+        process, self.process = self.process, None
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+        if process.wait() != 0:
+            raise RuntimeError(f"ffmpeg failed with exit code {process.returncode} while writing {self.path}")
+
+
+def close_writers(writers: Iterable[Optional[FfmpegVideoWriter]], suppress_errors: bool = False) -> None:
+    """
+    Close every writer, also when closing an earlier one fails.
+
+    Args:
+        writers (Iterable[FfmpegVideoWriter]): Writers to close, None entries are skipped.
+        suppress_errors (bool, optional): True to ignore ffmpeg failures, while another error is raised.
+
+    Raises:
+        RuntimeError: The first ffmpeg failure, unless suppress_errors is set.
+    """
+    error = None
+    for writer in writers:
+        if writer is None:
+            continue
+        try:
+            writer.close()
+        except RuntimeError as e:
+            error = error or e
+    if error and not suppress_errors:
+        raise error
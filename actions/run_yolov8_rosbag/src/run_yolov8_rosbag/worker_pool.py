@@ -0,0 +1,115 @@
+"""
+Worker processes for detection on several topics in parallel.
+
+Every worker gets an explicit thread budget for torch and OpenCV, so that
+the threads of all workers do not exceed the vCPUs allotted to the Action.
+Workers are forked and load their own models through model_registry.
+
+OpenMP, which runs the intra-op threads of torch, hangs in forked workers
+if the parent process already ran torch with several threads. The parent
+of a pool therefore keeps a budget of one thread.
+"""
+
+import multiprocessing
+import traceback
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Callable, Dict
+
+import cv2
+import torch
+
+from get_images_from_rosbag.cpu_limits import get_cpu_count
+
+
+def get_thread_budget(workers: int, threads: int = 0) -> int:
+    """
+    Get the number of threads of each worker.
+
+    Args:
+        workers (int): Number of worker processes.
+        threads (int): Threads per worker, or 0 to split the allotted CPUs between the workers.
+
+    Returns:
+        int: Threads per worker.
+
+    Raises:
+        ValueError: If the threads of all workers exceed the allotted CPUs.
+    """
+    cpu_count = get_cpu_count()
+    threads = threads or max(1, cpu_count // workers)
+    if workers * threads > cpu_count:
+        raise ValueError(
+            f"{workers} workers with {threads} threads each exceed the {cpu_count} vCPUs allotted to the Action"
+        )
+    return threads
+
+
+def set_thread_budget(threads: int) -> None:
+    """Limit the intra-op threads of torch and the threads of OpenCV in this process."""
+    torch.set_num_threads(threads)
+    cv2.setNumThreads(threads)
+
+
+def get_executor(workers: int, threads: int) -> ProcessPoolExecutor:
+    """
+    Get a pool of forked worker processes with a thread budget each.
+
+    The process calling this must not have run torch with more than one thread.
+
+    Args:
+        workers (int): Number of worker processes.
+        threads (int): Threads per worker.
+
+    Returns:
+        ProcessPoolExecutor: The pool, to use as a context manager.
+    """
+    # fork, so that workers do not re-run the argument parsing of the Action
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("fork"),
+        initializer=set_thread_budget,
+        initargs=(threads,),
+    )
+
+
+def run_tasks(
+    function: Callable[..., Any], tasks: Dict[str, Dict[str, Any]], workers: int, threads: int
+) -> Dict[str, Any]:
+    """
+    Call a function with the keyword arguments of every task, with up to workers tasks in parallel.
+
+    With one worker, tasks run in this process. A failing task does not stop
+    the others, and its traceback is printed.
+
+    Args:
+        function (Callable[..., Any]): Module-level function to call.
+        tasks (Dict[str, Dict[str, Any]]): Keyword arguments of each task, by task name.
+        workers (int): Maximum number of worker processes.
+        threads (int): Threads per worker.
+
+    Returns:
+        Dict[str, Any]: Results of the tasks that succeeded, by task name.
+    """
+    results = {}
+    workers = min(workers, len(tasks))
+
+    if workers <= 1:
+        for name, kwargs in tasks.items():
+            try:
+                results[name] = function(**kwargs)
+            except Exception:
+                print(f"Failed to process {name}:\n{traceback.format_exc()}")
+
+    else:
+        print(f"Processing {len(tasks)} tasks with {workers} workers of {threads} threads")
+        with get_executor(workers, threads) as executor:
+            futures = {executor.submit(function, **kwargs): name for name, kwargs in tasks.items()}
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    results[name] = future.result()
+                except Exception:
+                    print(f"Failed to process {name}:\n{traceback.format_exc()}")
+
+    return results